@@ -0,0 +1,74 @@
+""" Mapper throughput of identityMapper against the NumPy batch mapper.
+
+Usage: python benchmarks/batch_mapper_benchmark.py
+       test_zipfian_100000_1.0.txt [more zipf_dataset_generator.py datasets]
+
+Runs both mappers with the bundled plan over each dataset, for string and
+cell keys, and reports input lines/sec and emitted keys/sec. The emitted
+pairs are consumed without being stored, as the local runner's output
+protocol would.
+"""
+import os
+import sys
+import time
+from collections import deque
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+
+keyFormats = [('string', []),
+              ('cell', ['--key-format', 'cell', '--reduce-number', '64'])]
+
+
+def makeJob(extra):
+    job = SharesSkewJob([
+        '--schemaFile', os.path.join(root, 'schema.p'),
+        '--residualsFile', os.path.join(root, 'residualjoins.p'),
+        '--sharesFile', os.path.join(root, 'shares.p'),
+        '--hhFile', os.path.join(root, 'heavyhitters.p')] + extra)
+    job.sandbox()
+    job.mapper_init()
+    return job
+
+
+def scalar(job, lines):
+    keys = 0
+    for line in lines:
+        for _ in job.identityMapper(None, line):
+            keys += 1
+    return keys
+
+
+def batch(job, lines):
+    consume = deque(maxlen=0).extend
+    for line in lines:
+        consume(job.batchMapper(None, line))
+    consume(job.batchMapper_final())
+    return None
+
+
+def main():
+    print '%30s %8s %8s %16s %16s' % ('dataset', 'keys', 'mapper',
+                                      'lines/s', 'keys/s')
+    for dataset in sys.argv[1:]:
+        lines = [line.rstrip('\n') for line in open(dataset)]
+        for keyFormat, extra in keyFormats:
+            job = makeJob(extra)
+            start = time.time()
+            keys = scalar(job, lines)
+            elapsed = time.time() - start
+            rates = [('scalar', elapsed)]
+            job = makeJob(extra + ['--batch-size', '65536'])
+            start = time.time()
+            batch(job, lines)
+            rates.append(('batch', time.time() - start))
+            for name, elapsed in rates:
+                print '%30s %8s %8s %16.0f %16.0f' % (
+                    os.path.basename(dataset), keyFormat, name,
+                    len(lines) / elapsed, keys / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+""" Mapper start-up and throughput of text input against --binary-input.
+
+Usage: python benchmarks/binary_input_benchmark.py
+       test_zipfian_100000_1.0.txt [more zipf_dataset_generator.py datasets]
+
+Converts each dataset into column files once, then runs the line mapper
+and the batch mapper over the text lines, and the binary mapper over the
+manifest, for raw and packed values. Start-up is mapper_init plus reading
+the text lines or mapping the column files. Throughput is input tuples
+routed per second, the emitted pairs being consumed without being stored.
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+from skew.binaryInput import columnFile, convertText, manifestLines  # noqa
+
+formats = [('raw', ['--internal-format', 'raw']),
+           ('packed', ['--internal-format', 'packed'])]
+
+
+def makeJob(extra):
+    job = SharesSkewJob([
+        '--schemaFile', os.path.join(root, 'schema.p'),
+        '--residualsFile', os.path.join(root, 'residualjoins.p'),
+        '--sharesFile', os.path.join(root, 'shares.p'),
+        '--hhFile', os.path.join(root, 'heavyhitters.p')] + extra)
+    job.sandbox()
+    job.mapper_init()
+    return job
+
+
+def textInput(dataset, extra):
+    job = makeJob(extra)
+    with open(dataset) as f:
+        lines = [line.rstrip('\n') for line in f if line.strip()]
+    return job, lines
+
+
+def main():
+    with open(os.path.join(root, 'schema.p'), 'rb') as f:
+        schema = pickle.load(f)
+    print '%30s %8s %8s %12s %14s' % ('dataset', 'values', 'mapper',
+                                      'start-up s', 'tuples/s')
+    for dataset in sys.argv[1:]:
+        directory = tempfile.mkdtemp()
+        try:
+            start = time.time()
+            with open(dataset) as f:
+                filenames = convertText(f, directory, schema)
+            manifest = manifestLines(
+                [filenames[relation] for relation in sorted(filenames)],
+                1000000)
+            print '%30s converted in %.2fs' % (os.path.basename(dataset),
+                                               time.time() - start)
+            for name, extra in formats:
+                consume = deque(maxlen=0).extend
+                start = time.time()
+                job, lines = textInput(dataset, extra)
+                startup = time.time() - start
+                start = time.time()
+                for line in lines:
+                    consume(job.identityMapper(None, line))
+                rates = [('line', startup, time.time() - start)]
+
+                start = time.time()
+                job, lines = textInput(dataset, extra + ['--batch-size',
+                                                         '65536'])
+                startup = time.time() - start
+                start = time.time()
+                for line in lines:
+                    consume(job.batchMapper(None, line))
+                consume(job.batchMapper_final())
+                rates.append(('batch', startup, time.time() - start))
+
+                start = time.time()
+                job = makeJob(extra + ['--binary-input', '--batch-size',
+                                       '65536'])
+                for filename in filenames.itervalues():
+                    job.columnFiles[filename] = columnFile(filename)
+                startup = time.time() - start
+                start = time.time()
+                for line in manifest:
+                    consume(job.binaryMapper(None, line))
+                rates.append(('binary', startup, time.time() - start))
+                for mapper, startup, elapsed in rates:
+                    print '%30s %8s %8s %12.3f %14.0f' % (
+                        os.path.basename(dataset), name, mapper, startup,
+                        len(lines) / elapsed)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
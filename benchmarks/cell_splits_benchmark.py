@@ -0,0 +1,62 @@
+""" Reduce task balance of the bundled plan before and after re-splitting
+the cells a sample overloads.
+
+Usage: python benchmarks/cell_splits_benchmark.py
+       test_zipfian_100000_1.0.txt [sample_fraction] [reducers ...]
+
+Plans the splits from a random sample of the dataset (default 5%) for each
+number of reduce tasks (default 64, 256 and 1024), then routes the whole
+dataset with and without them. Reports the communication cost, the max /
+mean reduce task load, and the planning seconds.
+"""
+import os
+import pickle
+import random
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from skew.cellSplits import planSplits  # noqa
+from skew.simulator import planSimulator  # noqa
+
+
+def load(filename):
+    with open(os.path.join(root, filename), 'rb') as f:
+        return pickle.load(f)
+
+
+def main():
+    dataset = sys.argv[1]
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    reducers = [int(n) for n in sys.argv[3:]] or [64, 256, 1024]
+    with open(dataset) as f:
+        lines = [line.rstrip('\n') for line in f if line.strip()]
+    random.seed(1)
+    sample = [line for line in lines if random.random() < fraction]
+    scale = [1.0 / fraction] * 3
+    print '%10s %8s %16s %12s %10s %10s' % ('reducers', 'splits', 'cost',
+                                             'max / mean', 'sub-cells',
+                                             'plan s')
+    for numberReducers in reducers:
+        simulator = planSimulator(load('schema.p'), load('residualjoins.p'),
+                                  load('shares.p'), load('heavyhitters.p'),
+                                  numberReducers)
+        loads, tuples = simulator.sampled(lines)
+        stats = simulator.statistics(loads, sum(tuples))
+        print '%10d %8s %16.0f %12.3f %10s %10s' % (
+            numberReducers, 'no', stats['communicationCost'],
+            stats['maxMeanRatio'], '', '')
+        start = time.time()
+        splits = planSplits(simulator, sample, scale=scale)
+        seconds = time.time() - start
+        loads, tuples = simulator.sampled(lines)
+        stats = simulator.statistics(loads, sum(tuples))
+        print '%10d %8s %16.0f %12.3f %10d %10.2f' % (
+            numberReducers, 'yes', stats['communicationCost'],
+            stats['maxMeanRatio'], len(splits['tasks']), seconds)
+
+
+if __name__ == '__main__':
+    main()
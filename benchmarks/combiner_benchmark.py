@@ -0,0 +1,63 @@
+""" Shuffle volume with and without the --combine combiner.
+
+Usage: python benchmarks/combiner_benchmark.py
+       test_zipfian_100000_1.0.txt [more zipf_dataset_generator.py datasets]
+
+Runs identityMapper with the bundled plan, groups its output by key as a
+single map task spill and runs the combiner on every key. Reports the
+values and bytes that would be shuffled per --internal-format, before and
+after combining, and the reduction ratio.
+"""
+import os
+import sys
+import time
+from collections import defaultdict
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+
+formats = ['raw', 'packed']
+
+
+def main():
+    print '%30s %8s %12s %12s %12s %12s %8s %10s' % (
+        'dataset', 'format', 'values', 'combined', 'shuffle MB',
+        'combined MB', 'ratio', 'combine s')
+    for dataset in sys.argv[1:]:
+        lines = [line.rstrip('\n') for line in open(dataset)]
+        for internalFormat in formats:
+            job = SharesSkewJob([
+                '--schemaFile', os.path.join(root, 'schema.p'),
+                '--residualsFile', os.path.join(root, 'residualjoins.p'),
+                '--sharesFile', os.path.join(root, 'shares.p'),
+                '--hhFile', os.path.join(root, 'heavyhitters.p'),
+                '--internal-format', internalFormat, '--combine'])
+            job.sandbox()
+            job.mapper_init()
+            job.combiner_init()
+            protocol = job.internal_protocol()
+            buckets = defaultdict(list)
+            for line in lines:
+                for key, value in job.identityMapper(None, line):
+                    buckets[key].append(value)
+            values = sum(len(v) for v in buckets.itervalues())
+            shuffleBytes = sum(len(protocol.write(key, value)) + 1
+                               for key, v in buckets.iteritems()
+                               for value in v)
+
+            start = time.time()
+            combined = [pair for key in sorted(buckets)
+                        for pair in job.combiner(key, buckets[key])]
+            elapsed = time.time() - start
+            combinedBytes = sum(len(protocol.write(key, value)) + 1
+                                for key, value in combined)
+            print '%30s %8s %12d %12d %12.1f %12.1f %8.2f %10.2f' % (
+                os.path.basename(dataset), internalFormat, values,
+                len(combined), shuffleBytes / 1e6, combinedBytes / 1e6,
+                float(values) / max(len(combined), 1), elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+""" Hash reducer against the trie (worst-case optimal) reducer on cyclic
+queries.
+
+Usage: python benchmarks/cyclic_join_benchmark.py [tuples_per_relation] [s]
+
+Builds a single bucket for the triangle R1(A1,A2), R2(A2,A3), R3(A3,A1)
+and the 4-cycle R1(A1,A2), R2(A2,A3), R3(A3,A4), R4(A4,A1). Join values
+follow zipf_dataset_generator.py: ranks 1..5 take zipf frequencies with
+skew s and the remainder are ordinary values, i.e. the dense block a
+heavy hitter residual bucket receives. Every join runs in a fresh process
+and reports its time and the peak memory it added.
+"""
+import os
+import random
+import resource
+import sys
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from skew.joinEngine import multiwayJoin, trieJoin  # noqa
+
+schemas = {
+    'triangle': [
+        [0, 1, 1, 0],
+        [0, 0, 1, 1],
+        [0, 1, 0, 1]
+    ],
+    '4-cycle': [
+        [0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 0],
+        [0, 0, 0, 1, 1],
+        [0, 1, 0, 0, 1]
+    ],
+}
+engines = {'hash': multiwayJoin, 'trie': trieJoin}
+
+
+def zipfValues(size, s, ordinary):
+    """ Join values with 5 zipf ranked heavy hitters over `ordinary`
+    ordinary values, as in zipf_dataset_generator.py
+    """
+    N = 10**6
+    d = sum(1.0 / n**s for n in xrange(1, N))
+    ranks = [round(k**(-s) / d, 2) for k in xrange(1, 6)]
+    values = []
+    for k, freq in enumerate(ranks):
+        values.extend([str(k + 1)] * int(size * freq))
+    while len(values) < size:
+        values.append(str(100 + random.randrange(ordinary)))
+    return values
+
+
+def makeTables(schema, size, s):
+    random.seed(111)
+    tables = []
+    for rel in schema:
+        columns = [zipfValues(size, s, size / 10) if v == 1 else None
+                   for v in rel]
+        for column in columns:
+            if column is not None:
+                random.shuffle(column)
+        tables.append([[columns[attr][i] if v == 1 else '_'
+                        for attr, v in enumerate(rel)]
+                       for i in xrange(size)])
+    return tables
+
+
+def runJoin(name, algorithm, size, s, queue):
+    schema = schemas[name]
+    tables = makeTables(schema, size, s)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    count = engines[algorithm](schema).join(tables, countOnly=True)
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((count, elapsed, (after - before) / 1024.0))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    s = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    print '%10s %6s %14s %10s %14s' % ('query', 'join', 'output', 'time (s)',
+                                       'peak +MB')
+    for name in ['triangle', '4-cycle']:
+        for algorithm in ['hash', 'trie']:
+            queue = Queue()
+            p = Process(target=runJoin,
+                        args=(name, algorithm, size, s, queue))
+            p.start()
+            count, elapsed, peak = queue.get()
+            p.join()
+            print '%10s %6s %14d %10.2f %14.1f' % (name, algorithm, count,
+                                                   elapsed, peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+""" Wall time and spill volume of a bucket join per --join-memory-mb.
+
+Usage: python benchmarks/grace_join_benchmark.py [tuples_per_relation]
+       [budget_mb ...]
+
+Builds one oversized bucket of the bundled schema, the chain
+R1(A1, A2) R2(A2, A3, A5) R3(A3, A4), with random values over a domain that
+keeps the join output close to the input size. Counts its join with the
+in-memory engines and with graceHashJoin for each budget (default 64, 16
+and 4 MB), reporting the estimated table bytes, the spilled bytes and
+partitions, and the seconds of each.
+"""
+import os
+import pickle
+import random
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from skew.graceJoin import graceHashJoin, tupleBytes  # noqa
+from skew.joinEngine import multiwayJoin, trieJoin  # noqa
+
+
+def makeTables(schema, size):
+    random.seed(5)
+    domain = size
+    tables = []
+    for rel in schema:
+        table = []
+        for i in xrange(size):
+            table.append([str(random.randrange(domain)) if x else '_'
+                          for x in rel])
+        tables.append(table)
+    return tables
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    budgets = [float(b) for b in sys.argv[2:]] or [64, 16, 4]
+    with open(os.path.join(root, 'schema.p'), 'rb') as f:
+        schema = pickle.load(f)
+    tables = makeTables(schema, size)
+    tableBytes = sum(tupleBytes(table[0]) * len(table) for table in tables)
+    print 'estimated table bytes %.1f MB' % (tableBytes / 1024.0 / 1024)
+    print '%8s %12s %12s %12s %12s %10s' % ('engine', 'budget MB',
+                                            'spilled MB', 'partitions',
+                                            'results', 'seconds')
+    for name, engine in [('hash', multiwayJoin(schema)),
+                         ('trie', trieJoin(schema))]:
+        start = time.time()
+        results = engine.join(tables, countOnly=True)
+        print '%8s %12s %12s %12s %12d %10.2f' % (name, 'memory', '', '',
+                                                  results,
+                                                  time.time() - start)
+        for budget in budgets:
+            start = time.time()
+            join = graceHashJoin(engine, budget * 1024 * 1024)
+            for relation, table in enumerate(tables):
+                for t in table:
+                    join.add(relation, t)
+            results = join.join(countOnly=True)
+            print '%8s %12.1f %12.1f %12d %12d %10.2f' % (
+                name, budget, join.spilledBytes / 1024.0 / 1024,
+                join.partitions, results, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+""" Reducer load balance per --hash-function.
+
+Usage: python benchmarks/hashing_benchmark.py [number_of_reducers]
+       [dataset ...]
+
+Routes every dataset (simple.in and the zipf_dataset_generator.py
+outputs, eg test_zipfian_100000_1.0.txt) through the bundled plan with
+planSimulator under each hash function, then a synthetic dataset of ids
+allocated in strides of 8 from the generator's base value, as sharded id
+generators do. Reports the variance and the
+coefficient of variation of the cell loads within a residual join,
+averaged over the residual joins with tuples, and the max / mean reduce
+task load.
+"""
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from skew.hashing import attributeHash  # noqa
+from skew.simulator import planSimulator  # noqa
+
+hashings = [('modulo', 0), ('multiply-shift', 0), ('multiply-shift', 1)]
+
+# The first ordinary value of zipf_dataset_generator.py
+big = 112312311
+
+
+def stridedLines(numberTuples, stride=8):
+    """ Join values big, big + stride, ... shared by all relations """
+    ids = [str(big + stride * i) for i in xrange(numberTuples // 3)]
+    return (['R1 %s %s' % (i, j) for i, j in zip(ids, reversed(ids))] +
+            ['R2 %s %s %s' % (i, i, j) for i, j in zip(ids, reversed(ids))] +
+            ['R3 %s %s' % (i, j) for i, j in zip(ids, reversed(ids))])
+
+
+def main():
+    numberReducers = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    datasets = sys.argv[2:] or [os.path.join(root, 'simple.in')]
+
+    def load(filename):
+        with open(os.path.join(root, filename), 'rb') as f:
+            return pickle.load(f)
+    schema = load('schema.p')
+    print '%30s %16s %14s %10s %12s %10s' % (
+        'dataset', 'hash', 'cell variance', 'cell cv', 'max / mean',
+        'route s')
+    for dataset in datasets + ['strided-8']:
+        if dataset == 'strided-8':
+            lines = stridedLines(30000)
+        else:
+            with open(dataset) as f:
+                lines = [line.rstrip('\n') for line in f if line.strip()]
+        for name, seed in hashings:
+            simulator = planSimulator(
+                schema, load('residualjoins.p'), load('shares.p'),
+                load('heavyhitters.p'), numberReducers,
+                attributeHash(name, seed, len(schema[0])))
+            start = time.time()
+            loads, tuples = simulator.sampled(lines)
+            elapsed = time.time() - start
+            # Within a residual join every cell expects the same load,
+            # the spread of its cell loads is the hash imbalance
+            variances = []
+            cvs = []
+            for residualId, cells in enumerate(simulator.cells.cells):
+                start = simulator.cells.offsets[residualId]
+                cellLoads = loads[start:start + cells]
+                if cells > 1 and cellLoads.any():
+                    variances.append(cellLoads.var())
+                    cvs.append(cellLoads.std() / cellLoads.mean())
+            stats = simulator.statistics(loads, sum(tuples))
+            print '%30s %16s %14.1f %10.3f %12.3f %10.2f' % (
+                os.path.basename(dataset), '%s/%d' % (name, seed),
+                np.mean(variances), np.mean(cvs),
+                stats['maxMeanRatio'], elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+""" Exact heavy hitter counting against SpaceSaving summaries.
+
+Usage: python benchmarks/heavy_hitter_sketch_benchmark.py
+       test_zipfian_100000_1.0.txt [threshold]
+
+Runs HeavyHittersJob with the inline runner, exactly and with SpaceSaving
+for a range of epsilons, and reports the runtime, the counters the
+mappers hold (exact counting ships one record per distinct value to the
+shuffle), the recall and precision of the heavy hitters found and the
+largest error of the estimated fractions.
+"""
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from heavyhittersjob import HeavyHittersJob  # noqa
+from skew.heavyHitters import joinAttributes  # noqa
+import pickle  # noqa
+
+
+def run(dataset, args):
+    job = HeavyHittersJob(['-r', 'inline', '--no-conf',
+                           '--schemaFile', os.path.join(root, 'schema.p'),
+                           dataset] + args)
+    start = time.time()
+    with job.make_runner() as runner:
+        runner.run()
+        lines = [line.rstrip('\n') for line in runner.stream_output()]
+    elapsed = time.time() - start
+    result = {}
+    for line in lines:
+        attr, value, skew = line.split('   ')
+        result[(attr, value)] = [float(sk.split(':')[1])
+                                 for sk in skew.split(',')]
+    return result, elapsed
+
+
+def distinctValues(dataset):
+    schema = pickle.load(open(os.path.join(root, 'schema.p'), 'rb'))
+    attrs = joinAttributes(schema)
+    seen = set()
+    for line in open(dataset):
+        tokens = line.split()
+        rel = schema[int(tokens[0][1:]) - 1]
+        for attr in attrs:
+            if rel[attr] == 1:
+                seen.add((attr, tokens[0], tokens[1 + sum(rel[:attr])]))
+    return len(seen)
+
+
+def main():
+    dataset = sys.argv[1]
+    threshold = sys.argv[2] if len(sys.argv) > 2 else '0.01'
+    print '%14s %10s %10s %8s %10s %10s' % ('method', 'time (s)', 'counters',
+                                            'recall', 'precision',
+                                            'max error')
+    exact, elapsed = run(dataset, ['--threshold', threshold])
+    print '%14s %10.2f %10d %8.2f %10.2f %10.4f' % (
+        'exact', elapsed, distinctValues(dataset), 1, 1, 0)
+    for epsilon in ['0.005', '0.001', '0.0001']:
+        if float(epsilon) >= float(threshold):
+            continue
+        found, elapsed = run(dataset, ['--threshold', threshold,
+                                       '--method', 'spacesaving',
+                                       '--epsilon', epsilon])
+        common = set(exact).intersection(found)
+        error = max([abs(x - y) for hh in common
+                     for x, y in zip(exact[hh], found[hh])] or [0])
+        # 4 summaries: (A2, R1), (A2, R2), (A3, R2), (A3, R3)
+        counters = 4 * int(round(1 / float(epsilon)))
+        print '%14s %10.2f %10d %8.2f %10.2f %10.4f' % (
+            'ss ' + epsilon, elapsed, counters,
+            len(common) / float(len(exact) or 1),
+            len(common) / float(len(found) or 1), error)
+
+
+if __name__ == '__main__':
+    main()
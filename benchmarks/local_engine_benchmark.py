@@ -0,0 +1,61 @@
+""" Wall time of localEngine per number of workers against mrjob's inline
+runner.
+
+Usage: python benchmarks/local_engine_benchmark.py
+       test_zipfian_100000_1.0.txt [number_of_reducers] [workers ...]
+
+Runs the bundled plan with cell keys, packed values and the batch mapper
+over the dataset, in mrjob's inline runner and in localEngine with 1 MB
+splits for each number of workers (default 1, 2 and 4). Reports the map,
+reduce and wall seconds and the max / mean reduce task load.
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+from skew.localEngine import localEngine  # noqa
+
+
+def main():
+    dataset = sys.argv[1]
+    numberReducers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = [int(w) for w in sys.argv[3:]] or [1, 2, 4]
+    jobArgs = ['--schemaFile', os.path.join(root, 'schema.p'),
+               '--residualsFile', os.path.join(root, 'residualjoins.p'),
+               '--sharesFile', os.path.join(root, 'shares.p'),
+               '--hhFile', os.path.join(root, 'heavyhitters.p'),
+               '--key-format', 'cell', '--reduce-number',
+               str(numberReducers), '--internal-format', 'packed',
+               '--batch-size', '65536']
+    print '%16s %10s %10s %10s %12s %14s' % ('runner', 'map s', 'reduce s',
+                                             'wall s', 'max / mean',
+                                             'join results')
+    job = SharesSkewJob(['-r', 'inline'] + jobArgs + ['-'])
+    with open(dataset, 'rb') as f:
+        job.sandbox(stdin=BytesIO(f.read()))
+    start = time.time()
+    with job.make_runner() as runner:
+        runner.run()
+        results = sum(job.parse_output_line(line)[1]
+                      for line in runner.stream_output())
+    print '%16s %10s %10s %10.2f %12s %14d' % ('inline', '', '',
+                                               time.time() - start, '',
+                                               results)
+    for numberWorkers in workers:
+        report = localEngine(SharesSkewJob, jobArgs, workers=numberWorkers,
+                             splitBytes=1024 * 1024).run([dataset])
+        loads = [stats['values'] for stats in report['reducers']]
+        print '%16s %10.2f %10.2f %10.2f %12.3f %14d' % (
+            'engine x%d' % numberWorkers, report['mapSeconds'],
+            report['reduceSeconds'], report['wallSeconds'],
+            max(loads) * len(loads) / float(sum(loads)),
+            report['joinResults'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+""" Mapper time of N plans in one scan against N separate scans.
+
+Usage: python benchmarks/multi_plan_benchmark.py [number_of_plans]
+       [number_of_tuples]
+
+Writes number_of_plans copies of the bundled plan as --planFile files and
+times identityMapper once per plan against multiPlanMapper over all of
+them, for the same random input lines.
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+from skew.planFile import writePlanFile  # noqa
+from tests.batchRouting_tests import makeLines  # noqa
+
+
+def makeJob(args):
+    job = SharesSkewJob(args)
+    job.sandbox()
+    job.mapper_init()
+    return job
+
+
+def main():
+    numberPlans = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    numberTuples = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    lines = makeLines(numberTuples)
+    consume = deque(maxlen=0).extend
+
+    def load(filename):
+        with open(os.path.join(root, filename), 'rb') as f:
+            return pickle.load(f)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        planFile = os.path.join(tmpdir, 'plan.p')
+        writePlanFile(planFile, load('schema.p'), load('residualjoins.p'),
+                      load('shares.p'), load('heavyhitters.p'))
+        single = makeJob([
+            '--schemaFile', os.path.join(root, 'schema.p'),
+            '--residualsFile', os.path.join(root, 'residualjoins.p'),
+            '--sharesFile', os.path.join(root, 'shares.p'),
+            '--hhFile', os.path.join(root, 'heavyhitters.p')])
+        start = time.time()
+        for i in xrange(numberPlans):
+            for line in lines:
+                consume(single.identityMapper(None, line))
+        separate = time.time() - start
+        multi = makeJob(['--planFile', planFile] * numberPlans)
+        start = time.time()
+        for line in lines:
+            consume(multi.multiPlanMapper(None, line))
+        shared = time.time() - start
+    finally:
+        shutil.rmtree(tmpdir)
+    print '%8s %10s %14s %14s' % ('plans', 'tuples', 'separate (s)',
+                                  'one scan (s)')
+    print '%8d %10d %14.2f %14.2f' % (numberPlans, numberTuples, separate,
+                                      shared)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+""" Wall time of residual join planning against the number of workers.
+
+Usage: python benchmarks/parallel_planning_benchmark.py [hh_per_attribute]
+       [number_of_reducers]
+
+Writes a heavyhitters.txt with hh_per_attribute heavy hitters on A2 and
+A3 of the relations.txt schema, (hh_per_attribute + 1)^2 residual joins,
+and plans it with premap.planResidualJoins for 1, 2, 4, ... workers up to
+the number of cores.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'skew'))
+
+import premap  # noqa
+
+
+def writeHeavyHitters(filename, numberHH):
+    with open(filename, 'w') as f:
+        for i in xrange(numberHH):
+            f.write('A2   %d   R1:%.3f,R2:%.3f,R3:-0.0\n' % (
+                100 + i, 0.3 / (i + 1), 0.2 / (i + 1)))
+            f.write('A3   %d   R1:-0.0,R2:%.3f,R3:%.3f\n' % (
+                1000 + i, 0.25 / (i + 1), 0.35 / (i + 1)))
+
+
+def main():
+    numberHH = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    numberReducers = int(sys.argv[2]) if len(sys.argv) > 2 else 720720
+    tmpdir = tempfile.mkdtemp()
+    try:
+        hhFile = os.path.join(tmpdir, 'heavyhitters.txt')
+        writeHeavyHitters(hhFile, numberHH)
+        sizes = premap.readRelationSizes(
+            os.path.join(root, 'relationsizes.txt'))
+        cores = multiprocessing.cpu_count()
+        workers = [1]
+        while workers[-1] * 2 <= cores:
+            workers.append(workers[-1] * 2)
+        print '%10s %10s %10s %10s' % ('residuals', 'workers', 'time (s)',
+                                       'speedup')
+        serial = None
+        for w in workers:
+            start = time.time()
+            combs, shares = premap.planResidualJoins(
+                hhFile, 6, numberReducers, sizes, workers=w,
+                schemaFilename=os.path.join(root, 'relations.txt'))
+            elapsed = time.time() - start
+            serial = serial or elapsed
+            print '%10d %10d %10.2f %10.2f' % (len(combs), w, elapsed,
+                                               serial / elapsed)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+""" Mapper throughput as the number of residual joins grows.
+
+Usage: python benchmarks/router_benchmark.py [number_of_tuples]
+
+For plans of 10 to 10,000 residual joins over the relations.txt schema,
+reports tuples/sec of the compiled router and emitted keys/sec of
+identityMapper, next to the linear scan of decideSingleResidual over all
+residual joins that the router replaced. A tuple whose relation lacks an
+HH attribute legitimately belongs to every residual join over that
+attribute, so the mapper is measured per emitted key.
+"""
+import itertools
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sharesskew import (SharesSkewJob, decideSingleResidual,  # noqa
+                        extendTupleValue)
+
+random.seed(111)
+
+schema = [
+    [0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 0, 1, 1, 0]
+]
+big = 112312311
+
+
+def makePlan(numberResiduals):
+    """ HH values on A2 and A3 such that (|HH_A2|+1)*(|HH_A3|+1) is about
+    numberResiduals
+    """
+    n2 = max(int(round(numberResiduals ** 0.5)) - 1, 1)
+    n3 = max(int(round(float(numberResiduals) / (n2 + 1))) - 1, 1)
+    hh = [['_'] for x in xrange(len(schema[0]))]
+    hh[2].extend(str(100 + i) for i in xrange(n2))
+    hh[3].extend(str(100000 + i) for i in xrange(n3))
+    residuals = list(itertools.product(*hh))
+    heavyhitters = [dict((attr, value) for attr, value in enumerate(res)
+                         if value != '_') for res in residuals]
+    shares = [{} for res in residuals]
+    return residuals, heavyhitters, shares, hh
+
+
+def makeTuples(numberTuples, hh):
+    """ Half of the join values are heavy hitters """
+    def value(attr):
+        if random.random() < 0.5:
+            return random.choice(hh[attr][1:])
+        return str(random.randrange(big, 2 * big))
+    lines = []
+    for i in xrange(numberTuples):
+        relation = random.choice([1, 2, 3])
+        if relation == 1:
+            values = [str(random.randrange(big)), value(2)]
+        elif relation == 2:
+            values = [value(2), value(3), str(random.randrange(big))]
+        else:
+            values = [value(3), str(random.randrange(big))]
+        lines.append('R%d %s' % (relation, ' '.join(values)))
+    return lines
+
+
+def linearScan(job, lines):
+    for line in lines:
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        inputTuple = extendTupleValue(tokens[1:], job.schema[relation-1])
+        for residualJoin in job.residuals:
+            decideSingleResidual(inputTuple, residualJoin, job.heavyhitters,
+                                 job.hhinvertedIndex)
+
+
+def routeOnly(job, lines):
+    for line in lines:
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        inputTuple = extendTupleValue(tokens[1:], job.schema[relation-1])
+        job.router.route(relation-1, inputTuple)
+
+
+def routedMapper(job, lines):
+    keys = 0
+    for line in lines:
+        for _ in job.identityMapper(None, line):
+            keys += 1
+    return keys
+
+
+def main():
+    numberTuples = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print '%10s %16s %16s %16s' % ('residuals', 'route tuples/s',
+                                       'mapper keys/s', 'scan tuples/s')
+        for numberResiduals in [10, 100, 1000, 10000]:
+            residuals, heavyhitters, shares, hh = makePlan(numberResiduals)
+            files = {}
+            for name, obj in [('schema', schema), ('residuals', residuals),
+                              ('hh', heavyhitters), ('shares', shares)]:
+                files[name] = os.path.join(tmpdir, name + '.p')
+                pickle.dump(obj, open(files[name], 'wb'))
+            job = SharesSkewJob(['--schemaFile', files['schema'],
+                                 '--residualsFile', files['residuals'],
+                                 '--hhFile', files['hh'],
+                                 '--sharesFile', files['shares']])
+            job.sandbox()
+            job.mapper_init()
+            lines = makeTuples(numberTuples, hh)
+
+            start = time.time()
+            routeOnly(job, lines)
+            routeRate = numberTuples / (time.time() - start)
+            start = time.time()
+            keys = routedMapper(job, lines)
+            mapperRate = keys / (time.time() - start)
+            # The linear scan is too slow to run in full for large plans
+            scanLines = lines[:max(numberTuples * 10 / len(residuals), 100)]
+            start = time.time()
+            linearScan(job, scanLines)
+            scanRate = len(scanLines) / (time.time() - start)
+            print '%10d %16.0f %16.0f %16.0f' % (len(residuals), routeRate,
+                                                 mapperRate, scanRate)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
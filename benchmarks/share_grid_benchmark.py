@@ -0,0 +1,80 @@
+""" Mapper tuples/sec with precomputed share grids against per tuple ranges.
+
+Usage: python benchmarks/share_grid_benchmark.py test_zipfian_100000_1.0.txt
+       [more datasets written by zipf_dataset_generator.py ...]
+
+Both mappers route with the compiled residual router and use the bundled
+schema.p, residualjoins.p, shares.p and heavyhitters.p plan. The per tuple
+mapper is identityMapper as it was before shareGrid: it completes the
+shares dict, sorts it and rebuilds the ranges for every tuple.
+"""
+import os
+import sys
+import time
+from copy import deepcopy
+from itertools import imap, product
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob, extendTupleValue  # noqa
+
+
+def perTupleMapper(job, shares, line):
+    tokens = line.split(' ')
+    relation = int(tokens[0][1:])
+    thisRelSchema = job.schema[relation-1]
+    inputTuple = extendTupleValue(tokens[1:], thisRelSchema)
+    inputTupleShortened = [0 if v == '_' else int(v) for v in inputTuple[1:]]
+    keylist = []
+    for residualId in job.router.route(relation-1, inputTuple):
+        residualShare = shares[residualId]
+        residualShare.update(job.hhSharesResiduals[residualId])
+        for i in xrange(1, 5):
+            try:
+                residualShare[str(i)]
+            except:
+                residualShare[str(i)] = 1
+        ranges = list(imap(range, [residualShare[k]
+                                   for k in sorted(residualShare)]))
+        ranges = [[val % len(share)] if h == 1 else share
+                  for h, share, val in zip(thisRelSchema[1:], ranges,
+                                           inputTupleShortened)]
+        residualJoinKeyPart = '-'.join(job.residuals[residualId])
+        for key in product(*ranges):
+            keylist.append((residualJoinKeyPart,) + key)
+    inputTuple2 = "+".join(inputTuple)
+    return [('.'.join([str(x) for x in key]),
+             str(relation) + ":" + inputTuple2) for key in set(keylist)]
+
+
+def main():
+    job = SharesSkewJob([
+        '--schemaFile', os.path.join(root, 'schema.p'),
+        '--residualsFile', os.path.join(root, 'residualjoins.p'),
+        '--sharesFile', os.path.join(root, 'shares.p'),
+        '--hhFile', os.path.join(root, 'heavyhitters.p')])
+    job.sandbox()
+    job.mapper_init()
+    print '%32s %10s %18s %18s' % ('dataset', 'tuples', 'per tuple tuples/s',
+                                   'grid tuples/s')
+    for dataset in sys.argv[1:]:
+        lines = [line.rstrip('\n') for line in open(dataset)]
+
+        shares = deepcopy(job.shares)
+        start = time.time()
+        for line in lines:
+            perTupleMapper(job, shares, line)
+        perTupleRate = len(lines) / (time.time() - start)
+
+        start = time.time()
+        for line in lines:
+            for _ in job.identityMapper(None, line):
+                pass
+        gridRate = len(lines) / (time.time() - start)
+        print '%32s %10d %18.0f %18.0f' % (os.path.basename(dataset),
+                                           len(lines), perTupleRate, gridRate)
+
+
+if __name__ == '__main__':
+    main()
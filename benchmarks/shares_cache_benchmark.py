@@ -0,0 +1,74 @@
+""" Re-planning time with and without a sharesCache.
+
+Usage: python benchmarks/shares_cache_benchmark.py [hh_per_attribute]
+       [number_of_reducers] [tolerance]
+
+Plans a heavyhitters.txt with hh_per_attribute heavy hitters on A2 and A3
+of the relations.txt schema, then re-plans it three times with every HH
+fraction drifted by up to 0.5%, as after a fresh heavy hitter detection
+pass. Reports the planning time, the cache hits and the largest relative
+cost increase of the cached shares over solving from scratch.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'skew'))
+
+import premap  # noqa
+from sharesCache import sharesCache  # noqa
+
+
+def writeHeavyHitters(filename, numberHH, drift):
+    random.seed(drift)
+
+    def fraction(f):
+        return f * (1 + drift * random.uniform(-0.005, 0.005))
+    with open(filename, 'w') as f:
+        for i in xrange(numberHH):
+            f.write('A2   %d   R1:%.6f,R2:%.6f,R3:-0.0\n' % (
+                100 + i, fraction(0.3 / (i + 1)), fraction(0.2 / (i + 1))))
+            f.write('A3   %d   R1:-0.0,R2:%.6f,R3:%.6f\n' % (
+                1000 + i, fraction(0.25 / (i + 1)), fraction(0.35 / (i + 1))))
+
+
+def main():
+    numberHH = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    numberReducers = int(sys.argv[2]) if len(sys.argv) > 2 else 720720
+    tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    tmpdir = tempfile.mkdtemp()
+    try:
+        hhFile = os.path.join(tmpdir, 'heavyhitters.txt')
+        sizes = premap.readRelationSizes(
+            os.path.join(root, 'relationsizes.txt'))
+        cache = sharesCache(os.path.join(tmpdir, 'sharescache.p'),
+                            tolerance=tolerance)
+        print '%6s %10s %12s %12s %8s %12s' % (
+            'run', 'residuals', 'solve (s)', 'cached (s)', 'hits',
+            'cost gap')
+        for drift in xrange(4):
+            writeHeavyHitters(hhFile, numberHH, drift)
+            args = (hhFile, 6, numberReducers, sizes)
+            kwargs = {'workers': 1, 'schemaFilename':
+                      os.path.join(root, 'relations.txt')}
+            start = time.time()
+            combs, solved = premap.planResidualJoins(*args, **kwargs)
+            solve = time.time() - start
+            hits = cache.hits
+            start = time.time()
+            combs, cached = premap.planResidualJoins(*args, cache=cache,
+                                                     **kwargs)
+            elapsed = time.time() - start
+            gap = max(c[1] / s[1] - 1 for c, s in zip(cached, solved))
+            print '%6d %10d %12.2f %12.2f %8d %12.5f' % (
+                drift, len(combs), solve, elapsed, cache.hits - hits, gap)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
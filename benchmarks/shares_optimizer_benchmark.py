@@ -0,0 +1,87 @@
+""" Planning time and cost of the built-in shares optimizer.
+
+Usage: python benchmarks/shares_optimizer_benchmark.py [k ...]
+
+Plans every residual join of the bundled relations.txt,
+relationsizes.txt and heavyhitters.txt with sharesOptimizer and reports
+the planning time per residual join, both with the default exact
+enumeration of small problems and through the relaxation alone. The
+communication cost is compared with Couenne when pyomo and the couenne
+binary are available, and with the optimum over all integer
+factorisations of k otherwise.
+"""
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(root, 'skew'))
+
+import premap  # noqa
+import sharesJoin  # noqa
+from sharesOptimizer import (calculateShares, communicationCost,  # noqa
+                             factorizations, shareVars)
+
+numberAttributes = 6
+
+
+def residualCalculators(numberReducers):
+    relationSizes = premap.readRelationSizes(
+        os.path.join(root, 'relationsizes.txt'))
+    hhinfo, hh = premap.readHeavyHitters(
+        os.path.join(root, 'heavyhitters.txt'), numberAttributes)
+    schema = premap.readSchema(os.path.join(root, 'relations.txt'),
+                               numberAttributes)
+    for cmb in premap.combinations(hh):
+        sizes = premap.replaceSize(cmb, relationSizes, hhinfo)
+        hhList = [attr for attr, value in enumerate(cmb) if value != '_']
+        yield cmb, sharesJoin.sharesCalculator(
+            schema, numberAttributes, sizes, numberReducers, hhList, None)
+
+
+def couenneAvailable():
+    try:
+        from pyomo.opt import SolverFactory
+    except ImportError:
+        return False
+    return SolverFactory('couenne').available(exception_flag=False)
+
+
+def exhaustiveCost(s):
+    variables = shareVars(s.expressionVars)
+    return min(communicationCost(s.expressionVars, s.relationSizes,
+                                 dict((str(var), x)
+                                      for var, x in zip(variables, f)))
+               for f in factorizations(s.numberReducers, len(variables)))
+
+
+def main():
+    ks = [int(k) for k in sys.argv[1:]] or [16, 64, 256, 1024]
+    reference = 'couenne' if couenneAvailable() else 'exhaustive'
+    print '%6s %24s %11s %11s %11s %11s %13s %11s' % (
+        'k', 'residual join', 'builtin ms', 'gap', 'relaxed ms', 'gap',
+        reference + ' ms', 'cost')
+    for k in ks:
+        for cmb, s in residualCalculators(k):
+            start = time.time()
+            shares, cost, perReducer = s.getShares()
+            builtin = (time.time() - start) * 1000
+            start = time.time()
+            relaxedCost = calculateShares(s.expressionVars, s.relationSizes,
+                                          k, exhaustiveLimit=0)[1]
+            relaxed = (time.time() - start) * 1000
+            start = time.time()
+            if reference == 'couenne':
+                s.solver = 'couenne'
+                best = s.getShares()[1]
+            else:
+                best = exhaustiveCost(s)
+            elapsed = (time.time() - start) * 1000
+            print '%6d %24s %11.2f %11.4f %11.2f %11.4f %13.2f %11.0f' % (
+                k, ','.join(cmb), builtin, cost / best - 1 if best else 0,
+                relaxed, relaxedCost / best - 1 if best else 0, elapsed,
+                best)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Throughput of the sampled load prediction of planSimulator.
+
+Usage: python benchmarks/simulator_benchmark.py [number_of_tuples]
+       [number_of_reducers]
+
+Routes number_of_tuples random tuples, 30% of them heavy hitter values,
+through the bundled plan and reports tuples/sec and the predicted
+statistics.
+"""
+import os
+import pickle
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from skew import premap  # noqa
+from skew.simulator import planSimulator  # noqa
+from tests.batchRouting_tests import makeLines  # noqa
+
+
+def main():
+    numberTuples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    numberReducers = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    def load(filename):
+        with open(os.path.join(root, filename), 'rb') as f:
+            return pickle.load(f)
+    simulator = planSimulator(load('schema.p'), load('residualjoins.p'),
+                              load('shares.p'), load('heavyhitters.p'),
+                              numberReducers)
+    lines = makeLines(numberTuples)
+    start = time.time()
+    loads, tuples = simulator.sampled(lines)
+    elapsed = time.time() - start
+    print '%d tuples in %.2fs, %.0f tuples/s' % (
+        numberTuples, elapsed, numberTuples / elapsed)
+    for name, value in sorted(simulator.statistics(
+            loads, sum(tuples)).iteritems()):
+        print '%20s %14.3f' % (name, value)
+
+
+if __name__ == '__main__':
+    main()
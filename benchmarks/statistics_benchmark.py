@@ -0,0 +1,59 @@
+""" Time and accuracy of sampled statistics against a full scan.
+
+Usage: python benchmarks/statistics_benchmark.py [number_of_tuples]
+       [blocks]
+
+Writes number_of_tuples tuples with two planted heavy hitters to a
+temporary file, collects statistics with a full scan and with blocks
+sampled 64KB blocks, and reports the time and the largest relative error
+of the relation sizes and heavy hitter fractions.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from skew import premap  # noqa
+from skew.statistics import collectStatistics  # noqa
+from tests.statistics_tests import writeInput  # noqa
+
+
+def main():
+    numberTuples = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    numberBlocks = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    schema = premap.readSchema(os.path.join(root, 'relations.txt'), 6)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'input.txt')
+        writeInput(filename, numberTuples)
+        print '%d tuples, %.1f MB' % (numberTuples,
+                                      os.path.getsize(filename) / 1e6)
+        print '%10s %12s %10s %12s %14s' % ('mode', 'tuples read',
+                                            'time (s)', 'size error',
+                                            'fraction error')
+        exact = None
+        for mode, blocks in [('full', 10 ** 9), ('sampled', numberBlocks)]:
+            start = time.time()
+            stats = collectStatistics([filename], schema,
+                                      numberBlocks=blocks, seed=1)
+            elapsed = time.time() - start
+            exact = exact or stats
+            sizeError = max(abs(s[0] / e[0] - 1) for s, e
+                            in zip(stats['sizes'], exact['sizes']))
+            fractionError = max(
+                abs(p - q) for s, e in zip(stats['heavyhitters'],
+                                           exact['heavyhitters'])
+                for p, q in zip(s[2], e[2]))
+            print '%10s %12d %10.2f %12.5f %14.5f' % (
+                mode, stats['sampledTuples'], elapsed, sizeError,
+                fractionError)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
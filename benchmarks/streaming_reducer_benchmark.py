@@ -0,0 +1,101 @@
+""" Peak reducer memory of joinReducer against streamingJoinReducer.
+
+Usage: python benchmarks/streaming_reducer_benchmark.py
+       test_zipfian_1000000_1.0.txt [number_of_buckets]
+
+Runs identityMapper with the bundled plan over a zipf_dataset_generator.py
+dataset, keeps the heaviest buckets, sorts their values the way Hadoop
+does with --secondary-sort and feeds them from disk to each reducer in a
+fresh process. Reports the time and the peak memory every reducer adds.
+"""
+import heapq
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from multiprocessing import Process, Queue
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+
+
+def makeJob(extra=[]):
+    job = SharesSkewJob([
+        '--schemaFile', os.path.join(root, 'schema.p'),
+        '--residualsFile', os.path.join(root, 'residualjoins.p'),
+        '--sharesFile', os.path.join(root, 'shares.p'),
+        '--hhFile', os.path.join(root, 'heavyhitters.p'),
+        '--sizesFile', os.path.join(root, 'relationsizes.txt'),
+        '--secondary-sort'] + extra)
+    job.sandbox()
+    return job
+
+
+def mapOutput(job, dataset):
+    with open(dataset) as f:
+        for line in f:
+            for key, value in job.identityMapper(None, line.rstrip('\n')):
+                yield key, value
+
+
+def runReducer(name, path, queue):
+    job = makeJob()
+    job.reducer_init()
+    reducer = getattr(job, name)
+
+    def values():
+        with open(path) as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    result = list(reducer('bucket', values()))
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((result[0][1], elapsed, (after - before) / 1024.0))
+
+
+def main():
+    dataset = sys.argv[1]
+    numberBuckets = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    job = makeJob()
+    job.mapper_init()
+    loads = Counter(key for key, value in mapOutput(job, dataset))
+    heaviest = set(key for key, load in heapq.nlargest(
+        numberBuckets, loads.iteritems(), key=lambda kv: kv[1]))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = dict((key, open(os.path.join(tmpdir, str(i)), 'w'))
+                     for i, key in enumerate(heaviest))
+        for key, value in mapOutput(job, dataset):
+            if key in heaviest:
+                files[key].write(value + '\n')
+        print '%24s %10s %22s %12s %10s %10s' % (
+            'bucket', 'values', 'reducer', 'joined', 'time (s)', 'peak +MB')
+        for key, f in files.iteritems():
+            f.close()
+            # Secondary sort: the values of a bucket arrive in order
+            values = sorted(open(f.name).read().splitlines())
+            with open(f.name, 'w') as out:
+                out.write('\n'.join(values) + '\n')
+            for name in ['joinReducer', 'streamingJoinReducer']:
+                queue = Queue()
+                p = Process(target=runReducer, args=(name, f.name, queue))
+                p.start()
+                count, elapsed, peak = queue.get()
+                p.join()
+                print '%24s %10d %22s %12d %10.2f %10.1f' % (
+                    key, loads[key], name, count, elapsed, peak)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
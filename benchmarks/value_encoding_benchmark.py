@@ -0,0 +1,56 @@
+""" Shuffle bytes and reducer parse time per internal format.
+
+Usage: python benchmarks/value_encoding_benchmark.py
+       test_zipfian_100000_1.0.txt [more zipf_dataset_generator.py datasets]
+
+Runs identityMapper with the bundled plan, encodes its output with the
+job's internal protocol for each --internal-format and reports the bytes
+that would be shuffled and the time the reducer spends decoding values.
+"""
+import os
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+from sharesskew import SharesSkewJob  # noqa
+
+formats = [('raw', []), ('json', []), ('pickle', []),
+           ('packed', ['--packed-width', '64']),
+           ('packed', ['--packed-width', '32'])]
+
+
+def main():
+    print '%30s %16s %14s %14s' % ('dataset', 'format', 'shuffle MB',
+                                   'parse s')
+    for dataset in sys.argv[1:]:
+        lines = [line.rstrip('\n') for line in open(dataset)]
+        for internalFormat, extra in formats:
+            job = SharesSkewJob([
+                '--schemaFile', os.path.join(root, 'schema.p'),
+                '--residualsFile', os.path.join(root, 'residualjoins.p'),
+                '--sharesFile', os.path.join(root, 'shares.p'),
+                '--hhFile', os.path.join(root, 'heavyhitters.p'),
+                '--internal-format', internalFormat] + extra)
+            job.sandbox()
+            job.mapper_init()
+            job.reducer_init()
+            protocol = job.internal_protocol()
+            encoded = [protocol.write(key, value) for line in lines
+                       for key, value in job.identityMapper(None, line)]
+            shuffleBytes = sum(len(record) + 1 for record in encoded)
+
+            start = time.time()
+            for record in encoded:
+                key, value = protocol.read(record)
+                job.decodeValue(value)
+            elapsed = time.time() - start
+            name = internalFormat + ' '.join([''] + extra[1:])
+            print '%30s %16s %14.1f %14.2f' % (os.path.basename(dataset),
+                                               name, shuffleBytes / 1e6,
+                                               elapsed)
+
+
+if __name__ == '__main__':
+    main()
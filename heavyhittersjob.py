@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+""" Finds the heavy hitters of the input in one pass and writes them in the
+heavyhitters.txt format premap.readHeavyHitters reads
+
+python heavyhittersjob.py --schemaFile schema.p --threshold 0.01 \
+    input.txt > heavyhitters.txt
+"""
+import pickle
+from collections import defaultdict
+from itertools import chain, groupby
+
+from mrjob.job import MRJob
+from mrjob.protocol import RawValueProtocol
+from mrjob.step import MRStep
+
+from skew.heavyHitters import (formatHeavyHitter, fractions, joinAttributes,
+                               selectHeavyHitters)
+from skew.sketches import spaceSaving
+
+
+class HeavyHittersJob(MRJob):
+
+    INPUT_PROTOCOL = RawValueProtocol
+    OUTPUT_PROTOCOL = RawValueProtocol
+
+    def mapper_init(self):
+        self.schema = pickle.load(open(self.options.schemaFile, 'rb'))
+        attrs = (range(1, len(self.schema[0]))
+                 if self.options.all_attributes
+                 else joinAttributes(self.schema))
+        # (attribute, position of the attribute in the relation's tuples)
+        self.relationAttrs = [
+            [(attr, sum(rel[:attr])) for attr in attrs if rel[attr] == 1]
+            for rel in self.schema]
+        self.totals = defaultdict(int)
+        if self.options.method == 'spacesaving':
+            # One summary per (attribute, relation), constant memory
+            self.summaries = dict(
+                ((attr, relation), spaceSaving.fromEpsilon(
+                    self.options.epsilon))
+                for relation, attrs in enumerate(self.relationAttrs, 1)
+                for attr, position in attrs)
+
+    def countMapper(self, _, line):
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        attributeValues = tokens[1:]
+        self.totals[relation] += 1
+        for attr, position in self.relationAttrs[relation-1]:
+            yield [attr, attributeValues[position], relation], 1
+
+    def countMapper_final(self):
+        # Relation sizes are keyed on a null attribute
+        for relation, total in self.totals.iteritems():
+            yield [None, None, relation], total
+
+    def sketchMapper(self, _, line):
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        attributeValues = tokens[1:]
+        for attr, position in self.relationAttrs[relation-1]:
+            self.summaries[(attr, relation)].update(attributeValues[position])
+
+    def sketchMapper_final(self):
+        for (attr, relation), summary in self.summaries.iteritems():
+            yield [attr, relation], summary.toList()
+
+    def mergeSummaries(self, summaries):
+        merged = spaceSaving.fromList(next(summaries))
+        for summary in summaries:
+            merged.merge(spaceSaving.fromList(summary))
+        return merged
+
+    def sketchCombiner(self, key, summaries):
+        yield key, self.mergeSummaries(summaries).toList()
+
+    def sketchReducer(self, key, summaries):
+        """ Emits the estimated counts of the summary of an attribute and
+        relation in the format of sumReducer
+        """
+        attr, relation = key
+        merged = self.mergeSummaries(summaries)
+        yield attr, [0, relation, merged.total]
+        for value, count, error in merged.items():
+            yield attr, [1, value, relation, count]
+
+    def sumCombiner(self, key, counts):
+        yield key, sum(counts)
+
+    def sumReducer_init(self):
+        self.schema = pickle.load(open(self.options.schemaFile, 'rb'))
+        self.attributes = (range(1, len(self.schema[0]))
+                           if self.options.all_attributes
+                           else joinAttributes(self.schema))
+
+    def sumReducer(self, key, counts):
+        """ Sends the counts of an attribute to a single reducer. Relation
+        sizes are sent to every attribute, tagged 0 so that they sort
+        before the value counts, tagged 1.
+        """
+        attr, value, relation = key
+        count = sum(counts)
+        if attr is None:
+            for attr in self.attributes:
+                if self.schema[relation-1][attr] == 1:
+                    yield attr, [0, relation, count]
+        else:
+            yield attr, [1, value, relation, count]
+
+    def selectReducer_init(self):
+        self.schema = pickle.load(open(self.options.schemaFile, 'rb'))
+
+    def selectReducer(self, attr, records):
+        """ Relation sizes arrive first, then the counts of every value
+        grouped together, thanks to the secondary sort
+        """
+        totals = {}
+        counts = []
+        for record in records:
+            if record[0] == 0:
+                totals[record[1]] = record[2]
+            else:
+                counts.append(record)
+                break
+
+        def candidates():
+            for value, group in groupby(chain(counts, records),
+                                        key=lambda record: record[1]):
+                valueCounts = dict((relation, count)
+                                   for tag, v, relation, count in group)
+                yield int(value), fractions(self.schema, attr, valueCounts,
+                                            totals)
+
+        for value, f in selectHeavyHitters(candidates(),
+                                           self.options.threshold,
+                                           self.options.top_k):
+            yield None, formatHeavyHitter(attr, value, f)
+
+    def configure_options(self):
+        super(HeavyHittersJob, self).configure_options()
+        self.add_passthrough_option(
+            '--threshold', type=float, default=0.01,
+            help="Minimum fraction of a relation's tuples a heavy hitter "
+                 "value holds, in at least one relation")
+        self.add_passthrough_option(
+            '--top-k', type=int, default=0,
+            help="Keep at most this many heavy hitters per attribute, the "
+                 "most frequent first. 0 keeps all above --threshold")
+        self.add_passthrough_option(
+            '--method', default='exact', choices=['exact', 'spacesaving'],
+            help="Count every value, or keep a SpaceSaving summary of "
+                 "ceil(1 / --epsilon) values per attribute and relation")
+        self.add_passthrough_option(
+            '--epsilon', type=float, default=0.001,
+            help="With --method spacesaving, the estimated fractions exceed "
+                 "the true ones by at most this much")
+        self.add_passthrough_option(
+            '--all-attributes', action='store_true', default=False,
+            help="Also look for heavy hitters on attributes of a single "
+                 "relation, which never take part in a join")
+        self.add_file_option('--schemaFile')
+
+    def load_options(self, args):
+        super(HeavyHittersJob, self).load_options(args)
+        if (self.options.method == 'spacesaving' and
+                self.options.epsilon >= self.options.threshold):
+            self.option_parser.error(
+                '--epsilon must be smaller than --threshold')
+
+    def sort_values(self):
+        return True
+
+    def steps(self):
+        if self.options.method == 'spacesaving':
+            count = MRStep(
+                mapper_init=self.mapper_init,
+                mapper=self.sketchMapper,
+                mapper_final=self.sketchMapper_final,
+                combiner=self.sketchCombiner,
+                reducer=self.sketchReducer
+            )
+        else:
+            count = MRStep(
+                mapper_init=self.mapper_init,
+                mapper=self.countMapper,
+                mapper_final=self.countMapper_final,
+                combiner=self.sumCombiner,
+                reducer_init=self.sumReducer_init,
+                reducer=self.sumReducer
+            )
+        return [
+            count,
+            MRStep(
+                reducer_init=self.selectReducer_init,
+                reducer=self.selectReducer
+            )
+        ]
+
+
+if __name__ == '__main__':
+    HeavyHittersJob.run()
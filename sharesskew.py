@@ -3,7 +3,7 @@ import pickle
 import sys
 from collections import defaultdict
 from copy import deepcopy
-from itertools import imap, product
+from itertools import chain, imap, product
 
 import mrjob
 from mrjob.job import MRJob
@@ -13,6 +13,19 @@ from mrjob.protocol import (BytesProtocol, BytesValueProtocol, JSONProtocol,
                             TextProtocol, UltraJSONProtocol)
 from mrjob.step import MRStep
 
+from skew.broadcastJoin import (BROADCAST_PARTS, broadcastIndex, broadcastKey,
+                                isBroadcastKey, residualKey, spreadKey)
+from skew.cellIndex import PARTITIONER, PARTITIONER_JOBCONF, cellIndex
+from skew.graceJoin import graceHashJoin
+from skew.hashing import HASH_FUNCTIONS, attributeHash
+from skew.joinEngine import (countValue, extendTupleValue, multiwayJoin,
+                             parseCountedValue, parseValue, privateAttributes,
+                             projectTuple, relationOrder, splitCount, trieJoin)
+from skew.queryPlan import keyPlanId, queryPlan
+from skew.router import residualRouter
+from skew.valueCodec import PackedValueProtocol, packedCodec
+from skew.shareGrid import shareGrid
+
 
 def hasHH(attr, hhs):
     for hh in hhs:
@@ -65,16 +78,6 @@ def decideFromAllResiduals(inputTuple, residualJoins, hhs):
         print decideSingleResidual(inputTuple, residualJoin, hhs)
 
 
-def extendTupleValue(attributeValues, relationSchema):
-    extendedAttributeValues = ['_']*len(relationSchema)
-    j = 0
-    for i, v in enumerate(relationSchema):
-        if v == 1:
-            extendedAttributeValues[i] = attributeValues[j]
-            j += 1
-    return extendedAttributeValues
-
-
 def extendHeavyHittersValues(attributeValues, databaseSchema):
     extendedAttributeValues = [0]*len(databaseSchema[0])
     j = 0
@@ -107,6 +110,9 @@ class SharesSkewJob(MRJob):
 #     OUTPUT_PROTOCOL = JSONProtocol
 
     def mapper_init(self):
+        if self.options.planFile:
+            self.plans = self.loadPlans()
+            return
         self.schema = pickle.load(open(self.options.schemaFile, 'rb'))
         self.residuals = pickle.load(open(self.options.residualsFile, 'rb'))
         self.heavyhitters = pickle.load(open(self.options.hhFile, 'rb'))
@@ -123,6 +129,53 @@ class SharesSkewJob(MRJob):
         for t in self.heavyhitters:
             for k, v in t.iteritems():
                 self.hhinvertedIndex[(k, v)] = "HH"
+        self.router = residualRouter(
+            self.schema, self.residuals, self.hhinvertedIndex)
+        # Shares, replicated coordinates and key prefixes per
+        # (relation, residual join); self.shares is no longer mutated
+        self.grid = shareGrid(
+            self.schema, self.residuals, self.shares, self.heavyhitters,
+            self.attributeHash(len(self.schema[0])))
+        if self.options.key_format == 'cell':
+            # Dense integer cell ids, partitioned exactly to reduce tasks
+            self.cells = cellIndex(self.grid, self.options.reduce_number)
+            if self.options.splitsFile:
+                self.cells.split(self.loadSplits())
+            self.routeKeys = self.cells.keys
+            coordinateKeys = self.cells.coordinateKeys
+        else:
+            self.routeKeys = self.grid.keys
+            coordinateKeys = self.grid.coordinateKeys
+        if self.options.secondary_sort:
+            # Values are prefixed with the rank of their relation, so that
+            # a bucket arrives ordered by relation, smallest first
+            self.relationRanks = dict(
+                (relation, rank)
+                for rank, relation in enumerate(self.loadRelationOrder()))
+        if self.options.internal_format == 'packed':
+            self.codec = packedCodec(self.schema, self.options.packed_width)
+        # Counting combined tuples, values drop the attributes no join
+        # compares, so that tuples differing only there combine
+        self.projected = []
+        if self.projectValues():
+            self.projected = privateAttributes(self.schema)
+        # Residual joins joined map-side, against their large relation
+        self.broadcastResiduals = {}
+        if self.options.broadcastFile:
+            with open(self.options.broadcastFile, 'rb') as f:
+                self.broadcast = broadcastIndex(self.schema, pickle.load(f))
+            self.broadcastResiduals = self.broadcast.large
+            self.broadcastCounts = defaultdict(int)
+        if self.options.batch_size or self.options.binary_input:
+            # NumPy is only needed by the batch and binary mappers
+            from skew.batchRouting import batchRouter
+            self.batch = batchRouter(
+                self.schema, self.router, self.grid, coordinateKeys,
+                self.cells.splitResiduals
+                if self.options.key_format == 'cell' else None)
+            self.blocks = defaultdict(list)
+            # Memory-mapped column files of --binary-input, by name
+            self.columnFiles = {}
 #         print self.schema
 #         print self.residuals
 #         print self.shares2
@@ -135,40 +188,248 @@ class SharesSkewJob(MRJob):
         # Relations are numbered R1, R2, ..., whereas schema array is 0-numbered
         thisRelSchema = self.schema[relation-1]
         inputTuple = extendTupleValue(attributeValues, thisRelSchema)
-        inputTupleShortened = [
-            0 if v == '_' else int(v) for v in inputTuple[1:]]
-        keylist = []
-        for residualJoin, residualShare, hhShare in zip(self.residuals, self.shares, self.hhSharesResiduals):
-            if decideSingleResidual(inputTuple, residualJoin, self.heavyhitters, self.hhinvertedIndex) == True:
-                # Adds the HH share which is always == 1
-                residualShare.update(hhShare)
-                # Some shares(==1) may be missing from the schema because they were not calcaulatied by the MINLPSolver
-                for i in xrange(1, 5):
-                    try:
-                        residualShare[str(i)]
-                    except:
-                        residualShare[str(i)] = 1
-                ranges = list(imap(range, [residualShare[k]
-                                           for k in sorted(residualShare)]))
-                ranges = [[val % len(share)] if h == 1 else share
-                          for h, share, val in zip(thisRelSchema[1:], ranges, inputTupleShortened)]
-#                 counter = 0
-                residualJoinKeyPart = '-'.join(residualJoin)
-
-                for key in product(*ranges):
-                    #                     key.append(residualJoinKeyPart)
-                    key = (residualJoinKeyPart,) + key
-                    # Hold keys for all residual in a (small = O(k*|residualJoins|)) list
-                    keylist.append(key)
-#                 self.increment_counter('group', 'keylist size', 1)
-#         # Remove duplicates
-        keyset = set(keylist)
-        for key in keyset:
-            self.increment_counter('group', 'intermediate_tuples', 1)
-#             yield key, (relation, inputTuple)
-            inputTuple2 = "+".join(inputTuple)
-
-            yield '.'.join([str(x) for x in key]), str(relation) + ":" + str(inputTuple2)
+        rank = (self.relationRanks[relation]
+                if self.options.secondary_sort else 0)
+        valueTuple = inputTuple
+        if self.projected:
+            valueTuple = projectTuple(
+                inputTuple, self.projected,
+                '0' if self.options.internal_format == 'packed' else '_')
+        if self.options.internal_format == 'packed':
+            value = self.codec.pack(relation, valueTuple, rank)
+        else:
+            value = str(relation) + ":" + "+".join(valueTuple)
+            if self.options.secondary_sort:
+                value = '%02d:' % rank + value
+        # Only the residual joins matching the tuple's HH signature
+        for residualId in self.router.route(relation-1, inputTuple):
+            if residualId in self.broadcastResiduals:
+                if self.broadcastResiduals[residualId] == relation:
+                    for pair in self.broadcastJoin(residualId, [inputTuple]):
+                        yield pair
+                continue
+            # Keys of a residual are distinct and carry the residual prefix
+            keys = self.routeKeys(relation-1, residualId, inputTuple)
+            self.increment_counter('group', 'intermediate_tuples', len(keys))
+            for key in keys:
+                yield key, value
+
+    def loadSplits(self):
+        """ The splits of --splitsFile, checked against the job """
+        with open(self.options.splitsFile, 'rb') as f:
+            splits = pickle.load(f)
+        if splits['reducers'] != self.options.reduce_number:
+            raise ValueError('%s splits cells for %d reduce tasks, not %d' % (
+                self.options.splitsFile, splits['reducers'],
+                self.options.reduce_number))
+        hashing = (self.options.hash_function, self.options.hash_seed)
+        if splits.get('hashing', hashing) != hashing:
+            raise ValueError('%s splits cells hashed with %s seed %d' % (
+                (self.options.splitsFile,) + splits['hashing']))
+        return splits
+
+    def loadPlans(self):
+        """ The queryPlan of every --planFile, in order """
+        plans = []
+        for planId, filename in enumerate(self.options.planFile):
+            with open(filename, 'rb') as f:
+                plans.append(queryPlan(
+                    planId, pickle.load(f), self.options.key_format,
+                    self.options.reduce_number,
+                    self.options.internal_format, self.options.packed_width,
+                    self.projectValues(), self.attributeHash))
+        return plans
+
+    def attributeHash(self, numberAttributes):
+        """ The attributeHash of --hash-function and --hash-seed """
+        return attributeHash(self.options.hash_function,
+                             self.options.hash_seed, numberAttributes)
+
+    def projectValues(self):
+        """ Whether values drop the attributes no join compares """
+        return self.options.combine and self.options.join_output == 'count'
+
+    def multiPlanMapper(self, _, line):
+        """ identityMapper for every --planFile: the line is read and split
+        once, then routed under each plan with plan tagged keys
+        """
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        attributeValues = tokens[1:]
+        for plan in self.plans:
+            if relation > len(plan.schema):
+                # Not a relation of this plan's query
+                continue
+            inputTuple = extendTupleValue(attributeValues,
+                                          plan.schema[relation-1])
+            keys = plan.keys(relation-1, inputTuple)
+            if not keys:
+                continue
+            value = plan.value(relation, inputTuple,
+                               self.options.secondary_sort)
+            self.increment_counter('group', 'intermediate_tuples', len(keys))
+            for key in keys:
+                yield key, value
+
+    def batchMapper(self, _, line):
+        """ Buffers the lines of every relation into blocks of
+        --batch-size lines, routed together by routeBlock
+        """
+        tag = line[:line.index(' ')]
+        block = self.blocks[tag]
+        block.append(line)
+        if len(block) < self.options.batch_size:
+            return ()
+        del self.blocks[tag]
+        return self.routeBlock(int(tag[1:]), block)
+
+    def batchMapper_final(self):
+        blocks = self.blocks.items()
+        self.blocks.clear()
+        return chain.from_iterable(self.routeBlock(int(tag[1:]), block)
+                                   for tag, block in blocks)
+
+    def broadcastJoin(self, residualId, probeTuples):
+        """ Joins tuples of the large relation of a broadcast residual join
+        map-side. Joined tuples are spread by their hash over the keys of
+        the parts of the residual join, counts are summed and emitted by
+        broadcastMapper_final.
+        """
+        if self.options.join_output == 'count':
+            count = self.broadcast.join(residualId, probeTuples,
+                                        countOnly=True)
+            self.broadcastCounts[residualId] += count
+            return ()
+        parts = self.options.reduce_number or BROADCAST_PARTS
+        labels = (self.cells.labels if self.options.key_format == 'cell'
+                  else None)
+        values = ('t:' + '+'.join(str(x) for x in joined)
+                  for joined in self.broadcast.join(residualId, probeTuples))
+        return ((spreadKey(residualId, hash(value) % parts, labels), value)
+                for value in values)
+
+    def broadcastMapper_final(self):
+        if self.options.batch_size:
+            # The last blocks add to the counts
+            for pair in self.batchMapper_final():
+                yield pair
+        for residualId, count in self.broadcastCounts.iteritems():
+            if count:
+                yield broadcastKey(residualId), 'c:%d' % count
+        self.broadcastCounts.clear()
+
+    def binaryMapper(self, _, line):
+        """ Routes the rows of a --binary-input manifest line, a split of a
+        memory-mapped column file, in views of --batch-size rows
+        """
+        from skew.binaryInput import columnFile, parseManifestLine
+        filename, start, end = parseManifestLine(line)
+        if filename not in self.columnFiles:
+            self.columnFiles[filename] = columnFile(filename)
+        columns = self.columnFiles[filename]
+        step = self.options.batch_size or 65536
+        return chain.from_iterable(
+            self.routeRows(columns.relation, columns.rows(first, min(
+                first + step, end)))
+            for first in xrange(start, end, step))
+
+    def routeBlock(self, relation, lines):
+        """ The same (key, value) multiset identityMapper emits for the
+        lines, grouped by residual join and coordinates. The pairs are
+        expanded by itertools rather than yielded one by one.
+        """
+        try:
+            block = self.batch.parse(relation-1, lines)
+        except ValueError:
+            width = sum(self.schema[relation-1])
+            if any(line.count(' ') != width for line in lines):
+                raise
+            # Values that are not integers, eg 'id40', are hashed from their
+            # bytes, and non-canonical ones, eg '021', are not heavy hitters,
+            # one line at a time
+            return chain.from_iterable(
+                self.identityMapper(None, line) for line in lines)
+        return self.routeRows(relation, block, lines)
+
+    def routeRows(self, relation, block, lines=None):
+        """ routeBlock of a parsed block, whose text values are formatted
+        from the block if the lines are not given
+        """
+        rank = (self.relationRanks[relation]
+                if self.options.secondary_sort else None)
+        if self.options.internal_format == 'packed':
+            valueBlock = block
+            if self.projected:
+                valueBlock = block.copy()
+                for attr in self.projected:
+                    if self.schema[relation-1][attr] == 1:
+                        valueBlock[:, self.batch.columns[relation-1][attr]] = 0
+            values = self.batch.packedValues(self.codec, relation, valueBlock,
+                                             rank or 0)
+        elif lines is None:
+            values = self.batch.blockTextValues(relation, block, rank,
+                                                self.projected)
+        else:
+            values = self.batch.textValues(relation, lines, rank,
+                                           self.projected)
+        pairs = []
+        intermediate = 0
+        for residualId, code, rows in self.batch.groups(relation-1, block):
+            if residualId in self.broadcastResiduals:
+                if self.broadcastResiduals[residualId] == relation:
+                    pairs.append(self.broadcastJoin(
+                        residualId, [extendTupleValue(
+                            lines[row].split(' ')[1:] if lines is not None
+                            else [str(v) for v in block[row]],
+                            self.schema[relation-1]) for row in rows]))
+                continue
+            keys = self.batch.keys(relation-1, residualId, code)
+            intermediate += len(keys) * len(rows)
+            pairs.append(product(keys, [values[row] for row in rows]))
+        self.increment_counter('group', 'intermediate_tuples', intermediate)
+        return chain.from_iterable(pairs)
+
+    def combiner_init(self):
+        # Packed values are split from their multiplicity by the codec of
+        # their plan's schema
+        self.countCodecs = None
+        if self.options.internal_format == 'packed':
+            if self.options.planFile:
+                schemas = [pickle.load(open(filename, 'rb'))['schema']
+                           for filename in self.options.planFile]
+            else:
+                schemas = [pickle.load(open(self.options.schemaFile, 'rb'))]
+            self.countCodecs = [packedCodec(schema, self.options.packed_width)
+                                for schema in schemas]
+
+    def combiner(self, bucket, values):
+        """ Collapses the identical values of a bucket into one value with
+        a multiplicity count. The combiner may run several times, so values
+        may already carry a count.
+        """
+        if isBroadcastKey(bucket):
+            for value in values:
+                yield bucket, value
+            return
+        split, join = splitCount, countValue
+        if self.countCodecs:
+            codec = self.countCodecs[keyPlanId(bucket)
+                                     if self.options.planFile else 0]
+            split, join = codec.splitCount, codec.countValue
+        counts = defaultdict(int)
+        valuesIn = 0
+        for value in values:
+            value, count = split(value)
+            counts[value] += count
+            valuesIn += 1
+        self.increment_counter('combiner', 'values in', valuesIn)
+        self.increment_counter('combiner', 'values out', len(counts))
+        combined = [join(value, count) for value, count in counts.iteritems()]
+        if self.options.secondary_sort:
+            # Spills are merged on the assumption they are sorted
+            combined.sort()
+        for value in combined:
+            yield bucket, value
 
     def mapper(self, _, line):
         tokens = line.split(' ')
@@ -207,6 +468,164 @@ class SharesSkewJob(MRJob):
             yield key, (relation, inputTuple)
 #             yield key
 
+    def loadRelationOrder(self):
+        """ The 1-numbered relations, smallest first according to
+        --sizesFile (relationsizes.txt format), or in schema order.
+        """
+        if not self.options.sizesFile:
+            return range(1, len(self.schema) + 1)
+        # The planner, and NumPy with it, is only needed with a sizes file
+        from skew import premap
+        return relationOrder(premap.readRelationSizes(self.options.sizesFile))
+
+    def reducer_init(self):
+        if self.options.planFile:
+            # The join state of every plan, swapped in per bucket
+            self.planStates = []
+            for plan in self.loadPlans():
+                self.schema = plan.schema
+                self.initJoin()
+                self.probeRelation = plan.relationOrder()[-1]
+                self.planStates.append((self.schema, self.joinEngine,
+                                        self.decodeValue,
+                                        self.probeRelation))
+            return
+        self.schema = pickle.load(open(self.options.schemaFile, 'rb'))
+        self.initJoin()
+        # With secondary sort the largest relation arrives last
+        self.probeRelation = self.loadRelationOrder()[-1]
+
+    def initJoin(self):
+        """ The join engine and value decoder of self.schema """
+        if self.options.join_algorithm == 'trie':
+            self.joinEngine = trieJoin(self.schema)
+        else:
+            self.joinEngine = multiwayJoin(self.schema)
+        self.joinMemory = (self.options.join_memory_mb * 1024 * 1024
+                           if self.options.join_memory_mb else float('inf'))
+        if self.options.internal_format == 'packed':
+            codec = packedCodec(self.schema, self.options.packed_width)
+            self.decodeValue = (codec.unpackCounted if self.options.combine
+                                else codec.unpack)
+        else:
+            # Combined values decode to (tuple, multiplicity) pairs, joined
+            # by the weighted join of the engines
+            self.decodeValue = (parseCountedValue if self.options.combine
+                                else parseValue)
+
+    def broadcastReducer(self, bucket, values):
+        """ Sums the map-side join counts of broadcast residual joins, or
+        passes their joined tuples through, and joins the other buckets
+        """
+        if not isBroadcastKey(bucket):
+            if self.options.secondary_sort:
+                return self.streamingJoinReducer(bucket, values)
+            return self.joinReducer(bucket, values)
+        return self.mapSideResults(bucket, values)
+
+    def mapSideResults(self, bucket, values):
+        bucket = residualKey(bucket)
+        if self.options.join_output == 'count':
+            count = sum(int(value[2:]) for value in values)
+            self.increment_counter('group', 'join results', count)
+            yield bucket, count
+        else:
+            count = 0
+            for value in values:
+                count += 1
+                yield bucket, value[2:]
+            self.increment_counter('group', 'join results', count)
+
+    def multiPlanReducer(self, bucket, values):
+        """ Joins a bucket with the join state of its plan """
+        (self.schema, self.joinEngine, self.decodeValue,
+         self.probeRelation) = self.planStates[keyPlanId(bucket)]
+        if self.options.secondary_sort:
+            return self.streamingJoinReducer(bucket, values)
+        return self.joinReducer(bucket, values)
+
+    def countMultiplicities(self, entries):
+        """ Counts the values a bucket received and the tuples they stand
+        for, whose ratio is the shuffle reduction of the combiner
+
+        Input:  entries     The decoded (relation, (tuple, multiplicity))
+                            values of the bucket, passed through
+        """
+        values = tuples = 0
+        for entry in entries:
+            values += 1
+            tuples += entry[1][1]
+            yield entry
+        self.increment_counter('combiner', 'reducer values', values)
+        self.increment_counter('combiner', 'reducer tuples', tuples)
+
+    def bucketEntries(self, values):
+        """ The decoded (relation, tuple) values of a bucket """
+        entries = imap(self.decodeValue, values)
+        if self.options.combine:
+            return self.countMultiplicities(entries)
+        return entries
+
+    def bucketJoin(self, probe=None):
+        """ The graceHashJoin of a bucket, which spills once its tables
+        exceed --join-memory-mb
+        """
+        return graceHashJoin(self.joinEngine, self.joinMemory,
+                             self.options.spill_partitions,
+                             weighted=self.options.combine, probe=probe)
+
+    def countSpills(self, join):
+        """ Counts the spill files and partitions of a joined bucket """
+        if join.partitions:
+            self.increment_counter('join', 'spilled buckets', 1)
+            self.increment_counter('join', 'spilled bytes', join.spilledBytes)
+            self.increment_counter('join', 'spill partitions',
+                                   join.partitions)
+
+    def joinReducer(self, bucket, values):
+        self.increment_counter('group', 'reducers raised', 1)
+        join = self.bucketJoin()
+        add = join.add
+        for relation, v in self.bucketEntries(values):
+            add(relation-1, v)
+        if self.options.join_output == 'count':
+            count = join.join(countOnly=True)
+            self.increment_counter('group', 'join results', count)
+            yield bucket, count
+        else:
+            count = 0
+            for joined in join.join():
+                count += 1
+                yield bucket, '+'.join(str(x) for x in joined)
+            self.increment_counter('group', 'join results', count)
+        self.countSpills(join)
+
+    def streamingJoinReducer(self, bucket, values):
+        """ Hashes the build relations, which arrive first thanks to the
+        secondary sort, and streams the probe relation from the iterator.
+        """
+        self.increment_counter('group', 'reducers raised', 1)
+        probe = self.probeRelation - 1
+        join = self.bucketJoin(probe)
+        entries = self.bucketEntries(values)
+        probeTuples = iter(())
+        for relation, v in entries:
+            if relation == self.probeRelation:
+                probeTuples = chain([v], (v for _, v in entries))
+                break
+            join.add(relation-1, v)
+        if self.options.join_output == 'count':
+            count = join.streamJoin(probe, probeTuples, countOnly=True)
+            self.increment_counter('group', 'join results', count)
+            yield bucket, count
+        else:
+            count = 0
+            for joined in join.streamJoin(probe, probeTuples):
+                count += 1
+                yield bucket, '+'.join(str(x) for x in joined)
+            self.increment_counter('group', 'join results', count)
+        self.countSpills(join)
+
     def dummy_reducer(self, bucket, values):
         self.increment_counter('group', 'reducers raised', 1)
         count = 0
@@ -366,8 +785,60 @@ class SharesSkewJob(MRJob):
             help='Number of Reduce tasks.'
         )
         self.add_passthrough_option(
-            '--internal-format', default='json', choices=['pickle', 'json', 'raw'],
+            '--internal-format', default='json',
+            choices=['pickle', 'json', 'raw', 'packed'],
             help="Specify the internal format of the job")
+        self.add_passthrough_option(
+            '--packed-width', default='64', choices=['32', '64'],
+            help="Bits per attribute value with --internal-format packed")
+        self.add_passthrough_option(
+            '--key-format', default='string', choices=['string', 'cell'],
+            help="Reducer keys: residual and coordinates as a string, or "
+                 "integer cell ids partitioned exactly to --reduce-number "
+                 "reduce tasks")
+        self.add_passthrough_option(
+            '--join-output', default='count', choices=['count', 'tuples'],
+            help="Emit the number of joined tuples per bucket or the "
+                 "joined tuples themselves")
+        self.add_passthrough_option(
+            '--join-algorithm', default='hash', choices=['hash', 'trie'],
+            help="Reducer join: pipelined hash joins, or a worst-case "
+                 "optimal join over sorted tries for cyclic queries")
+        self.add_passthrough_option(
+            '--secondary-sort', action='store_true', default=False,
+            help="Sort each bucket by relation, smallest first, and stream "
+                 "the largest relation through the reducer join")
+        self.add_passthrough_option(
+            '--join-memory-mb', type=float, default=0,
+            help="Estimated memory of the tables of a bucket join beyond "
+                 "which they are hash partitioned to local spill files and "
+                 "joined a partition at a time. 0 joins in memory")
+        self.add_passthrough_option(
+            '--spill-partitions', type=int, default=16,
+            help="Partitions of a bucket spilled by --join-memory-mb")
+        self.add_passthrough_option(
+            '--batch-size', type=int, default=0,
+            help="Route mapper input in NumPy blocks of this many lines per "
+                 "relation, eg 65536. 0 routes one line at a time")
+        self.add_passthrough_option(
+            '--hash-function', default='modulo', choices=HASH_FUNCTIONS,
+            help="Hash of the join attribute values reduced modulo the "
+                 "shares: the integer value itself, or a seeded "
+                 "multiply-shift hash that spreads clustered ids. Values "
+                 "that are not integers are hashed from their bytes")
+        self.add_passthrough_option(
+            '--hash-seed', type=int, default=0,
+            help="Seed of the per attribute --hash-function parameters")
+        self.add_passthrough_option(
+            '--combine', action='store_true', default=False,
+            help="Collapse duplicate (key, value) pairs before the shuffle "
+                 "into one value with a multiplicity count, which the "
+                 "reducer join multiplies out")
+        self.add_passthrough_option(
+            '--binary-input', action='store_true', default=False,
+            help="The input is the manifest of column files written by "
+                 "skew/binaryInput.py, routed from memory-mapped NumPy "
+                 "views without parsing text")
         self.add_passthrough_option(
             '--jobname', default='myjob',
             help="Specify the name of the job")
@@ -376,6 +847,21 @@ class SharesSkewJob(MRJob):
         self.add_file_option('--sharesFile')
         self.add_file_option('--hhFile')
         self.add_file_option('--hhInvertedIndexFile')
+        self.add_file_option('--sizesFile')
+        self.add_file_option(
+            '--planFile', action='append', default=None,
+            help="A plan written by premap.py --plan-file. Repeat it to "
+                 "route every tuple under several plans in one scan, with "
+                 "plan tagged keys; the single plan file options are then "
+                 "ignored")
+        self.add_file_option(
+            '--splitsFile',
+            help="The splits.p of skew/cellSplits.py. Its overloaded cells "
+                 "are replaced by sub-cells on their own reduce tasks")
+        self.add_file_option(
+            '--broadcastFile',
+            help="The side file of skew/broadcastJoin.py. Its residual "
+                 "joins are joined map-side instead of shuffled")
 
     def jobconf(self):
         orig_jobconf = super(SharesSkewJob, self).jobconf()
@@ -390,9 +876,41 @@ class SharesSkewJob(MRJob):
             #                         'mapred.reduce.tasks': 256,
 
         }
+        if self.options.key_format == 'cell':
+            custom_jobconf.update(PARTITIONER_JOBCONF)
+            custom_jobconf['mapreduce.job.reduces'] = self.options.reduce_number
 
         return mrjob.conf.combine_dicts(orig_jobconf, custom_jobconf)
 
+    def partitioner(self):
+        if self.options.key_format == 'cell':
+            return PARTITIONER
+        return super(SharesSkewJob, self).partitioner()
+
+    def load_options(self, args):
+        super(SharesSkewJob, self).load_options(args)
+        if (self.options.key_format == 'cell' and
+                not self.options.reduce_number):
+            self.option_parser.error(
+                '--key-format cell requires --reduce-number')
+        if self.options.planFile and self.options.batch_size:
+            self.option_parser.error(
+                '--planFile routes one line at a time, without --batch-size')
+        if self.options.planFile and self.options.binary_input:
+            self.option_parser.error(
+                '--binary-input applies to a single plan, not --planFile')
+        if self.options.splitsFile and (self.options.key_format != 'cell' or
+                                        self.options.planFile):
+            self.option_parser.error(
+                '--splitsFile applies to a single plan with --key-format '
+                'cell')
+        if self.options.planFile and self.options.broadcastFile:
+            self.option_parser.error(
+                '--broadcastFile applies to a single plan, not --planFile')
+
+    def sort_values(self):
+        return self.options.secondary_sort
+
     def internal_protocol(self):
         if self.options.internal_format == 'json':
             return StandardJSONProtocol()
@@ -400,16 +918,42 @@ class SharesSkewJob(MRJob):
             return PickleProtocol()
         elif self.options.internal_format == 'raw':
             return RawProtocol()
+        elif self.options.internal_format == 'packed':
+            return PackedValueProtocol()
 
     def steps(self):
+        combiner_init = combiner = None
+        if self.options.combine:
+            combiner_init, combiner = self.combiner_init, self.combiner
+        if self.options.planFile:
+            return [MRStep(mapper_init=self.mapper_init,
+                           mapper=self.multiPlanMapper,
+                           combiner_init=combiner_init,
+                           combiner=combiner,
+                           reducer_init=self.reducer_init,
+                           reducer=self.multiPlanReducer)]
         return [
             MRStep(
                 mapper_init=self.mapper_init,
                 #                    mapper=self.mapper,
-                mapper=self.identityMapper,
+                mapper=(self.binaryMapper if self.options.binary_input
+                        else self.batchMapper if self.options.batch_size
+                        else self.identityMapper),
+                mapper_final=(self.broadcastMapper_final
+                              if self.options.broadcastFile
+                              else self.batchMapper_final
+                              if self.options.batch_size else None),
                 #                    combiner=self.combiner_count_words,
+                combiner_init=combiner_init,
+                combiner=combiner,
+                reducer_init=self.reducer_init,
                 # reducer=self.hashReducer,
-                reducer=self.countReducer,
+                # reducer=self.countReducer,
+                reducer=(self.broadcastReducer
+                         if self.options.broadcastFile
+                         else self.streamingJoinReducer
+                         if self.options.secondary_sort
+                         else self.joinReducer),
                 #                    reducer=self.dummy_reducer
             )
         ]
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+
+""" batchRouter Class
+
+    Routes a block of input lines of one relation at a time: the lines are
+    parsed into a NumPy integer array, heavy hitter membership and hash
+    coordinates are computed column-wise, and the replicated keys of every
+    distinct coordinate are expanded once per block.
+
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# Integer tokens the text mapper does not take for their integer: a '+'
+# sign, leading zeros or '-0'
+NONCANONICAL = re.compile(r'(?:^| )(?:\+|-?0\d|-0(?: |$))')
+
+
+class batchRouter(object):
+
+    def __init__(self, schema, router, grid, routeKeys, splits=None):
+        """ Input:  schema      The binary schema, as loaded from schema.p
+                    router      The residualRouter of the plan
+                    grid        The shareGrid of the plan
+                    routeKeys   The key function of the mapper over
+                                coordinates, shareGrid.coordinateKeys or
+                                cellIndex.coordinateKeys
+                    splits      The split attribute and factor of the split
+                                residual joins, cellIndex.splitResiduals.
+                                Their codes end with the sub-cell digit
+                                routeKeys takes last
+        """
+        self.schema = schema
+        self.grid = grid
+        self.routeKeys = routeKeys
+        self.splits = splits or {}
+        self.numberAttributes = len(schema[0])
+        # Columns of the parsed block, one per attribute of the relation
+        self.relationAttrs = [[attr for attr, v in enumerate(rel) if v == 1]
+                              for rel in schema]
+        self.columns = [dict((attr, i) for i, attr in enumerate(attrs))
+                        for attrs in self.relationAttrs]
+        # Sorted integer HH values per attribute
+        hhValues = defaultdict(set)
+        for attr, value in router.hhinvertedIndex:
+            hhValues[attr].add(int(value))
+        self.hhValues = dict((attr, np.array(sorted(values), dtype=np.int64))
+                             for attr, values in hhValues.iteritems())
+        self.relationHHAttrs = router.relationHHAttrs
+        self.routes = [self.compileSignatures(relation, routes)
+                       for relation, routes in enumerate(router.routes)]
+        self.keyCache = {}
+
+    def compileSignatures(self, relation, routes):
+        """ Re-keys the router's signature dict by integer signature code.
+
+        The code of a signature is mixed radix over the HH attributes of
+        the relation, with digit 0 for an ordinary value and i + 1 for the
+        i-th HH value of the attribute.
+
+        Output: A dict from a signature code to a list of residual ids
+        """
+        codes = {}
+        for signature, residualIds in routes.iteritems():
+            code = 0
+            for attr, value in zip(self.relationHHAttrs[relation], signature):
+                values = self.hhValues.get(attr, np.array([], dtype=np.int64))
+                if value == '_':
+                    digit = 0
+                else:
+                    digit = np.searchsorted(values, int(value))
+                    if digit == len(values) or values[digit] != int(value):
+                        # Not a HH value, no tuple has this signature
+                        break
+                    digit += 1
+                code = code * (len(values) + 1) + digit
+            else:
+                codes[int(code)] = residualIds
+        return codes
+
+    def parse(self, relation, lines):
+        """ Parses a block of lines of a relation. Blocks with values that
+        are not integers in canonical form raise a ValueError, the mapper
+        routes them line by line.
+
+        Input:  relation    The 0-numbered relation
+                lines       Input lines eg ['R1 10 21', 'R1 11 0']
+        Output: An int64 array with a row per line and a column per
+                attribute of the relation
+        """
+        width = len(self.relationAttrs[relation])
+        if not lines:
+            return np.zeros((0, width), dtype=np.int64)
+        if any(line.count(' ') != width for line in lines):
+            raise ValueError('Malformed line in block of R%d' % (relation+1))
+        # Every line of a block starts with the same relation name
+        name = lines[0][:lines[0].index(' ') + 1]
+        text = ' '.join(lines).replace(name, '')
+        if NONCANONICAL.search(text):
+            raise ValueError('Integers not written in canonical form in '
+                             'block of R%d' % (relation+1))
+        block = np.fromstring(text, dtype=np.int64, sep=' ')
+        if len(block) != width * len(lines):
+            raise ValueError('Malformed line in block of R%d' % (relation+1))
+        return block.reshape(len(lines), width)
+
+    def signatures(self, relation, block):
+        """ The HH signature code of every row, see compileSignatures """
+        codes = np.zeros(len(block), dtype=np.int64)
+        for attr in self.relationHHAttrs[relation]:
+            values = self.hhValues.get(attr, np.array([], dtype=np.int64))
+            column = block[:, self.columns[relation][attr]]
+            digits = np.where(np.isin(column, values),
+                              np.searchsorted(values, column) + 1, 0)
+            codes = codes * (len(values) + 1) + digits
+        return codes
+
+    def coordinates(self, relation, residualId, block):
+        """ The row-major code of the hashed coordinates of every row on
+        the relation's own attributes
+        """
+        vector = self.grid.shareVectors[residualId]
+        codes = np.zeros(len(block), dtype=np.int64)
+        for attr in self.grid.ownAttrs[relation]:
+            column = self.grid.hashing.column(
+                attr, block[:, self.columns[relation][attr]])
+            codes = codes * vector[attr] + column % vector[attr]
+        if residualId in self.splits:
+            attr, factor = self.splits[residualId]
+            if self.schema[relation][attr] == 1:
+                column = self.grid.hashing.column(
+                    attr, block[:, self.columns[relation][attr]])
+                codes = codes * factor + (column // vector[attr]) % factor
+        return codes
+
+    def keys(self, relation, residualId, code):
+        """ All reducer keys of the tuples with a coordinate code, computed
+        once with the key function
+        """
+        cacheKey = (relation, residualId, code)
+        if cacheKey not in self.keyCache:
+            vector = self.grid.shareVectors[residualId]
+            sub = ()
+            if residualId in self.splits:
+                attr, factor = self.splits[residualId]
+                sub = (None,)
+                if self.schema[relation][attr] == 1:
+                    code, digit = divmod(code, factor)
+                    sub = (digit,)
+            coordinates = []
+            for attr in reversed(self.grid.ownAttrs[relation]):
+                code, coordinate = divmod(code, vector[attr])
+                coordinates.append(coordinate)
+            coordinates.reverse()
+            self.keyCache[cacheKey] = self.routeKeys(relation, residualId,
+                                                     coordinates, *sub)
+        return self.keyCache[cacheKey]
+
+    def groups(self, relation, block):
+        """ Groups the rows of a block by residual join and coordinates
+
+        Output: A generator of (residualId, coordinate code, row indices)
+        """
+        signatures = self.signatures(relation, block)
+        for signature in np.unique(signatures):
+            residualIds = self.routes[relation].get(int(signature))
+            if not residualIds:
+                continue
+            rows = np.flatnonzero(signatures == signature)
+            for residualId in residualIds:
+                codes = self.coordinates(relation, residualId, block[rows])
+                order = np.argsort(codes, kind='mergesort')
+                codes = codes[order]
+                bounds = np.flatnonzero(np.diff(codes)) + 1
+                starts = np.concatenate(([0], bounds))
+                ends = np.concatenate((bounds, [len(codes)]))
+                for start, end in zip(starts, ends):
+                    yield (residualId, int(codes[start]),
+                           rows[order[start:end]])
+
+    def textValues(self, relation, lines, rank=None, projected=()):
+        """ The text mapper values of a block of lines, as identityMapper
+        builds them one by one
+
+        Input:  relation    The 1-numbered relation
+                lines       Input lines eg ['R1 10 21']
+                rank        The secondary sort rank of the relation, if any
+                projected   Attributes replaced by '_'
+        Output: eg ['1:_+10+21+_+_+_']
+        """
+        template = self.textTemplate(relation, rank, projected)
+        return [template % tuple(line.split(' ')[1:]) for line in lines]
+
+    def blockTextValues(self, relation, block, rank=None, projected=()):
+        """ textValues of a parsed block """
+        template = self.textTemplate(relation, rank, projected)
+        return [template % tuple(row) for row in block.tolist()]
+
+    def textTemplate(self, relation, rank=None, projected=()):
+        """ The format string of the text values of a relation """
+        # '%.0s' consumes the value of a projected attribute and prints
+        # nothing
+        template = str(relation) + ':' + '+'.join(
+            ('_%.0s' if attr in projected else '%s') if v == 1 else '_'
+            for attr, v in enumerate(self.schema[relation-1]))
+        if rank is not None:
+            template = '%02d:' % rank + template
+        return template
+
+    def packedValues(self, codec, relation, block, rank=0):
+        """ The packed mapper values of a parsed block, byte for byte the
+        output of packedCodec.pack
+
+        Input:  codec       The packedCodec of the job
+                relation    The 1-numbered relation
+                block       The parsed block, see parse
+        """
+        valueType = codec.structs[relation-1].format[-1]
+        width = len(codec.relationAttrs[relation-1])
+        if valueType == 'i' and len(block) and (
+                block.min() < -2**31 or block.max() >= 2**31):
+            raise ValueError('R%d value out of 32 bit range' % relation)
+        records = np.zeros(len(block), dtype=[
+            ('rank', 'u1'), ('relation', 'u1'),
+            ('values', '<i8' if valueType == 'q' else '<i4', (width,))])
+        records['rank'] = rank
+        records['relation'] = relation
+        records['values'] = block
+        data = records.tobytes()
+        size = records.dtype.itemsize
+        return [data[i:i + size] for i in xrange(0, len(data), size)]
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+
+""" columnFile Class
+
+    Binary input of SharesSkewJob --binary-input. A text dataset, as
+    written by zipf_dataset_generator.py or dataset_generator.py, is
+    converted once into a file per relation: a 64 byte header followed by
+    the relation's attribute columns as little-endian int64, one column
+    after the other. The job input is then a manifest with a line per
+    split of rows, '<file> <first row> <end row>'. The mapper memory-maps
+    the files and routes NumPy views of the splits, without parsing text.
+
+"""
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = 'SKBC'
+VERSION = 1
+# magic, version, 1-numbered relation, number of columns, number of rows
+HEADER = struct.Struct('<4sBBHQ')
+HEADER_SIZE = 64
+DTYPE = np.dtype('<i8')
+MANIFEST = 'manifest.txt'
+
+
+def relationFilename(relation):
+    """ eg relationFilename(2) = 'R2.bin' """
+    return 'R%d.bin' % relation
+
+
+def writeHeader(f, relation, width, rows):
+    f.write(HEADER.pack(MAGIC, VERSION, relation, width, rows).ljust(
+        HEADER_SIZE, '\0'))
+
+
+def readHeader(f):
+    """ Output: (relation, width, rows) """
+    magic, version, relation, width, rows = HEADER.unpack(
+        f.read(HEADER_SIZE)[:HEADER.size])
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a version %d column file' % VERSION)
+    return relation, width, rows
+
+
+def convertText(lines, directory, schema, blockSize=65536):
+    """ Converts text input lines into a column file per relation
+
+    Input:  lines       Input lines eg ['R1 10 21', 'R2 21 31 40']
+            directory   The directory of the column files
+            schema      The binary schema, as loaded from schema.p
+            blockSize   The lines of a relation parsed at once
+    Output: A dict from the 1-numbered relation to its column file, for
+            the relations with tuples
+    """
+    spool = tempfile.mkdtemp(dir=directory)
+    try:
+        # Columns are appended to a spool file each, then concatenated
+        columns = {}
+        blocks = {}
+        rows = {}
+
+        def flush(relation):
+            width = sum(schema[relation-1])
+            tokens = [values.split(' ') for values in blocks.pop(relation)]
+            if any(len(t) != width for t in tokens):
+                raise ValueError('Malformed line in block of R%d' % relation)
+            try:
+                block = np.array(tokens, dtype=DTYPE)
+            except (ValueError, OverflowError):
+                raise ValueError('Values that are not integers in block of '
+                                 'R%d' % relation)
+            # The text mapper takes eg '021' or '+21' for an ordinary value,
+            # not the integer 21
+            if (block.astype(str) != np.array(tokens)).any():
+                raise ValueError('Integers not written in canonical form in '
+                                 'block of R%d' % relation)
+            rows[relation] = rows.get(relation, 0) + len(block)
+            if relation not in columns:
+                columns[relation] = [
+                    open(os.path.join(spool, '%d.%d' % (relation, column)),
+                         'wb') for column in xrange(width)]
+            for column, f in enumerate(columns[relation]):
+                f.write(np.ascontiguousarray(block[:, column]).tobytes())
+
+        for line in lines:
+            tag, _, values = line.rstrip('\n').partition(' ')
+            if not tag:
+                continue
+            relation = int(tag[1:])
+            blocks.setdefault(relation, []).append(values)
+            if len(blocks[relation]) == blockSize:
+                flush(relation)
+        for relation in blocks.keys():
+            flush(relation)
+        filenames = {}
+        for relation, files in columns.iteritems():
+            filenames[relation] = os.path.join(directory,
+                                               relationFilename(relation))
+            with open(filenames[relation], 'wb') as out:
+                writeHeader(out, relation, len(files), rows[relation])
+                for f in files:
+                    f.close()
+                    with open(f.name, 'rb') as column:
+                        shutil.copyfileobj(column, out)
+        return filenames
+    finally:
+        shutil.rmtree(spool)
+
+
+def manifestLines(filenames, splitRows):
+    """ The manifest lines of column files, a split of at most splitRows
+    rows per line
+
+    eg manifestLines(['/data/R1.bin'], 1000) for 2500 rows
+       ['/data/R1.bin 0 1000', '/data/R1.bin 1000 2000',
+        '/data/R1.bin 2000 2500']
+    """
+    lines = []
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            rows = readHeader(f)[2]
+        for start in xrange(0, rows, splitRows):
+            lines.append('%s %d %d' % (filename, start,
+                                       min(start + splitRows, rows)))
+    return lines
+
+
+def parseManifestLine(line):
+    """ Output: (filename, first row, end row) """
+    filename, start, end = line.rsplit(' ', 2)
+    return filename, int(start), int(end)
+
+
+class columnFile(object):
+
+    def __init__(self, filename):
+        """ Memory-maps a column file, read only """
+        with open(filename, 'rb') as f:
+            self.relation, self.width, self.numberRows = readHeader(f)
+        self.columns = None
+        if self.numberRows:
+            self.columns = np.memmap(filename, dtype=DTYPE, mode='r',
+                                     offset=HEADER_SIZE,
+                                     shape=(self.width, self.numberRows))
+
+    def rows(self, start, end):
+        """ The rows start .. end - 1, a view of the mapped file
+
+        Output: An int64 array with a row per tuple and a column per
+                attribute of the relation, as batchRouter.parse returns
+        """
+        if self.columns is None:
+            return np.zeros((0, self.width), dtype=DTYPE)
+        return self.columns[:, start:end].T
+
+
+if __name__ == '__main__':
+    import argparse
+    import pickle
+    parser = argparse.ArgumentParser(
+        description='Converts text datasets into the column files and '
+                    'manifest of SharesSkewJob --binary-input')
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--schemaFile', default='schema.p')
+    parser.add_argument('--split-rows', type=int, default=1000000,
+                        help='The rows of a manifest line, routed by one '
+                             'mapper call')
+    args = parser.parse_args()
+    with open(args.schemaFile, 'rb') as f:
+        schema = pickle.load(f)
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    lines = (line for filename in args.inputs for line in open(filename))
+    filenames = convertText(lines, args.output_dir, schema)
+    with open(os.path.join(args.output_dir, MANIFEST), 'w') as f:
+        for line in manifestLines([os.path.abspath(filenames[relation])
+                                   for relation in sorted(filenames)],
+                                  args.split_rows):
+            f.write(line + '\n')
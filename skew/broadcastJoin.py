@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+""" broadcastIndex Class
+
+    Map-side join of tiny residual joins. The tuples of the small
+    relations of a residual join are shipped to every mapper in a side
+    file and hashed once in mapper_init; the tuples of its large relation
+    are joined against them as they are read, without a shuffle.
+
+"""
+import pickle
+
+from joinEngine import extendTupleValue, multiwayJoin
+from router import residualRouter
+
+# Reducer keys of the map-side join results of a residual join
+BROADCAST_PREFIX = 'broadcast.'
+# The parts the joined tuples of a residual join are spread over, when the
+# number of reduce tasks is not given
+BROADCAST_PARTS = 64
+
+
+def broadcastKey(residualId):
+    return BROADCAST_PREFIX + str(residualId)
+
+
+def spreadKey(residualId, part, labels=None):
+    """ The key of a part of the joined tuples of a residual join, led by
+    the label of reduce task part with cell keys
+
+    eg spreadKey(3, 5) = 'broadcast.3.5'
+       spreadKey(3, 1, ['0', '1']) = '1.broadcast.3.1'
+    """
+    key = '%s%d.%d' % (BROADCAST_PREFIX, residualId, part)
+    if labels is None:
+        return key
+    return labels[part] + '.' + key
+
+
+def isBroadcastKey(key):
+    return key.startswith(BROADCAST_PREFIX) or ('.' + BROADCAST_PREFIX) in key
+
+
+def residualKey(key):
+    """ The broadcastKey of a broadcast or spread key
+
+    eg residualKey('1.broadcast.3.1') = 'broadcast.3'
+    """
+    return '.'.join(key[key.index(BROADCAST_PREFIX):].split('.')[:2])
+
+
+def sideTables(lines, schema, residuals, heavyhitters, broadcast):
+    """ Collects the tuples of the small relations of broadcast residual
+    joins, routed as the mapper routes them
+
+    Input:  lines       Input lines eg ['R1 10 21']
+            residuals, heavyhitters The residualjoins.p, heavyhitters.p of
+                        the plan
+            broadcast   A dict from residual id to its large 1-numbered
+                        relation, see premap.broadcastResiduals
+    Output: A dict from residual id to a list of extended tuples per
+            relation, empty for the large relation
+    """
+    hhinvertedIndex = {}
+    for hh in heavyhitters:
+        for attr, value in hh.iteritems():
+            hhinvertedIndex[(attr, value)] = 'HH'
+    router = residualRouter(schema, residuals, hhinvertedIndex)
+    tables = dict((residualId, [[] for rel in schema])
+                  for residualId in broadcast)
+    for line in lines:
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        inputTuple = extendTupleValue(tokens[1:], schema[relation-1])
+        for residualId in router.route(relation-1, inputTuple):
+            if broadcast.get(residualId, relation) != relation:
+                tables[residualId][relation-1].append(inputTuple)
+    return tables
+
+
+def writeSideFile(filename, broadcast, tables):
+    """ Writes the side file SharesSkewJob --broadcastFile loads """
+    with open(filename, 'wb') as f:
+        pickle.dump({'residuals': broadcast, 'tuples': tables}, f,
+                    pickle.HIGHEST_PROTOCOL)
+
+
+class broadcastIndex(object):
+
+    def __init__(self, schema, side):
+        """ Input:  schema  The binary schema, as loaded from schema.p
+                    side    The dict of a writeSideFile pickle
+        """
+        self.engine = multiwayJoin(schema)
+        self.large = side['residuals']
+        self.indexes = {}
+        for residualId, large in self.large.iteritems():
+            tables = side['tuples'].get(residualId,
+                                        [[] for rel in schema])
+            sizes = [len(t) for t in tables]
+            sizes[large-1] = 1
+            if min(sizes) == 0:
+                # A small relation without tuples, nothing joins
+                self.indexes[residualId] = None
+                continue
+            probe, order = self.engine.plan(sizes, large-1)
+            self.indexes[residualId] = (order, self.engine.buildTables(
+                tables, order))
+
+    def join(self, residualId, probeTuples, countOnly=False):
+        """ Joins tuples of the large relation of a broadcast residual join
+
+        Output: A generator of joined tuples, or the number of them
+        """
+        index = self.indexes[residualId]
+        if index is None:
+            return 0 if countOnly else iter(())
+        order, hashTables = index
+        results = self.engine.probe(order, hashTables, probeTuples,
+                                    countOnly)
+        if countOnly:
+            return sum(results)
+        return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(
+        description='Writes the --broadcastFile of a plan whose broadcast.p '
+                    'flags residual joins for a map-side join')
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--plan-dir', default='.')
+    parser.add_argument('--schemaFile', default='schema.p')
+    parser.add_argument('--output', default='broadcasttuples.p')
+    args = parser.parse_args()
+
+    def load(filename):
+        with open(os.path.join(args.plan_dir, filename), 'rb') as f:
+            return pickle.load(f)
+    with open(args.schemaFile, 'rb') as f:
+        schema = pickle.load(f)
+    broadcast = load('broadcast.p')
+    lines = (line.rstrip('\n') for filename in args.inputs
+             for line in open(filename) if line.strip())
+    writeSideFile(args.output, broadcast,
+                  sideTables(lines, schema, load('residualjoins.p'),
+                             load('heavyhitters.p'), broadcast))
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+
+""" cellIndex Class
+
+    Gives every (residual join, share coordinate) cell of a plan a dense
+    global integer id and assigns the ids to reduce tasks exactly. Cells
+    re-split by skew/cellSplits.py are replaced by sub-cells with ids past
+    the plan's cells, each placed on its own reduce task.
+
+"""
+from itertools import product
+
+# Hadoop streaming settings that partition on the first '.' separated field
+# of the key with KeyFieldBasedPartitioner
+PARTITIONER = 'org.apache.hadoop.mapred.lib.KeyFieldBasedPartitioner'
+PARTITIONER_JOBCONF = {
+    'mapreduce.map.output.key.field.separator': '.',
+    'mapreduce.partition.keypartitioner.options': '-k1,1',
+}
+
+
+def keyFieldHash(label):
+    """ The hash KeyFieldBasedPartitioner computes over a key field:
+    31 * h + byte over the UTF-8 bytes, in Java int arithmetic.
+    """
+    h = 0
+    for b in bytearray(label):
+        h = (31 * h + (b - 256 if b > 127 else b)) & 0xFFFFFFFF
+    return h
+
+
+def keyFieldPartition(label, numberReducers):
+    """ The reduce task KeyFieldBasedPartitioner sends a key field to """
+    return (keyFieldHash(label) & 0x7FFFFFFF) % numberReducers
+
+
+def taskLabels(numberReducers):
+    """ For every reduce task, the shortest decimal label that
+    KeyFieldBasedPartitioner sends to it.
+
+    Output: A list of labels, labels[t] is partitioned to task t
+            eg for 4 reducers ['0', '1', '2', '3']
+    """
+    labels = [None] * numberReducers
+    missing = numberReducers
+    candidate = 0
+    while missing:
+        label = str(candidate)
+        task = keyFieldPartition(label, numberReducers)
+        if labels[task] is None:
+            labels[task] = label
+            missing -= 1
+        candidate += 1
+    return labels
+
+
+class cellIndex(object):
+
+    def __init__(self, grid, numberReducers):
+        """ Input:  grid            The shareGrid of the plan
+                    numberReducers  The number of reduce tasks of the job
+
+        Residual join i owns the ids offsets[i] .. offsets[i] + cells[i] - 1,
+        where cells[i] is the product of its shares. Within a residual the
+        coordinates of attributes 1..n-1 are laid out in row-major order.
+        Cells are assigned to tasks in contiguous runs of cellsPerTask.
+        """
+        self.grid = grid
+        self.numberReducers = numberReducers
+        self.cells = []
+        self.strides = []
+        for vector in grid.shareVectors:
+            stride = [0] * len(vector)
+            cells = 1
+            for attr in reversed(xrange(1, len(vector))):
+                stride[attr] = cells
+                cells *= vector[attr]
+            self.strides.append(stride)
+            self.cells.append(cells)
+        self.offsets = [0]
+        for cells in self.cells:
+            self.offsets.append(self.offsets[-1] + cells)
+        self.totalCells = self.offsets.pop()
+        # ceil(totalCells / numberReducers)
+        self.cellsPerTask = max(-(-self.totalCells // numberReducers), 1)
+        self.labels = taskLabels(numberReducers)
+        self.bases = [[self.replicatedIds(rel, residualId)
+                       for residualId in xrange(len(grid.shareVectors))]
+                      for rel in grid.schema]
+        # Set by split
+        self.splitResiduals = {}
+        self.subCells = {}
+        self.subTasks = []
+        self.numberCells = self.totalCells
+
+    def split(self, splits):
+        """ Replaces the overloaded cells of a splits.p by their sub-cells
+
+        Input:  splits  The dict of cellSplits.planSplits
+                        eg {'residuals': {3: (4, 2)}, 'cells': {17: (51, 2),
+                            18: (53, 1)}, 'tasks': [5, 0, 6], ...}
+                        residual join 3 splits on attribute 4, its cell 17
+                        into the sub-cells 51 and 52 placed on the tasks 5
+                        and 0, and its cell 18 moves to task 6
+        """
+        self.splitResiduals = splits['residuals']
+        self.subCells = splits['cells']
+        self.subTasks = splits['tasks']
+        self.numberCells = self.totalCells + len(self.subTasks)
+
+    def replicatedIds(self, relationSchema, residualId):
+        """ The ids of the cells a tuple with all own coordinates equal to 0
+        is sent to, one per combination of the replicated coordinates.
+        """
+        vector = self.grid.shareVectors[residualId]
+        stride = self.strides[residualId]
+        ranges = [[0] if relationSchema[attr] == 1
+                  else [i * stride[attr] for i in xrange(vector[attr])]
+                  for attr in xrange(1, len(vector))]
+        return [self.offsets[residualId] + sum(coordinates)
+                for coordinates in product(*ranges)]
+
+    def task(self, cellId):
+        """ The reduce task of a cell """
+        if cellId < self.totalCells:
+            return cellId // self.cellsPerTask
+        return self.subTasks[cellId - self.totalCells]
+
+    def key(self, cellId):
+        """ The reducer key of a cell: '<task label>.<cell id>' """
+        return self.labels[self.task(cellId)] + '.' + str(cellId)
+
+    def cellIds(self, relation, residualId, inputTuple):
+        """ All cell ids of a tuple in a residual join
+
+        Input:  relation    The 0-numbered relation of the tuple
+                residualId  The index of the residual join
+                inputTuple  The extended tuple eg ['_', '0', '21', '_', ...]
+        """
+        vector = self.grid.shareVectors[residualId]
+        stride = self.strides[residualId]
+        hashValue = self.grid.hashValue
+        own = 0
+        for attr in self.grid.ownAttrs[relation]:
+            own += stride[attr] * (hashValue(attr, inputTuple[attr]) %
+                                   vector[attr])
+        cellIds = [base + own for base in self.bases[relation][residualId]]
+        if residualId in self.splitResiduals:
+            attr, factor = self.splitResiduals[residualId]
+            sub = None
+            if self.grid.schema[relation][attr] == 1:
+                sub = (hashValue(attr, inputTuple[attr]) //
+                       vector[attr]) % factor
+            return self.splitIds(cellIds, sub)
+        return cellIds
+
+    def splitIds(self, cellIds, sub):
+        """ Replaces the split cells among the cell ids of a tuple by its
+        sub-cell: the next digit of its hash on the split attribute, past
+        the share, modulo the factor of the cell, which divides the factor
+        of the residual join. Relations without the attribute go to every
+        sub-cell.
+
+        Input:  sub     The digit, None if the relation lacks the attribute
+        """
+        splitIds = []
+        for cellId in cellIds:
+            if cellId not in self.subCells:
+                splitIds.append(cellId)
+                continue
+            first, factor = self.subCells[cellId]
+            if sub is None:
+                splitIds.extend(xrange(first, first + factor))
+            else:
+                splitIds.append(first + sub % factor)
+        return splitIds
+
+    def keys(self, relation, residualId, inputTuple):
+        """ All reducer keys of a tuple in a residual join """
+        return [self.key(cellId)
+                for cellId in self.cellIds(relation, residualId, inputTuple)]
+
+    def coordinateCellIds(self, relation, residualId, coordinates,
+                          sub=None):
+        """ cellIds of the tuples with the given coordinates, one per own
+        attribute of the relation, already reduced modulo the shares, and
+        the sub-cell digit of a split residual join, see splitIds
+        """
+        stride = self.strides[residualId]
+        own = sum(c * stride[attr] for c, attr in
+                  zip(coordinates, self.grid.ownAttrs[relation]))
+        cellIds = [base + own for base in self.bases[relation][residualId]]
+        if residualId in self.splitResiduals:
+            return self.splitIds(cellIds, sub)
+        return cellIds
+
+    def coordinateKeys(self, relation, residualId, coordinates, sub=None):
+        """ keys of the tuples with the given coordinates """
+        return [self.key(cellId) for cellId in self.coordinateCellIds(
+            relation, residualId, coordinates, sub)]
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+
+""" planSplits
+
+    The first phase of adaptive re-splitting. A plan is fixed at planning
+    time, from the heavy hitter estimates, and a reduce task can receive
+    many times its expected load when they are wrong. A sample of the input
+    is routed by a planSimulator to measure the actual load of every cell.
+    The heaviest cells of the overloaded reduce tasks are taken off them:
+    a cell heavier than the target task load is split into sub-cells, by
+    increasing, in that cell only, the share of one ordinary attribute of
+    its residual join, and a lighter one moves whole. The sub-cells are
+    placed on the least loaded reduce tasks. The splits are written to
+    splits.p, which the second phase, SharesSkewJob --splitsFile, routes
+    with: only the tuples of the split residual joins change keys.
+
+"""
+import numpy as np
+
+
+def splitAttributes(schema, residual):
+    """ The attributes a residual join can split on: hashed attributes of
+    some relation that are not heavy hitters of the residual join
+
+    eg splitAttributes(schema, ('_', '_', '21', '_', '_', '_')) = [1, 3, 4, 5]
+    """
+    return [attr for attr in xrange(1, len(residual))
+            if residual[attr] == '_' and any(rel[attr] for rel in schema)]
+
+
+def splitFactor(load, target, maxFactor):
+    """ The power of two number of sub-cells that brings a cell load under
+    the target, at most maxFactor. Factors of a residual join divide each
+    other.
+
+    eg splitFactor(300.0, 100.0, 16) = 4
+    """
+    factor = 1
+    while factor < maxFactor and load > factor * target:
+        factor *= 2
+    return factor
+
+
+def overloadedCells(simulator, loads, target, maxFactor):
+    """ The cells to take off the reduce tasks loaded beyond the target,
+    heaviest first until the rest of the task is within the target
+
+    Output: A dict from a residual join to a dict from its cells to their
+            number of sub-cells
+    """
+    cells = simulator.cells
+    overloaded = {}
+    for task, taskLoad in enumerate(simulator.taskLoads(loads)):
+        if taskLoad <= target:
+            continue
+        start = task * cells.cellsPerTask
+        end = min(start + cells.cellsPerTask, cells.totalCells)
+        for cellId in start + np.argsort(-loads[start:end],
+                                         kind='mergesort'):
+            if taskLoad <= target or not loads[cellId]:
+                break
+            taskLoad -= loads[cellId]
+            residualId = int(np.searchsorted(cells.offsets, cellId,
+                                             'right')) - 1
+            overloaded.setdefault(residualId, {})[int(cellId)] = splitFactor(
+                loads[cellId], target, maxFactor)
+    return overloaded
+
+
+def makeSplits(simulator, overloaded, attributes, tasks=None):
+    """ The splits dict of a splits.p
+
+    Input:  overloaded      The cells to split, see overloadedCells
+            attributes      The split attribute per residual join
+            tasks           The reduce task of every sub-cell, all on task
+                            0 if None
+    """
+    cells = {}
+    residuals = {}
+    nextId = simulator.cells.totalCells
+    for residualId in sorted(overloaded):
+        factors = overloaded[residualId]
+        residuals[residualId] = (attributes.get(residualId, 1),
+                                 max(factors.itervalues()))
+        for cellId in sorted(factors):
+            cells[cellId] = (nextId, factors[cellId])
+            nextId += factors[cellId]
+    subCells = nextId - simulator.cells.totalCells
+    return {'residuals': residuals, 'cells': cells,
+            'tasks': tasks if tasks is not None else [0] * subCells,
+            'reducers': simulator.numberReducers}
+
+
+def placeSubCells(simulator, loads):
+    """ Places every sub-cell on the least loaded reduce task, largest
+    first, given the loads of the cells of the plan
+
+    Output: The reduce task of every sub-cell
+    """
+    totalCells = simulator.cells.totalCells
+    taskLoads = np.bincount(
+        np.arange(totalCells) // simulator.cells.cellsPerTask,
+        weights=loads[:totalCells], minlength=simulator.numberReducers)
+    subLoads = loads[totalCells:]
+    tasks = [0] * len(subLoads)
+    for subCell in np.argsort(-subLoads, kind='mergesort'):
+        task = int(np.argmin(taskLoads))
+        tasks[subCell] = task
+        taskLoads[task] += subLoads[subCell]
+    return tasks
+
+
+def planSplits(simulator, lines, balance=1.0, maxFactor=16, scale=None):
+    """ Splits or moves the cells of the reduce tasks a sample overloads
+
+    Input:  simulator   The planSimulator of the plan, unsplit. It is
+                        left routing the splits returned
+            lines       Sample input lines eg ['R1 10 21', 'R2 21 31 40']
+            balance     Reduce tasks loaded beyond balance times the mean
+                        task load are relieved
+            maxFactor   The largest number of sub-cells of a cell, a power
+                        of two
+            scale       The sample scale per relation, see sampled
+    Output: The splits dict of a splits.p, see cellIndex.split
+            eg {'residuals': {3: (4, 2)}, 'cells': {17: (51, 2)},
+                'tasks': [5, 0], 'reducers': 8}
+    """
+    loads = simulator.sampled(lines, scale)[0]
+    target = balance * loads.sum() / simulator.numberReducers
+    overloaded = overloadedCells(simulator, loads, target, maxFactor)
+    candidates = dict(
+        (residualId, splitAttributes(simulator.schema,
+                                     simulator.residuals[residualId]))
+        for residualId, factors in overloaded.iteritems()
+        if max(factors.itervalues()) > 1)
+    for residualId, attrs in candidates.items():
+        if not attrs:
+            # Every attribute is a heavy hitter, the cells move whole
+            overloaded[residualId] = dict.fromkeys(overloaded[residualId], 1)
+            del candidates[residualId]
+    # Every split attribute is tried on all residual joins at once, which
+    # are routed independently, and each keeps its best: the smallest
+    # largest sub-cell, then the least replication
+    best = {}
+    for attr in sorted(set(a for attrs in candidates.itervalues()
+                           for a in attrs)):
+        splits = makeSplits(simulator, overloaded, dict(
+            (residualId, attr) for residualId, attrs in
+            candidates.iteritems() if attr in attrs))
+        simulator.split(splits)
+        trial = simulator.sampled(lines, scale)[0]
+        for residualId, attrs in candidates.iteritems():
+            if attr not in attrs:
+                continue
+            subLoads = np.concatenate([
+                trial[first:first + factor] for first, factor in
+                map(splits['cells'].get, overloaded[residualId])])
+            score = (subLoads.max(), subLoads.sum())
+            if residualId not in best or score < best[residualId][0]:
+                best[residualId] = (score, attr)
+    splits = makeSplits(simulator, overloaded, dict(
+        (residualId, attr) for residualId, (score, attr) in best.iteritems()))
+    simulator.split(splits)
+    splits['tasks'] = placeSubCells(simulator,
+                                    simulator.sampled(lines, scale)[0])
+    simulator.split(splits)
+    return splits
+
+
+if __name__ == '__main__':
+    import argparse
+    import pickle
+
+    import premap
+    from hashing import HASH_FUNCTIONS, attributeHash
+    from simulator import loadPlan
+    parser = argparse.ArgumentParser(
+        description='Measures the cell loads of a plan on a sample of the '
+                    'input and splits the overloaded cells, for '
+                    'SharesSkewJob --splitsFile')
+    parser.add_argument('plan', nargs='?', default='.',
+                        help='The directory with residualjoins.p, shares.p '
+                             'and heavyhitters.p')
+    parser.add_argument('--sample', required=True,
+                        help='Input lines to route, eg simple.in')
+    parser.add_argument('--reducers', type=int, required=True)
+    parser.add_argument('--output', default='splits.p')
+    parser.add_argument('--schema', default=premap.schemaFilename)
+    parser.add_argument('--attributes', type=int, default=6,
+                        help='The total number of attributes eg 6: [A0:A5]')
+    parser.add_argument('--sizes', default=None,
+                        help='A relationsizes.txt to scale the sample by')
+    parser.add_argument('--balance', type=float, default=1.0,
+                        help='Relieve reduce tasks loaded beyond this times '
+                             'the mean reduce task load')
+    parser.add_argument('--max-factor', type=int, default=16,
+                        help='The largest number of sub-cells of a cell, a '
+                             'power of two')
+    parser.add_argument('--hash-function', default='modulo',
+                        choices=HASH_FUNCTIONS)
+    parser.add_argument('--hash-seed', type=int, default=0)
+    args = parser.parse_args()
+    schema = premap.readSchema(args.schema, args.attributes)
+    with open(args.sample) as f:
+        lines = [line.rstrip('\n') for line in f if line.strip()]
+    scale = None
+    if args.sizes:
+        sizes = premap.readRelationSizes(args.sizes)
+        counts = [0] * len(schema)
+        for line in lines:
+            counts[int(line[1:line.index(' ')]) - 1] += 1
+        scale = [float(size) / count if count else 0.0
+                 for size, count in zip(sizes, counts)]
+    hashing = attributeHash(args.hash_function, args.hash_seed,
+                            args.attributes)
+    simulator = loadPlan(args.plan, schema, args.reducers, hashing)
+    loads, tuples = simulator.sampled(lines, scale)
+    before = simulator.statistics(loads, sum(tuples))
+    splits = planSplits(simulator, lines, args.balance, args.max_factor,
+                        scale)
+    splits['hashing'] = (args.hash_function, args.hash_seed)
+    after = simulator.statistics(simulator.sampled(lines, scale)[0],
+                                 sum(tuples))
+    with open(args.output, 'wb') as f:
+        pickle.dump(splits, f)
+    print '%d cells of %d residual joins moved or split into %d sub-cells' % (
+        len(splits['cells']), len(splits['residuals']),
+        len(splits['tasks']))
+    for name in ['communicationCost', 'maxTaskLoad', 'meanTaskLoad',
+                 'maxMeanRatio']:
+        print '%20s %14.3f -> %14.3f' % (name, before[name], after[name])
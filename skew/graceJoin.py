@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+""" graceHashJoin Class
+
+    Bounds the memory of the reducer join of a bucket. The tuples of a
+    bucket are held in tables until their estimated size crosses a budget.
+    The tables are then hash partitioned on one attribute to spill files,
+    and so is every tuple that follows. Relations without the attribute
+    are spilled once and replicated to every partition. The partitions are
+    joined one at a time by the join engine, streaming their largest
+    relation from its file when the engine allows, or partitioned again on
+    another attribute if their other relations still exceed the budget.
+
+"""
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+from itertools import chain
+
+from hashing import attributeHash
+
+# Tuples marshalled to a spill file at once
+SPILL_BATCH = 4096
+# Partitioning rounds of a bucket, the last joins in memory regardless
+MAX_DEPTH = 3
+
+
+def tupleBytes(t):
+    """ The estimated bytes of an extended tuple held in a table """
+    return sys.getsizeof(t) + sum(sys.getsizeof(v) for v in t)
+
+
+def readSpill(filename):
+    """ The tuples of a spill file """
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                batch = marshal.load(f)
+            except EOFError:
+                return
+            for t in batch:
+                yield t
+
+
+class spillFile(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.buffer = []
+        self.bytes = 0
+
+    def append(self, t):
+        self.buffer.append(t)
+        if len(self.buffer) == SPILL_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with open(self.filename, 'ab') as f:
+            marshal.dump(self.buffer, f)
+            self.bytes = f.tell()
+        self.buffer = []
+
+
+class graceHashJoin(object):
+
+    def __init__(self, engine, memoryBudget, numberPartitions=16,
+                 weighted=False, probe=None, directory=None, depth=0,
+                 excluded=()):
+        """ Input:  engine      The multiwayJoin or trieJoin of the schema
+                    memoryBudget The estimated bytes of the tables held in
+                                memory before spilling
+                    numberPartitions The partitions of a spill
+                    weighted    If True tuples are (tuple, multiplicity)
+                                pairs, see multiwayJoin.join
+                    probe       The 0-numbered relation streamJoin streams,
+                                partitioned rather than replicated
+                    directory   The parent of the spill files, the
+                                temporary directory if None
+                    depth, excluded The partitioning round and the
+                                attributes earlier rounds partitioned on
+        """
+        self.engine = engine
+        self.schema = engine.schema
+        self.memoryBudget = memoryBudget
+        self.numberPartitions = numberPartitions
+        self.weighted = weighted
+        self.probe = probe
+        self.directory = directory
+        self.depth = depth
+        self.excluded = excluded
+        # Seeded per round, and independent of the share modulus the mapper
+        # already partitioned the bucket's values by
+        self.partitionHash = attributeHash('multiply-shift', depth,
+                                           len(self.schema[0]))
+        self.tables = [[] for rel in self.schema]
+        self.tupleSizes = [None] * len(self.schema)
+        self.bytes = 0
+        # Set by spill
+        self.attribute = None
+        self.spillDirectory = None
+        self.files = None
+        # Spill statistics, of this bucket and its sub-partitions
+        self.spilledBytes = 0
+        self.partitions = 0
+
+    def add(self, relation, t):
+        """ Adds a tuple of a 0-numbered relation """
+        if self.files is not None:
+            self.spillTuple(relation, t)
+            return
+        self.tables[relation].append(t)
+        if self.tupleSizes[relation] is None:
+            self.tupleSizes[relation] = (tupleBytes(t[0]) + sys.getsizeof(t)
+                                         if self.weighted else tupleBytes(t))
+        self.bytes += self.tupleSizes[relation]
+        if self.bytes > self.memoryBudget and self.depth < MAX_DEPTH:
+            self.spill()
+
+    def partitionAttribute(self):
+        """ The join attribute whose partitioning replicates the fewest
+        tuples: the one missing from the smallest relations. With a probe
+        relation only its attributes qualify.
+
+        Output: The attribute, None if every attribute is excluded
+        """
+        sizes = [len(t) for t in self.tables]
+        candidates = [attr for attr in xrange(len(self.schema[0]))
+                      if attr not in self.excluded and
+                      sum(rel[attr] for rel in self.schema) > 1 and
+                      (self.probe is None or self.schema[self.probe][attr])]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda attr: (
+            sum(size for rel, size in zip(self.schema, sizes)
+                if not rel[attr]),
+            -sum(rel[attr] for rel in self.schema), attr))
+
+    def spill(self):
+        """ Moves the tables to partitioned spill files """
+        self.attribute = self.partitionAttribute()
+        if self.attribute is None:
+            # Nothing left to partition on, the bucket joins in memory
+            self.depth = MAX_DEPTH
+            return
+        self.spillDirectory = tempfile.mkdtemp(prefix='gracejoin-',
+                                               dir=self.directory)
+        self.files = {}
+        tables = self.tables
+        self.tables = None
+        for relation, table in enumerate(tables):
+            for t in table:
+                self.spillTuple(relation, t)
+            del table[:]
+
+    def spillTuple(self, relation, t):
+        if self.schema[relation][self.attribute]:
+            value = (t[0] if self.weighted else t)[self.attribute]
+            partition = (self.partitionHash.value(self.attribute, value) %
+                         self.numberPartitions)
+        else:
+            # Replicated to every partition
+            partition = None
+        key = (relation, partition)
+        if key not in self.files:
+            self.files[key] = spillFile(self.partitionFile(relation,
+                                                           partition))
+        self.files[key].append(t)
+
+    def join(self, countOnly=False):
+        """ Joins the tuples added, see multiwayJoin.join
+
+        Output: A generator of joined tuples, or the number of them
+        """
+        if self.files is None:
+            return self.engine.join(self.tables, countOnly, self.weighted)
+        for f in self.files.itervalues():
+            f.flush()
+            self.spilledBytes += f.bytes
+        results = self.joinPartitions(countOnly)
+        if countOnly:
+            return sum(results)
+        return chain.from_iterable(results)
+
+    def streamJoin(self, probe, probeTuples, countOnly=False):
+        """ Joins the tuples added with streamed probe tuples, see
+        multiwayJoin.streamJoin. Once spilled, the probe tuples are
+        partitioned as well.
+        """
+        if self.files is None:
+            return self.engine.streamJoin(self.tables, probe, probeTuples,
+                                          countOnly, self.weighted)
+        for t in probeTuples:
+            self.spillTuple(probe, t)
+        return self.join(countOnly)
+
+    def joinPartitions(self, countOnly):
+        """ Joins every partition in turn, then removes the spill files
+
+        Output: A generator of the results of every partition
+        """
+        try:
+            relations = xrange(len(self.schema))
+            partitioned = [rel[self.attribute] for rel in self.schema]
+            for partition in xrange(self.numberPartitions):
+                filenames = [self.partitionFile(
+                    relation, partition if partitioned[relation] else None)
+                    for relation in relations]
+                if not all(os.path.exists(f) for f in filenames):
+                    # A relation without tuples, nothing joins
+                    continue
+                self.partitions += 1
+                # The largest relation of the partition, often a replicated
+                # one, streams from its file instead of being held
+                probe = None
+                if self.engine.streamsProbe:
+                    probe = max(relations, key=lambda relation:
+                                os.path.getsize(filenames[relation]))
+                sub = graceHashJoin(
+                    self.engine, self.memoryBudget, self.numberPartitions,
+                    self.weighted, probe, self.directory, self.depth + 1,
+                    self.excluded + (self.attribute,))
+                for relation in relations:
+                    if relation != probe:
+                        for t in readSpill(filenames[relation]):
+                            sub.add(relation, t)
+                if probe is None:
+                    yield sub.join(countOnly)
+                else:
+                    yield sub.streamJoin(probe, readSpill(filenames[probe]),
+                                         countOnly)
+                self.spilledBytes += sub.spilledBytes
+                self.partitions += sub.partitions
+        finally:
+            shutil.rmtree(self.spillDirectory)
+
+    def partitionFile(self, relation, partition):
+        return os.path.join(self.spillDirectory,
+                            '%d-%s' % (relation, partition))
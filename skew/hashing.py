@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+""" attributeHash Class
+
+    Maps attribute values to the non-negative integers the mapper reduces
+    modulo the shares. 'modulo' hashes an integer value to itself, as the
+    mapper always has. 'multiply-shift' draws an odd multiplier and an
+    increment per attribute from a seed and keeps the high 32 bits of
+    (a * x + b) mod 2^64, so consecutive or clustered ids spread over the
+    coordinates. Values that are not integers are first folded from their
+    bytes with 64 bit FNV-1a, by either function.
+
+"""
+import random
+
+HASH_FUNCTIONS = ['modulo', 'multiply-shift']
+
+MASK = 2**64 - 1
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+
+
+def fnv1a(data):
+    """ The 64 bit FNV-1a hash of a byte string eg fnv1a('') = FNV_OFFSET.
+    unicode, as values decode from JSON, is hashed from its UTF-8 bytes.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    h = FNV_OFFSET
+    for b in bytearray(data):
+        h = ((h ^ b) * FNV_PRIME) & MASK
+    return h
+
+
+class attributeHash(object):
+
+    def __init__(self, name='modulo', seed=0, numberAttributes=6):
+        """ Input:  name    One of HASH_FUNCTIONS
+                    seed    Draws the parameters of every attribute
+                    numberAttributes The total number of attributes eg 6
+        """
+        if name not in HASH_FUNCTIONS:
+            raise ValueError('Unknown hash function %r' % name)
+        self.name = name
+        self.seed = seed
+        rng = random.Random(seed)
+        # An independent (odd multiplier, increment) pair per attribute
+        self.parameters = [(rng.getrandbits(64) | 1, rng.getrandbits(64))
+                           for attr in xrange(numberAttributes)]
+
+    def value(self, attr, v):
+        """ The hash of a value of an attribute
+
+        Input:  attr    The attribute eg 2
+                v       The value as read eg '21' or 'Paris'
+        Output: A non-negative integer for multiply-shift, the integer
+                value itself for modulo
+        """
+        try:
+            x = int(v)
+        except ValueError:
+            x = fnv1a(v)
+        if self.name == 'modulo':
+            return x
+        a, b = self.parameters[attr]
+        return ((a * (x & MASK) + b) & MASK) >> 32
+
+    def column(self, attr, column):
+        """ value over an int64 column of parsed integer values """
+        if self.name == 'modulo':
+            return column
+        # NumPy is only needed by the batch mapper, which parsed the column
+        import numpy as np
+        a, b = self.parameters[attr]
+        # uint64 arithmetic wraps modulo 2^64
+        hashed = (column.astype(np.uint64) * np.uint64(a) +
+                  np.uint64(b)) >> np.uint64(32)
+        return hashed.astype(np.int64)
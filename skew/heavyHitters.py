@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+""" Heavy hitter selection
+
+    Helpers of HeavyHittersJob that turn per relation value frequencies
+    into heavyhitters.txt lines, as premap.readHeavyHitters reads them.
+
+"""
+import heapq
+
+
+def joinAttributes(schema):
+    """ The attributes shared by two or more relations
+
+    Input:  schema  The binary schema, as loaded from schema.p
+    Output: eg [2, 3] for R1(A1,A2), R2(A2,A3,A5), R3(A3,A4)
+    """
+    return [attr for attr in xrange(len(schema[0]))
+            if sum(rel[attr] for rel in schema) > 1]
+
+
+def fractions(schema, attr, counts, totals):
+    """ The fraction of every relation's tuples holding a value
+
+    Input:  attr    The attribute of the value eg 3
+            counts  A dict from 1-numbered relation to the value's count
+            totals  A dict from 1-numbered relation to the relation size
+    Output: A list with a fraction per relation, -0.0 for the relations
+            without the attribute eg [-0.0, 0.01, 0.01]
+    """
+    result = []
+    for relation, rel in enumerate(schema, 1):
+        if rel[attr] == 0:
+            result.append(-0.0)
+        elif totals.get(relation):
+            result.append(float(counts.get(relation, 0)) / totals[relation])
+        else:
+            result.append(0.0)
+    return result
+
+
+def selectHeavyHitters(candidates, threshold, topK=0):
+    """ Keeps the values with a fraction of at least threshold in some
+    relation, at most topK of them if topK > 0
+
+    Input:  candidates  An iterable of (value, fractions)
+    Output: A list of (value, fractions), most frequent first
+    """
+    heavy = ((max(f), value, f) for value, f in candidates
+             if max(f) >= threshold)
+    if topK:
+        heavy = heapq.nlargest(topK, heavy)
+    else:
+        heavy = sorted(heavy, reverse=True)
+    return [(value, f) for peak, value, f in heavy]
+
+
+def formatHeavyHitter(attr, value, fractions, precision=4):
+    """ A heavyhitters.txt line (3 spaces separation)
+
+    eg formatHeavyHitter(2, 2, [0.05, 0.05, -0.0])
+       'A2   2   R1:0.05,R2:0.05,R3:-0.0'
+    """
+    return '   '.join([
+        'A%d' % attr, str(value),
+        ','.join('R%d:%r' % (relation, round(f, precision))
+                 for relation, f in enumerate(fractions, 1))])
@@ -0,0 +1,430 @@
+#!/usr/bin/python
+
+""" multiwayJoin and trieJoin Classes
+
+    Reducer side join of the tuples a bucket receives, for any schema
+    given in the binary representation of schema.p
+
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+# Separates a mapper value from the multiplicity the combiner gives it
+MULTIPLICITY = '*'
+
+
+def parseValue(value):
+    """ Parses a mapper value into its relation and extended tuple
+
+    Input:  value   eg "2:_+_+21+31+_+40", or with the secondary sort rank
+                    of the relation "01:2:_+_+21+31+_+40"
+    Output: (relation, tuple) with the relation 1-numbered
+            eg (2, ['_', '_', '21', '31', '_', '40'])
+    """
+    tokens = value.split(":")
+    return int(tokens[-2]), tokens[-1].split("+")
+
+
+def countValue(value, count):
+    """ eg countValue("2:_+_+21+31+_+40", 3) = "2:_+_+21+31+_+40*3" """
+    if count == 1:
+        return value
+    return value + MULTIPLICITY + str(count)
+
+
+def splitCount(value):
+    """ The mapper value and multiplicity of a countValue
+
+    eg splitCount("2:_+_+21+31+_+40*3") = ("2:_+_+21+31+_+40", 3)
+    """
+    value, _, count = value.partition(MULTIPLICITY)
+    return value, int(count) if count else 1
+
+
+def parseCountedValue(value):
+    """ parseValue of a countValue
+
+    Output: (relation, (tuple, multiplicity))
+            eg (2, (['_', '_', '21', '31', '_', '40'], 3))
+    """
+    value, count = splitCount(value)
+    relation, t = parseValue(value)
+    return relation, (t, count)
+
+
+def privateAttributes(schema):
+    """ The attributes of a single relation, which no join compares. They
+    do not change the number of joined tuples.
+
+    Input:  schema  The binary schema eg [[0, 1, 1, 0, 0, 0],
+                    [0, 0, 1, 1, 0, 1], [0, 0, 0, 1, 1, 0]]
+    Output: eg [1, 4, 5]
+    """
+    return [attr for attr in xrange(len(schema[0]))
+            if sum(rel[attr] for rel in schema) == 1]
+
+
+def extendTupleValue(attributeValues, relationSchema):
+    """ eg extendTupleValue(['0', '21'], [0, 1, 1, 0, 0, 0]) =
+           ['_', '0', '21', '_', '_', '_']
+    """
+    extendedAttributeValues = ['_']*len(relationSchema)
+    j = 0
+    for i, v in enumerate(relationSchema):
+        if v == 1:
+            extendedAttributeValues[i] = attributeValues[j]
+            j += 1
+    return extendedAttributeValues
+
+
+def projectTuple(inputTuple, attrs, filler='_'):
+    """ eg projectTuple(['_', '0', '21', '_', '_', '_'], [1]) =
+           ['_', '_', '21', '_', '_', '_']
+    """
+    projected = list(inputTuple)
+    for attr in attrs:
+        if projected[attr] != '_':
+            projected[attr] = filler
+    return projected
+
+
+def relationOrder(sizes):
+    """ Orders the relations smallest first, the last one is streamed
+
+    Input:  sizes   The relation sizes eg [5000, 10000, 500]
+    Output: The 1-numbered relations eg [3, 1, 2]
+    """
+    return sorted(range(1, len(sizes) + 1), key=lambda r: (sizes[r-1], r))
+
+
+class multiwayJoin(object):
+
+    # streamJoin holds only the build relations
+    streamsProbe = True
+
+    def __init__(self, schema):
+        """ Input:  schema  The binary schema, as loaded from schema.p
+                            [
+                            [0, 1, 1, 0, 0, 0],
+                            [0, 0, 1, 1, 0, 1],
+                            [0, 0, 0, 1, 1, 0]
+                            ]
+        """
+        self.schema = schema
+        self.relationAttrs = [[attr for attr, v in enumerate(rel) if v == 1]
+                              for rel in schema]
+
+    def plan(self, sizes, probe=None):
+        """ Picks a join order from the relation cardinalities of a bucket.
+
+        The largest relation is streamed (probe). The other relations are
+        hashed (build) and looked up one after the other: the next one is
+        the smallest relation sharing an attribute with those already
+        joined, keyed on all the attributes it shares with them.
+
+        Input:  sizes   The number of tuples per relation eg [10, 500, 20]
+                probe   The 0-numbered relation to stream, if already fixed
+        Output: (probe, order) The 0-numbered probe relation and a list of
+                (relation, key attributes) build steps
+                eg (1, [(0, [2]), (2, [3])])
+        """
+        relations = range(len(self.schema))
+        if probe is None:
+            probe = max(relations, key=lambda r: (sizes[r], -r))
+        bound = set(self.relationAttrs[probe])
+        remaining = [r for r in relations if r != probe]
+        order = []
+        while remaining:
+            connected = [r for r in remaining
+                         if bound.intersection(self.relationAttrs[r])]
+            # A relation with no common attribute joins as a cross product
+            nxt = min(connected or remaining, key=lambda r: (sizes[r], r))
+            remaining.remove(nxt)
+            order.append((nxt, sorted(bound.intersection(
+                self.relationAttrs[nxt]))))
+            bound.update(self.relationAttrs[nxt])
+        return probe, order
+
+    def buildTables(self, tables, order, weighted=False):
+        """ Hashes every build relation on its key attributes
+
+        Input:  weighted    If True the tables hold (tuple, multiplicity)
+                            pairs, which are hashed as pairs
+        """
+        hashTables = []
+        for relation, keyAttrs in order:
+            h = defaultdict(list)
+            if weighted:
+                for entry in tables[relation]:
+                    t = entry[0]
+                    h[tuple(t[attr] for attr in keyAttrs)].append(entry)
+            else:
+                for t in tables[relation]:
+                    h[tuple(t[attr] for attr in keyAttrs)].append(t)
+            hashTables.append(h)
+        return hashTables
+
+    def probe(self, order, hashTables, probeTuples, countOnly=False):
+        """ Streams the probe tuples through the build hash tables.
+        Nothing but the current partial result is materialised.
+
+        Output: A generator of joined tuples over all attributes, or of
+                the number of joined tuples per probe tuple if countOnly
+        """
+        steps = [(self.relationAttrs[relation], keyAttrs, h)
+                 for (relation, keyAttrs), h in zip(order, hashTables)]
+        last = len(steps) - 1
+
+        def extend(partial, i):
+            attrs, keyAttrs, h = steps[i]
+            matches = h.get(tuple(partial[attr] for attr in keyAttrs), ())
+            if i == last:
+                if countOnly:
+                    yield len(matches)
+                    return
+                for match in matches:
+                    result = list(partial)
+                    for attr in attrs:
+                        result[attr] = match[attr]
+                    yield result
+                return
+            for match in matches:
+                result = list(partial)
+                for attr in attrs:
+                    result[attr] = match[attr]
+                for joined in extend(result, i + 1):
+                    yield joined
+
+        for t in probeTuples:
+            if not steps:
+                yield 1 if countOnly else list(t)
+                continue
+            for joined in extend(t, 0):
+                yield joined
+
+    def weightedProbe(self, order, hashTables, probeTuples, countOnly=False):
+        """ probe over (tuple, multiplicity) pairs of weighted build tables.
+        The multiplicity of a joined tuple is the product of those of the
+        tuples it joins.
+
+        Output: A generator of (joined tuple, multiplicity), or of the
+                number of joined tuples per probe pair if countOnly
+        """
+        steps = [(self.relationAttrs[relation], keyAttrs, h)
+                 for (relation, keyAttrs), h in zip(order, hashTables)]
+        last = len(steps) - 1
+
+        def extend(partial, weight, i):
+            attrs, keyAttrs, h = steps[i]
+            matches = h.get(tuple(partial[attr] for attr in keyAttrs), ())
+            if i == last and countOnly:
+                yield weight * sum(w for match, w in matches)
+                return
+            for match, w in matches:
+                result = list(partial)
+                for attr in attrs:
+                    result[attr] = match[attr]
+                if i == last:
+                    yield result, weight * w
+                    continue
+                for joined in extend(result, weight * w, i + 1):
+                    yield joined
+
+        for t, w in probeTuples:
+            if not steps:
+                yield w if countOnly else (list(t), w)
+                continue
+            for joined in extend(t, w, 0):
+                yield joined
+
+    def results(self, order, hashTables, probeTuples, countOnly, weighted):
+        """ The join results of probe, or of weightedProbe with every
+        joined tuple repeated by its multiplicity
+        """
+        if not weighted:
+            results = self.probe(order, hashTables, probeTuples, countOnly)
+        else:
+            results = self.weightedProbe(order, hashTables, probeTuples,
+                                         countOnly)
+            if not countOnly:
+                results = (joined for joined, w in results
+                           for _ in xrange(w))
+        if countOnly:
+            return sum(results)
+        return results
+
+    def join(self, tables, countOnly=False, weighted=False):
+        """ Joins the tuples of a bucket
+
+        Input:  tables  A list with the extended tuples of every relation
+                        eg [[['_', '0', '2', '_', '_', '_']], [...], [...]]
+                countOnly If True return the number of joined tuples
+                weighted If True the tables hold (tuple, multiplicity)
+                        pairs eg [[(['_', '0', '2', '_', '_', '_'], 3)], ...]
+
+        Output: A generator of joined tuples, or the number of them
+        """
+        sizes = [len(t) for t in tables]
+        if min(sizes) == 0:
+            return 0 if countOnly else iter(())
+        probe, order = self.plan(sizes)
+        hashTables = self.buildTables(tables, order, weighted)
+        return self.results(order, hashTables, tables[probe], countOnly,
+                            weighted)
+
+    def streamJoin(self, tables, probe, probeTuples, countOnly=False,
+                   weighted=False):
+        """ Joins a bucket whose probe relation arrives last, as an iterator.
+        Only the build relations are held in memory.
+
+        Input:  tables  A list with the extended tuples of every build
+                        relation, the entry of the probe relation is ignored
+                probe   The 0-numbered probe relation
+                probeTuples An iterator over the probe relation's tuples
+        """
+        sizes = [len(t) for t in tables]
+        sizes[probe] = 1
+        if min(sizes) == 0:
+            return 0 if countOnly else iter(())
+        probe, order = self.plan(sizes, probe)
+        hashTables = self.buildTables(tables, order, weighted)
+        return self.results(order, hashTables, probeTuples, countOnly,
+                            weighted)
+
+
+def buildTrie(rows, depth=0, weighted=False):
+    """ Builds a sorted trie from rows sorted on their keys
+
+    Input:  rows    A sorted list of key tuples eg [('1', '2'), ('1', '3')]
+            weighted If True the last field of a row is its multiplicity
+    Output: A node (keys, children) with the distinct sorted keys of the
+            level and one child per key. Leaves hold the multiplicity of
+            the row eg (['1'], [(['2', '3'], [1, 1])])
+    """
+    if not rows or depth == len(rows[0]) - weighted:
+        if weighted:
+            return sum(row[-1] for row in rows)
+        return len(rows)
+    keys = []
+    children = []
+    start = 0
+    while start < len(rows):
+        key = rows[start][depth]
+        end = start + 1
+        while end < len(rows) and rows[end][depth] == key:
+            end += 1
+        keys.append(key)
+        children.append(buildTrie(rows[start:end], depth + 1, weighted))
+        start = end
+    return (keys, children)
+
+
+def leapfrogIntersect(keyLists):
+    """ Intersects sorted key lists. The smallest list drives, the others
+    seek forward from their last position with binary search, so the cost
+    is O(min size * log(max size)).
+
+    Output: A list of (key, [position of the key in every list])
+    """
+    order = sorted(range(len(keyLists)), key=lambda i: len(keyLists[i]))
+    driver = keyLists[order[0]]
+    positions = [0] * len(keyLists)
+    result = []
+    for p, key in enumerate(driver):
+        positions[order[0]] = p
+        for i in order[1:]:
+            keys = keyLists[i]
+            j = bisect_left(keys, key, positions[i])
+            if j == len(keys):
+                return result
+            positions[i] = j
+            if keys[j] != key:
+                break
+        else:
+            result.append((key, list(positions)))
+    return result
+
+
+class trieJoin(object):
+
+    # streamJoin collects the probe relation into a trie like the others
+    streamsProbe = False
+
+    def __init__(self, schema):
+        """ Worst-case optimal join (Generic Join over sorted tries) of the
+        tuples of a bucket, for any schema in schema.p. Suited to cyclic
+        residual joins, eg the triangle R1(A1,A2), R2(A2,A3), R3(A3,A1),
+        where pairwise hash plans enumerate intermediates far larger
+        than the output.
+        """
+        self.schema = schema
+        self.relationAttrs = [[attr for attr, v in enumerate(rel) if v == 1]
+                              for rel in schema]
+        # Attributes shared by most relations are bound first
+        attrs = set(attr for attrs in self.relationAttrs for attr in attrs)
+        self.attributeOrder = sorted(
+            attrs, key=lambda a: (-sum(rel[a] for rel in schema), a))
+        rank = dict((attr, i) for i, attr in enumerate(self.attributeOrder))
+        self.trieAttrs = [sorted(attrs, key=rank.get)
+                          for attrs in self.relationAttrs]
+
+    def streamJoin(self, tables, probe, probeTuples, countOnly=False,
+                   weighted=False):
+        """ Tries need every relation, the probe relation is collected """
+        tables = list(tables)
+        tables[probe] = list(probeTuples)
+        return self.join(tables, countOnly, weighted)
+
+    def buildTries(self, tables, weighted=False):
+        """ Sorts every relation on the attribute order into a trie """
+        if weighted:
+            return [buildTrie(sorted(tuple(t[attr] for attr in attrs) + (w,)
+                                     for t, w in table), weighted=True)
+                    for attrs, table in zip(self.trieAttrs, tables)]
+        return [buildTrie(sorted(tuple(t[attr] for attr in attrs)
+                                 for t in table))
+                for attrs, table in zip(self.trieAttrs, tables)]
+
+    def join(self, tables, countOnly=False, weighted=False):
+        """ Joins the tuples of a bucket
+
+        Input:  tables  A list with the extended tuples of every relation
+                countOnly If True return the number of joined tuples
+                weighted If True the tables hold (tuple, multiplicity) pairs
+
+        Output: A generator of joined tuples, or the number of them
+        """
+        if min(len(t) for t in tables) == 0:
+            return 0 if countOnly else iter(())
+        tries = self.buildTries(tables, weighted)
+        levels = [[r for r, attrs in enumerate(self.relationAttrs)
+                   if attr in attrs] for attr in self.attributeOrder]
+        numberAttributes = len(self.schema[0])
+        attributeOrder = self.attributeOrder
+
+        def extend(nodes, level, joined):
+            if level == len(levels):
+                # Leaves hold the multiplicity of duplicate tuples
+                multiplicity = 1
+                for leaf in nodes:
+                    multiplicity *= leaf
+                yield multiplicity, joined
+                return
+            relations = levels[level]
+            for key, positions in leapfrogIntersect(
+                    [nodes[r][0] for r in relations]):
+                children = list(nodes)
+                for r, p in zip(relations, positions):
+                    children[r] = nodes[r][1][p]
+                partial = joined
+                if not countOnly:
+                    partial = list(joined)
+                    partial[attributeOrder[level]] = key
+                for result in extend(children, level + 1, partial):
+                    yield result
+
+        results = extend(tries, 0, ['_'] * numberAttributes)
+        if countOnly:
+            return sum(multiplicity for multiplicity, joined in results)
+        return (joined for multiplicity, joined in results
+                for _ in xrange(multiplicity))
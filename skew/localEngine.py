@@ -0,0 +1,387 @@
+#!/usr/bin/python
+
+""" localEngine Class
+
+    Runs a SharesSkewJob on one machine without Hadoop. A multiprocessing
+    pool of map tasks runs the job's own mapper over splits of the input
+    and partitions the pairs to the reduce tasks as Hadoop would, in spill
+    files per (map task, reduce task) under a shared memory directory. A
+    pool of reduce tasks then sorts and groups its spill files and runs the
+    job's reducer. The load and wall time of every reduce task are
+    reported.
+
+"""
+import os
+import shutil
+import tempfile
+import time
+from itertools import groupby
+from multiprocessing import Pool
+
+from mrjob.parse import parse_mr_job_stderr
+
+from cellIndex import keyFieldHash, keyFieldPartition
+
+# Spill files live in memory where the platform offers it
+SHARED_MEMORY = '/dev/shm'
+
+
+def textPartition(key, numberReducers):
+    """ The reduce task HashPartitioner sends a streaming key to. Its
+    Text.hashCode is the keyFieldHash of the key started from h = 1.
+    """
+    h = (pow(31, len(key), 2**32) + keyFieldHash(key)) & 0xFFFFFFFF
+    return (h & 0x7FFFFFFF) % numberReducers
+
+
+def textSplits(filenames, splitBytes):
+    """ Byte ranges of the input files, as Hadoop splits them
+
+    Output: A list of (filename, start, end)
+    """
+    splits = []
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        for start in xrange(0, size, splitBytes):
+            splits.append((filename, start, min(start + splitBytes, size)))
+    return splits
+
+
+def lineSplits(filenames):
+    """ A split per line, eg of a --binary-input manifest. The split of a
+    line starts on the newline before it, which splitLines skips.
+    """
+    splits = []
+    for filename in filenames:
+        start = 0
+        with open(filename, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    splits.append((filename, max(start - 1, 0), start))
+                start += len(line)
+    return splits
+
+
+def splitLines(filename, start, end):
+    """ The non empty lines of a split. As with Hadoop's LineRecordReader,
+    a split skips its first line unless it starts the file, and reads the
+    line that crosses or starts at its end.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        position = start
+        if start:
+            position += len(f.readline())
+        while position <= end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            line = line.rstrip('\r\n')
+            if line:
+                yield line
+
+
+def makeJob(jobClass, jobArgs):
+    job = jobClass(jobArgs)
+    job.sandbox()
+    return job
+
+
+def takeCounters(job, counters):
+    """ Adds the counters the job reported to its stderr, then clears it """
+    parse_mr_job_stderr(job.stderr.getvalue(), counters)
+    job.stderr.seek(0)
+    job.stderr.truncate()
+
+
+def spillFilename(directory, mapTask, reduceTask):
+    return os.path.join(directory, 'map-%05d-r-%05d' % (mapTask, reduceTask))
+
+
+def runMapTask(task):
+    """ Runs the job's mapper over a split, spilling the protocol encoded
+    pairs to a file per reduce task, combined if the job has a combiner
+
+    Input:  task    (jobClass, jobArgs, mapTask, split, numberReducers,
+                    spillDirectory, spillRecords)
+    Output: (counters, seconds)
+    """
+    (jobClass, jobArgs, mapTask, split, numberReducers, spillDirectory,
+     spillRecords) = task
+    start = time.time()
+    job = makeJob(jobClass, jobArgs)
+    step = job.steps()[0]
+    protocol = job.internal_protocol()
+    partition = partitioner(job, numberReducers)
+    counters = {}
+    buffers = [[] for r in xrange(numberReducers)]
+    buffered = [0]
+
+    def collect(pairs):
+        for key, value in pairs:
+            line = protocol.write(key, value)
+            buffers[partition(line)].append(line)
+            buffered[0] += 1
+            if buffered[0] >= spillRecords:
+                spill()
+
+    def spill():
+        takeCounters(job, counters)
+        for reduceTask, lines in enumerate(buffers):
+            if not lines:
+                continue
+            if step['combiner']:
+                lines = combine(step, protocol, lines)
+            with open(spillFilename(spillDirectory, mapTask, reduceTask),
+                      'ab') as f:
+                f.write('\n'.join(lines) + '\n')
+            buffers[reduceTask] = []
+        buffered[0] = 0
+
+    if step['mapper_init']:
+        collect(step['mapper_init']() or ())
+    if step['combiner_init']:
+        step['combiner_init']()
+    mapper = step['mapper']
+    for line in splitLines(*split):
+        collect(mapper(None, line) or ())
+    if step['mapper_final']:
+        collect(step['mapper_final']() or ())
+    spill()
+    takeCounters(job, counters)
+    return counters, time.time() - start
+
+
+def partitioner(job, numberReducers):
+    """ The reduce task of an encoded pair line, as the job's partitioner
+    would choose it
+    """
+    if job.partitioner():
+        # KeyFieldBasedPartitioner on the first '.' field of the key
+        return lambda line: keyFieldPartition(
+            line[:line.index('\t')].split('.', 1)[0], numberReducers)
+    if job.sort_values():
+        # mrjob's secondary sort partitions on the whole key with
+        # KeyFieldBasedPartitioner -k1,1
+        return lambda line: keyFieldPartition(line[:line.index('\t')],
+                                              numberReducers)
+    return lambda line: textPartition(line[:line.index('\t')],
+                                      numberReducers)
+
+
+def combine(step, protocol, lines):
+    """ Runs the job's combiner over a spill, sorted as Hadoop does """
+    lines.sort()
+    combined = []
+    for key, group in groupby(readPairs(protocol, lines), lambda kv: kv[0]):
+        combined.extend(protocol.write(k, v) for k, v in step['combiner'](
+            key, (value for _, value in group)))
+    return combined
+
+
+def readPairs(protocol, lines):
+    """ The (key, value) pairs of encoded lines """
+    return (protocol.read(line) for line in lines)
+
+
+def runReduceTask(task):
+    """ Sorts the spill files of a reduce task, groups them by key and runs
+    the job's reducer
+
+    Input:  task    (jobClass, jobArgs, reduceTask, numberMaps,
+                    spillDirectory, outputDirectory)
+    Output: A dict of the load and results of the task eg {'reducer': 3,
+            'values': 1200, 'bytes': 30000, 'buckets': 40, 'outputs': 40,
+            'joinResults': 5000, 'seconds': 0.2, 'counters': {...}}
+    """
+    (jobClass, jobArgs, reduceTask, numberMaps, spillDirectory,
+     outputDirectory) = task
+    start = time.time()
+    job = makeJob(jobClass, jobArgs)
+    step = job.steps()[0]
+    protocol = job.internal_protocol()
+    lines = []
+    for mapTask in xrange(numberMaps):
+        filename = spillFilename(spillDirectory, mapTask, reduceTask)
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                lines.extend(f.read().splitlines())
+    # Whole lines sort by key first, and by value for a secondary sort
+    lines.sort()
+    stats = {'reducer': reduceTask, 'values': len(lines),
+             'bytes': sum(len(line) + 1 for line in lines), 'buckets': 0,
+             'outputs': 0, 'joinResults': 0}
+    if step['reducer_init']:
+        step['reducer_init']()
+    output = None
+    if outputDirectory:
+        output = open(os.path.join(outputDirectory,
+                                   'part-%05d' % reduceTask), 'wb')
+        outputProtocol = job.output_protocol()
+    try:
+        for key, group in groupby(readPairs(protocol, lines),
+                                  lambda kv: kv[0]):
+            stats['buckets'] += 1
+            for outKey, outValue in step['reducer'](
+                    key, (value for _, value in group)):
+                stats['outputs'] += 1
+                if isinstance(outValue, (int, long)):
+                    # A join count
+                    stats['joinResults'] += outValue
+                else:
+                    stats['joinResults'] += 1
+                if output:
+                    output.write(outputProtocol.write(outKey, outValue) +
+                                 '\n')
+    finally:
+        if output:
+            output.close()
+    counters = {}
+    takeCounters(job, counters)
+    stats['counters'] = counters
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def mergeCounters(counters, more):
+    for group, values in more.iteritems():
+        for counter, amount in values.iteritems():
+            groupCounters = counters.setdefault(group, {})
+            groupCounters[counter] = groupCounters.get(counter, 0) + amount
+    return counters
+
+
+class localEngine(object):
+
+    def __init__(self, jobClass, jobArgs, numberReducers=None, workers=None,
+                 splitBytes=64 * 1024 * 1024, spillRecords=1000000,
+                 spillDirectory=None):
+        """ Input:  jobClass    eg sharesskew.SharesSkewJob
+                    jobArgs     The job's options without inputs eg
+                                ['--schemaFile', 'schema.p', ...]
+                    numberReducers The reduce tasks, --reduce-number of the
+                                job if given
+                    workers     The processes of the map and reduce pools,
+                                the number of cores if None, 0 runs every
+                                task in this process
+                    splitBytes  The bytes of an input split
+                    spillRecords The pairs a map task buffers before
+                                spilling them
+                    spillDirectory The parent of the spill files, shared
+                                memory if available
+        """
+        self.jobClass = jobClass
+        self.jobArgs = list(jobArgs)
+        self.job = makeJob(jobClass, self.jobArgs)
+        self.numberReducers = (self.job.options.reduce_number or
+                               numberReducers)
+        if not self.numberReducers:
+            raise ValueError('The number of reducers is not given')
+        self.workers = workers
+        self.splitBytes = splitBytes
+        self.spillRecords = spillRecords
+        if spillDirectory is None and os.access(SHARED_MEMORY, os.W_OK):
+            spillDirectory = SHARED_MEMORY
+        self.spillDirectory = spillDirectory
+
+    def splits(self, inputs):
+        if self.job.options.binary_input:
+            # Every manifest line is a split of its column file
+            return lineSplits(inputs)
+        return textSplits(inputs, self.splitBytes)
+
+    def run(self, inputs, outputDirectory=None):
+        """ Runs the job over input files
+
+        Input:  inputs      Text input files, or --binary-input manifests
+                outputDirectory Where the reduce tasks write part-NNNNN
+                            files, nothing is written if None
+        Output: A dict eg {'wallSeconds': 2.1, 'mapSeconds': 1.4,
+                'reduceSeconds': 0.7, 'mapTasks': 4, 'joinResults': 5060,
+                'outputs': 338, 'reducers': [runReduceTask dicts],
+                'counters': {'group': {'intermediate_tuples': 3058, ...}}}
+        """
+        start = time.time()
+        directory = tempfile.mkdtemp(prefix='sharesskew-',
+                                     dir=self.spillDirectory)
+        pool = None
+        if self.workers != 0:
+            pool = Pool(self.workers)
+        run = pool.map if pool else map
+        try:
+            splits = self.splits(inputs)
+            mapResults = run(runMapTask, [
+                (self.jobClass, self.jobArgs, mapTask, split,
+                 self.numberReducers, directory, self.spillRecords)
+                for mapTask, split in enumerate(splits)])
+            mapSeconds = time.time() - start
+            if outputDirectory and not os.path.isdir(outputDirectory):
+                os.makedirs(outputDirectory)
+            reducers = run(runReduceTask, [
+                (self.jobClass, self.jobArgs, reduceTask, len(splits),
+                 directory, outputDirectory)
+                for reduceTask in xrange(self.numberReducers)])
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            shutil.rmtree(directory)
+        counters = {}
+        for mapCounters, seconds in mapResults:
+            mergeCounters(counters, mapCounters)
+        for stats in reducers:
+            mergeCounters(counters, stats['counters'])
+        wallSeconds = time.time() - start
+        return {'wallSeconds': wallSeconds, 'mapSeconds': mapSeconds,
+                'reduceSeconds': wallSeconds - mapSeconds,
+                'mapTasks': len(splits),
+                'joinResults': sum(s['joinResults'] for s in reducers),
+                'outputs': sum(s['outputs'] for s in reducers),
+                'reducers': reducers, 'counters': counters}
+
+
+def printReport(report):
+    print '%8s %12s %12s %10s %14s %10s' % ('reducer', 'values', 'bytes',
+                                            'buckets', 'join results',
+                                            'seconds')
+    for stats in report['reducers']:
+        print '%8d %12d %12d %10d %14d %10.3f' % (
+            stats['reducer'], stats['values'], stats['bytes'],
+            stats['buckets'], stats['joinResults'], stats['seconds'])
+    loads = [stats['values'] for stats in report['reducers']]
+    mean = float(sum(loads)) / len(loads)
+    print 'map tasks %d, map %.2fs, reduce %.2fs, wall %.2fs' % (
+        report['mapTasks'], report['mapSeconds'], report['reduceSeconds'],
+        report['wallSeconds'])
+    print 'join results %d, max / mean reducer load %.3f' % (
+        report['joinResults'], max(loads) / mean if mean else 0.0)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), '..'))
+    from sharesskew import SharesSkewJob
+    parser = argparse.ArgumentParser(
+        description='Runs SharesSkewJob locally with multiprocessing map and '
+                    'reduce tasks. Job options follow --, eg -- '
+                    '--schemaFile schema.p --residualsFile residualjoins.p '
+                    '--sharesFile shares.p --hhFile heavyhitters.p')
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--reducers', type=int, default=None,
+                        help='Reduce tasks, unless --reduce-number is given')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--split-mb', type=int, default=64)
+    parser.add_argument('--spill-records', type=int, default=1000000)
+    parser.add_argument('--output-dir', default=None)
+    argv = sys.argv[1:]
+    jobArgs = []
+    if '--' in argv:
+        jobArgs = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+    engine = localEngine(SharesSkewJob, jobArgs, args.reducers, args.workers,
+                         args.split_mb * 1024 * 1024, args.spill_records)
+    printReport(engine.run(args.inputs, args.output_dir))
@@ -0,0 +1,23 @@
+#!/usr/bin/python
+
+""" Plan files
+
+    A plan of --planFile in one pickle, written by the planner and loaded
+    by queryPlan. Kept apart from queryPlan so that the planner does not
+    import the job side modules.
+
+"""
+import pickle
+
+
+def writePlanFile(filename, schema, residuals, shares, heavyhitters,
+                  relationSizes=None):
+    """ Writes the pickles of a plan, see premap.writePlan, as one file
+
+    Input:  relationSizes   Orders the relations for --secondary-sort,
+                            schema order if None
+    """
+    with open(filename, 'wb') as f:
+        pickle.dump({'schema': schema, 'residuals': list(residuals),
+                     'shares': shares, 'heavyhitters': heavyhitters,
+                     'sizes': relationSizes}, f)
@@ -4,8 +4,16 @@
 
 """
 import itertools
+import math
+import os
+import pickle
+from collections import OrderedDict
+from multiprocessing import Pool
 
 import sharesJoin
+import sharesOptimizer
+from planFile import writePlanFile
+from sharesCache import sharesCache
 
 heavyHittersFilename = 'heavyhitters.txt'
 sizesFilename = 'relationsizes.txt'
@@ -185,16 +193,19 @@ def replaceSize(combination, relationSizes, hhinfo):
             p = [1.0 - p_r for p_r in p_bar]
         else:
             value = float(value)
-# -0.0 denotes non participation in relation for this attribute
-            p = [p_r if p_r != -0.0 else 1.0 for p_r in hhinfo['attributes']
-                 [attr][value]['relations']]
+# -0.0 denotes non participation in relation for this attribute, a
+# participating relation may hold the value 0.0 times
+            p = [p_r if math.copysign(1.0, p_r) > 0 else 1.0
+                 for p_r in hhinfo['attributes'][attr][value]['relations']]
         relationSizes = [p_i * sizes_i
                          for p_i, sizes_i in zip(p, relationSizes)]
     return relationSizes
 
 
-def calculateResidualJoins(heavyHittersFilename, numberAttributes, numberReducers, relationSizes):
+def calculateResidualJoins(heavyHittersFilename, numberAttributes, numberReducers, relationSizes, solver='builtin'):
     """ Calculates all residual joins shares
+
+    solver  'builtin' (sharesOptimizer) or 'couenne' (minlpSolver)
     """
     sharesAllResiduals = []
     hhinfo, hh = readHeavyHitters(heavyHittersFilename, numberAttributes)
@@ -208,7 +219,8 @@ def calculateResidualJoins(heavyHittersFilename, numberAttributes, numberReducer
             else:
                 heavyhittersList.append(attr)
         s = sharesJoin.sharesCalculator(readSchema(schemaFilename, numberAttributes),
-                                        numberAttributes, skewedRelationSizes, numberReducers, heavyhittersList, None)
+                                        numberAttributes, skewedRelationSizes, numberReducers, heavyhittersList, None,
+                                        solver)
 
         # print "Residual join: ",
         # print ','.join(str(c) for c in cmb)
@@ -224,8 +236,10 @@ def calculateResidualJoins(heavyHittersFilename, numberAttributes, numberReducer
     return (combs, sharesAllResiduals)
 
 
-def calculateResidualJoinsQ(heavyHittersFilename, numberAttributes, reducerCapacity, relationSizes):
+def calculateResidualJoinsQ(heavyHittersFilename, numberAttributes, reducerCapacity, relationSizes, cache=None):
     """ Calculates all residual joins shares
+
+    cache   A sharesCache, residual joins with an entry skip the solver
     """
     sharesAllResiduals = []
     hhinfo, hh = readHeavyHitters(heavyHittersFilename, numberAttributes)
@@ -252,5 +266,377 @@ def calculateResidualJoinsQ(heavyHittersFilename, numberAttributes, reducerCapac
         # print s.dominatingAttrs
         # print s.dominatedAttrs
         # print s.expressionVars
-        sharesAllResiduals.append(s.getShares())
+        if cache is None:
+            sharesAllResiduals.append(s.getShares())
+            continue
+        # The capacity constraint is not scale free, sizes are kept as is.
+        # sharesCalculatorQ always solves with couenne
+        key = cache.key(s.expressionVars, s.relationSizes, reducerCapacity,
+                        scaleFree=False, solver='couenne')
+        shares = cache.get(key)
+        if shares is None:
+            shares = s.getShares()[0]
+            cache.put(key, shares)
+        sharesAllResiduals.append(cachedShares(
+            shares, s.expressionVars, s.relationSizes,
+            reduce(lambda x, y: x * y, shares.values(), 1)))
+    if cache is not None:
+        cache.save()
     return (combs, sharesAllResiduals)
+
+
+def residualCalculator(cmb, schema, numberAttributes, relationSizes,
+                       numberReducers, hhinfo, solver='builtin'):
+    """ The sharesCalculator of a residual join """
+    skewedRelationSizes = replaceSize(cmb, relationSizes, hhinfo)
+    heavyhittersList = [attr for attr, value in enumerate(cmb)
+                        if value != '_']
+    return sharesJoin.sharesCalculator(schema, numberAttributes,
+                                       skewedRelationSizes, numberReducers,
+                                       heavyhittersList, None, solver)
+
+
+def planResidualJoin(calculator):
+    """ The unit of work of planResidualJoins """
+    return calculator.getShares()
+
+
+def solveResidualJoins(calculators, workers=None):
+    """ The getShares output of every calculator, in order, over a process
+    pool of workers processes; 1 solves in the calling process
+    """
+    if workers == 1 or len(calculators) < 2:
+        return map(planResidualJoin, calculators)
+    pool = Pool(workers)
+    try:
+        return pool.map(planResidualJoin, calculators, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def cachedShares(shares, expressionVars, relationSizes, perReducer):
+    """ The getShares output for shares taken from a sharesCache, with the
+    communication cost of the actual relation sizes
+    """
+    com_cost = sharesOptimizer.communicationCost(expressionVars,
+                                                 relationSizes, shares)
+    return (shares, com_cost, com_cost / float(perReducer))
+
+
+def planResidualJoins(heavyHittersFilename, numberAttributes, numberReducers,
+                      relationSizes, workers=None, solver='builtin',
+                      schemaFilename=schemaFilename, cache=None):
+    """ calculateResidualJoins over a process pool. The schema is read once
+    and the residual joins are planned independently, the output keeps
+    the order of combinations(hh).
+
+    workers The number of processes, all cores if None, 1 plans in the
+            calling process
+    cache   A sharesCache. Only residual joins without an entry, one per
+            distinct entry, are solved; the cache is saved afterwards
+    """
+    hhinfo, hh = readHeavyHitters(heavyHittersFilename, numberAttributes)
+    schema = readSchema(schemaFilename, numberAttributes)
+    combs = combinations(hh)
+    calculators = [residualCalculator(cmb, schema, numberAttributes,
+                                      relationSizes, numberReducers, hhinfo,
+                                      solver) for cmb in combs]
+    if cache is None:
+        keys = range(len(calculators))
+        solved = {}
+    else:
+        keys = [cache.key(s.expressionVars, s.relationSizes, numberReducers,
+                          solver=solver) for s in calculators]
+        solved = dict((key, cache.get(key)) for key in set(keys))
+        solved = dict((key, shares) for key, shares in solved.iteritems()
+                      if shares is not None)
+    # One problem per distinct key, in combinations(hh) order
+    tasks = OrderedDict()
+    for key, s in zip(keys, calculators):
+        if key not in solved and key not in tasks:
+            tasks[key] = s
+    results = dict(zip(tasks.keys(),
+                       solveResidualJoins(tasks.values(), workers)))
+    if cache is None:
+        return (combs, [results[key] for key in keys])
+    for key, result in results.iteritems():
+        solved[key] = result[0]
+        cache.put(key, result[0])
+    cache.save()
+    return (combs, [cachedShares(dict(solved[key]), s.expressionVars,
+                                 s.relationSizes, numberReducers)
+                    for key, s in zip(keys, calculators)])
+
+
+def planResidualJoinsGlobal(heavyHittersFilename, numberAttributes,
+                            numberReducers, relationSizes,
+                            schemaFilename=schemaFilename):
+    """ Plans the residual joins within one budget of numberReducers reduce
+    tasks, instead of numberReducers each. See
+    sharesOptimizer.allocateReducers.
+
+    Output: (combs, sharesAllResiduals) as planResidualJoins, the products
+            of the shares add up to numberReducers
+    """
+    hhinfo, hh = readHeavyHitters(heavyHittersFilename, numberAttributes)
+    schema = readSchema(schemaFilename, numberAttributes)
+    combs = combinations(hh)
+    calculators = [residualCalculator(cmb, schema, numberAttributes,
+                                      relationSizes, numberReducers, hhinfo)
+                   for cmb in combs]
+    return (combs, sharesOptimizer.allocateReducers(
+        [(s.expressionVars, s.relationSizes) for s in calculators],
+        numberReducers))
+
+
+def signedFractions(relations):
+    """ HH fractions comparable with ==, -0.0 (non participation) differs
+    from 0.0
+    """
+    return tuple((p_r, math.copysign(1.0, p_r)) for p_r in relations)
+
+
+def replaceSizeInputs(combination, hhinfo):
+    """ The heavy hitter fractions replaceSize reads for a residual join.
+    Two residual joins with equal inputs have equal sizes.
+
+    Output: A tuple with an entry per HH attribute, the signedFractions of
+            its value or, for an ordinary value, of all its HH values
+    """
+    inputs = []
+    for attr, value in enumerate(combination):
+        if attr not in hhinfo['attributes']:
+            continue
+        values = hhinfo['attributes'][attr]
+        if value == '_':
+            inputs.append(tuple(sorted(
+                (hhval, signedFractions(values[hhval]['relations']))
+                for hhval in values)))
+        else:
+            inputs.append(signedFractions(values[float(value)]['relations']))
+    return tuple(inputs)
+
+
+def diffHeavyHitters(previousHHinfo, hhinfo):
+    """ The heavy hitters added, removed and whose fractions changed
+
+    Input:  previousHHinfo, hhinfo  readHeavyHitters outputs
+    Output: (added, removed, changed) lists of (attribute, value)
+            eg ([(3, 33)], [(3, 32)], [(2, 2)])
+    """
+    def fractions(info):
+        return dict(((attr, value), signedFractions(v['relations']))
+                    for attr, values in info['attributes'].iteritems()
+                    for value, v in values.iteritems())
+    previous, current = fractions(previousHHinfo), fractions(hhinfo)
+    added = sorted(hh for hh in current if hh not in previous)
+    removed = sorted(hh for hh in previous if hh not in current)
+    changed = sorted(hh for hh in current
+                     if hh in previous and previous[hh] != current[hh])
+    return (added, removed, changed)
+
+
+def readPlan(directory='.'):
+    """ The residual joins and shares dicts of a plan written by writePlan """
+    with open(os.path.join(directory, 'residualjoins.p'), 'rb') as f:
+        combs = pickle.load(f)
+    with open(os.path.join(directory, 'shares.p'), 'rb') as f:
+        shares = pickle.load(f)
+    return (combs, shares)
+
+
+def replanResidualJoins(previousCombs, previousShares,
+                        previousHeavyHittersFilename, heavyHittersFilename,
+                        numberAttributes, numberReducers, relationSizes,
+                        workers=None, solver='builtin',
+                        schemaFilename=schemaFilename):
+    """ planResidualJoins after the heavy hitters changed. Only residual
+    joins that are new, or whose replaceSize inputs changed, are solved;
+    the others keep their previous shares.
+
+    Input:  previousCombs, previousShares   The previous plan, see readPlan
+            previousHeavyHittersFilename    The heavyhitters.txt it was
+                                            planned from
+            relationSizes   The relation sizes of both plans
+    Output: (combs, sharesAllResiduals, replanned) where replanned lists
+            the indices of the solved residual joins
+    """
+    previousHHinfo, previousHH = readHeavyHitters(
+        previousHeavyHittersFilename, numberAttributes)
+    hhinfo, hh = readHeavyHitters(heavyHittersFilename, numberAttributes)
+    schema = readSchema(schemaFilename, numberAttributes)
+    previous = dict(zip(previousCombs, previousShares))
+    combs = combinations(hh)
+    calculators = [residualCalculator(cmb, schema, numberAttributes,
+                                      relationSizes, numberReducers, hhinfo,
+                                      solver) for cmb in combs]
+    replanned = []
+    for i, cmb in enumerate(combs):
+        shares = previous.get(cmb)
+        # Shares of another number of reducers are not reused
+        if (shares is None or
+                (shares and reduce(lambda x, y: x * y, shares.values()) !=
+                 numberReducers) or
+                replaceSizeInputs(cmb, previousHHinfo) !=
+                replaceSizeInputs(cmb, hhinfo)):
+            replanned.append(i)
+    results = dict(zip(replanned, solveResidualJoins(
+        [calculators[i] for i in replanned], workers)))
+    sharesAllResiduals = []
+    for i, (cmb, s) in enumerate(zip(combs, calculators)):
+        if i in results:
+            sharesAllResiduals.append(results[i])
+        else:
+            sharesAllResiduals.append(cachedShares(
+                dict(previous[cmb]), s.expressionVars, s.relationSizes,
+                numberReducers))
+    return (combs, sharesAllResiduals, replanned)
+
+
+def broadcastResiduals(combs, sharesAllResiduals, relationSizes, hhinfo,
+                       threshold, numberMappers=1):
+    """ Flags the residual joins to join map-side: all relations but the
+    largest hold at most threshold tuples, and shipping them to every
+    mapper costs less than the communication cost of shuffling the
+    residual join.
+
+    Input:  sharesAllResiduals  The getShares output of every residual
+            threshold       The largest size of a broadcast relation
+            numberMappers   The number of map tasks of the job
+    Output: A dict from residual id to its large 1-numbered relation
+            eg {35: 2}
+    """
+    broadcast = {}
+    for residualId, cmb in enumerate(combs):
+        sizes = replaceSize(cmb, relationSizes, hhinfo)
+        large = max(xrange(len(sizes)), key=lambda r: (sizes[r], -r))
+        small = [size for r, size in enumerate(sizes) if r != large]
+        if max(small or [0]) > threshold:
+            continue
+        if sum(small) * numberMappers < sharesAllResiduals[residualId][1]:
+            broadcast[residualId] = large + 1
+    return broadcast
+
+
+def writePlan(combs, sharesAllResiduals, directory='.', broadcast=None):
+    """ Writes residualjoins.p, heavyhitters.p and shares.p as
+    SharesSkewJob.mapper_init loads them
+
+    Input:  combs               The residual joins
+                                eg [('_', '_', '_', '_', '_', '_'),
+                                    ('_', '_', '_', '31', '_', '_')]
+            sharesAllResiduals  The getShares output of every residual join
+            broadcast           The broadcastResiduals of the plan, if any
+    Output: heavyhitters.p holds a dict per residual join from a HH
+            attribute to its value eg [{}, {3: '31'}], shares.p the shares
+            dicts eg [{'2': 8, '3': 8}, {'2': 64, '4': 1}], broadcast.p the
+            broadcast dict. Broadcast residual joins are not shuffled and
+            get share 1 everywhere.
+    """
+    if broadcast is not None:
+        sharesAllResiduals = [({}, 0, 0) if residualId in broadcast
+                              else residualShares for residualId,
+                              residualShares in enumerate(sharesAllResiduals)]
+        with open(os.path.join(directory, 'broadcast.p'), 'wb') as f:
+            pickle.dump(broadcast, f)
+    for filename, obj in zip(['residualjoins.p', 'heavyhitters.p',
+                              'shares.p'],
+                             planPickles(combs, sharesAllResiduals)):
+        with open(os.path.join(directory, filename), 'wb') as f:
+            pickle.dump(obj, f)
+
+
+def planPickles(combs, sharesAllResiduals):
+    """ The (residual joins, heavy hitters, shares) writePlan pickles """
+    heavyhitters = [dict((attr, value) for attr, value in enumerate(cmb)
+                         if value != '_') for cmb in combs]
+    shares = [residualShares[0] for residualShares in sharesAllResiduals]
+    return (list(combs), heavyhitters, shares)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Plans the residual joins of a query and writes '
+                    'residualjoins.p, heavyhitters.p and shares.p')
+    parser.add_argument('--heavyhitters', default=heavyHittersFilename)
+    parser.add_argument('--sizes', default=sizesFilename)
+    parser.add_argument('--schema', default=schemaFilename)
+    parser.add_argument('--attributes', type=int, default=6,
+                        help='The total number of attributes eg 6: [A0:A5]')
+    parser.add_argument('--reducers', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Planning processes, all cores by default')
+    parser.add_argument('--solver', default='builtin',
+                        choices=['builtin', 'couenne'])
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--cache', default=None,
+                        help='A sharesCache pickle, eg sharescache.p')
+    parser.add_argument('--cache-tolerance', type=float, default=0.01)
+    parser.add_argument('--previous-plan', default=None,
+                        help='The directory of the plan to update, only '
+                             'residual joins that changed are re-planned')
+    parser.add_argument('--previous-heavyhitters', default=None,
+                        help='The heavyhitters.txt of --previous-plan')
+    parser.add_argument('--plan-file', default=None,
+                        help='Also write the plan as one file for '
+                             'sharesskew.py --planFile')
+    parser.add_argument('--broadcast-threshold', type=int, default=0,
+                        help='Join residual joins map-side when all their '
+                             'relations but one hold at most this many '
+                             'tuples and that is cheaper, 0 never does')
+    parser.add_argument('--mappers', type=int, default=1,
+                        help='Map tasks the broadcast relations are '
+                             'shipped to')
+    parser.add_argument('--global-budget', action='store_true',
+                        help='Split --reducers across the residual joins '
+                             'instead of giving each all of them')
+    args = parser.parse_args()
+    if args.previous_plan and not args.previous_heavyhitters:
+        parser.error('--previous-plan requires --previous-heavyhitters')
+    if args.global_budget and (args.previous_plan or args.cache or
+                               args.solver != 'builtin'):
+        parser.error('--global-budget plans from scratch with the builtin '
+                     'solver')
+    if args.global_budget:
+        combs, sharesAllResiduals = planResidualJoinsGlobal(
+            args.heavyhitters, args.attributes, args.reducers,
+            readRelationSizes(args.sizes), args.schema)
+    elif args.previous_plan:
+        previousCombs, previousShares = readPlan(args.previous_plan)
+        combs, sharesAllResiduals, replanned = replanResidualJoins(
+            previousCombs, previousShares, args.previous_heavyhitters,
+            args.heavyhitters, args.attributes, args.reducers,
+            readRelationSizes(args.sizes), args.workers, args.solver,
+            args.schema)
+        added, removed, changed = diffHeavyHitters(
+            readHeavyHitters(args.previous_heavyhitters, args.attributes)[0],
+            readHeavyHitters(args.heavyhitters, args.attributes)[0])
+        print 'Heavy hitters added %d, removed %d, changed %d' % (
+            len(added), len(removed), len(changed))
+        print 'Re-planned %d of %d residual joins' % (len(replanned),
+                                                      len(combs))
+    else:
+        cache = None
+        if args.cache:
+            cache = sharesCache(args.cache, tolerance=args.cache_tolerance)
+        combs, sharesAllResiduals = planResidualJoins(
+            args.heavyhitters, args.attributes, args.reducers,
+            readRelationSizes(args.sizes), args.workers, args.solver,
+            args.schema, cache)
+    broadcast = None
+    if args.broadcast_threshold:
+        broadcast = broadcastResiduals(
+            combs, sharesAllResiduals, readRelationSizes(args.sizes),
+            readHeavyHitters(args.heavyhitters, args.attributes)[0],
+            args.broadcast_threshold, args.mappers)
+        print 'Residual joins joined map-side: %d of %d' % (len(broadcast),
+                                                            len(combs))
+    writePlan(combs, sharesAllResiduals, args.output_dir, broadcast)
+    if args.plan_file:
+        residuals, heavyhitters, shares = planPickles(combs,
+                                                      sharesAllResiduals)
+        writePlanFile(args.plan_file,
+                      readSchema(args.schema, args.attributes), residuals,
+                      shares, heavyhitters, readRelationSizes(args.sizes))
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+""" queryPlan Class
+
+    One of several join plans a SharesSkewJob routes in the same scan of
+    the input. Holds the mapper side state mapper_init builds for a single
+    plan, and tags the reducer keys of the plan with its id.
+
+"""
+from cellIndex import cellIndex
+from joinEngine import privateAttributes, projectTuple, relationOrder
+from router import residualRouter
+from shareGrid import shareGrid
+from valueCodec import packedCodec
+
+
+def keyPlanId(key):
+    """ The plan id of a reducer key of queryPlan.keys
+
+    eg keyPlanId('1/_-_-2-_-_-_.3.0.0.0.0') = 1, keyPlanId('7.1/52') = 1
+    """
+    return int(key[:key.index('/')].rsplit('.', 1)[-1])
+
+
+class queryPlan(object):
+
+    def __init__(self, planId, plan, keyFormat='string', numberReducers=None,
+                 internalFormat='json', packedWidth='64', project=False,
+                 hashing=None):
+        """ Input:  planId      The index of the plan in the job
+                    plan        The dict of a writePlanFile pickle
+                    keyFormat, numberReducers, internalFormat, packedWidth
+                                The options of the job
+                    project     If True values drop the attributes no join
+                                compares, see joinEngine.privateAttributes
+                    hashing     A function from the number of attributes
+                                to the attributeHash of the job, modulo if
+                                None
+        """
+        self.planId = planId
+        self.schema = plan['schema']
+        self.residuals = plan['residuals']
+        heavyhitters = plan['heavyhitters']
+        hhinvertedIndex = {}
+        for hh in heavyhitters:
+            for attr, value in hh.iteritems():
+                hhinvertedIndex[(attr, value)] = 'HH'
+        self.router = residualRouter(self.schema, self.residuals,
+                                     hhinvertedIndex)
+        self.grid = shareGrid(self.schema, self.residuals, plan['shares'],
+                              heavyhitters,
+                              hashing(len(self.schema[0])) if hashing
+                              else None)
+        self.keyFormat = keyFormat
+        if keyFormat == 'cell':
+            self.cells = cellIndex(self.grid, numberReducers)
+        self.sizes = plan.get('sizes')
+        self.relationRanks = dict(
+            (relation, rank) for rank, relation in enumerate(
+                self.relationOrder()))
+        self.internalFormat = internalFormat
+        if internalFormat == 'packed':
+            self.codec = packedCodec(self.schema, packedWidth)
+        self.projected = privateAttributes(self.schema) if project else []
+
+    def relationOrder(self):
+        """ The 1-numbered relations, smallest first """
+        if not self.sizes:
+            return range(1, len(self.schema) + 1)
+        return relationOrder(self.sizes)
+
+    def value(self, relation, inputTuple, secondarySort=False):
+        """ The mapper value of a tuple, as identityMapper encodes it
+
+        Input:  relation    The 1-numbered relation
+        """
+        rank = self.relationRanks[relation] if secondarySort else 0
+        if self.projected:
+            inputTuple = projectTuple(
+                inputTuple, self.projected,
+                '0' if self.internalFormat == 'packed' else '_')
+        if self.internalFormat == 'packed':
+            return self.codec.pack(relation, inputTuple, rank)
+        value = str(relation) + ":" + "+".join(inputTuple)
+        if secondarySort:
+            value = '%02d:' % rank + value
+        return value
+
+    def keys(self, relation, inputTuple):
+        """ The reducer keys of a tuple in all residual joins of the plan.
+        String keys are prefixed with '<plan id>/', cell keys keep the
+        task label first, for the partitioner, as '<label>.<plan id>/<cell>'
+
+        Input:  relation    The 0-numbered relation of the tuple
+        """
+        keys = []
+        for residualId in self.router.route(relation, inputTuple):
+            if self.keyFormat == 'cell':
+                keys.extend(
+                    self.cells.labels[self.cells.task(cellId)] + '.' +
+                    str(self.planId) + '/' + str(cellId)
+                    for cellId in self.cells.cellIds(relation, residualId,
+                                                     inputTuple))
+            else:
+                prefix = str(self.planId) + '/'
+                keys.extend(prefix + key for key in
+                            self.grid.keys(relation, residualId, inputTuple))
+        return keys
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+""" residualRouter Class
+
+    Compiles the residual joins of a plan into a lookup table that sends an
+    input tuple to the residual joins it belongs to.
+
+"""
+from collections import defaultdict
+
+
+class residualRouter(object):
+
+    def __init__(self, schema, residuals, hhinvertedIndex):
+        """ Builds, for every relation, a dict from the heavy hitter
+        signature of a tuple to the ids of the matching residual joins.
+
+        Input:  schema          The binary schema, as loaded from schema.p
+                                [
+                                [0, 1, 1, 0, 0, 0],
+                                [0, 0, 1, 1, 0, 1],
+                                [0, 0, 0, 1, 1, 0]
+                                ]
+                residuals       The residual joins, as loaded from
+                                residualjoins.p
+                                eg [('_', '_', '_', '_', '_', '_'),
+                                    ('_', '_', '_', '31', '_', '_'), ...]
+                hhinvertedIndex A dict with an entry for every
+                                (attribute, hh value) pair
+                                eg {(2, '21'): 'HH', (3, '31'): 'HH'}
+        """
+        self.schema = schema
+        self.hhinvertedIndex = hhinvertedIndex
+        # Attributes that take a non ordinary value in some residual join
+        hhAttrs = set(attr for (attr, value) in hhinvertedIndex)
+        for residual in residuals:
+            hhAttrs.update(attr for attr, value in enumerate(residual)
+                           if value != '_')
+        hhAttrs = sorted(hhAttrs)
+        # Only the HH attributes a relation contains decide its residuals
+        self.relationHHAttrs = [[attr for attr in hhAttrs if rel[attr] == 1]
+                                for rel in schema]
+        self.routes = [self.compileRelation(attrs, residuals)
+                       for attrs in self.relationHHAttrs]
+
+    def compileRelation(self, attrs, residuals):
+        """ Groups residual joins by their values on the given attributes
+
+        Input:  attrs       The HH attributes of a relation eg [2, 3]
+                residuals   The residual joins of the plan
+
+        Output: A dict from a signature to a list of residual ids
+                eg {('_', '_'): [0, 6, 12], ('21', '31'): [7], ...}
+        """
+        routes = defaultdict(list)
+        for residualId, residual in enumerate(residuals):
+            signature = tuple(residual[attr] for attr in attrs)
+            routes[signature].append(residualId)
+        return dict(routes)
+
+    def signature(self, relation, inputTuple):
+        """ The HH signature of a tuple on the HH attributes of its relation:
+        the value itself for HH values and '_' for ordinary ones.
+
+        Input:  relation    The 0-numbered relation of the tuple
+                inputTuple  The extended tuple eg ['_', '0', '21', '_', ...]
+        """
+        hhinverted = self.hhinvertedIndex
+        return tuple(inputTuple[attr]
+                     if (attr, inputTuple[attr]) in hhinverted else '_'
+                     for attr in self.relationHHAttrs[relation])
+
+    def route(self, relation, inputTuple):
+        """ Returns the ids of the residual joins the tuple belongs to, in
+        residualjoins.p order. Same answer as calling decideSingleResidual
+        for every residual join, in O(attributes).
+        """
+        return self.routes[relation].get(
+            self.signature(relation, inputTuple), ())
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+""" shareGrid Class
+
+    Precomputes, for every (relation, residual join) pair, everything the
+    mapper needs to turn a tuple into its reducer keys.
+
+"""
+from itertools import product
+
+from hashing import attributeHash
+
+
+def shareVector(share, heavyhitters, numberAttributes):
+    """ Completes the shares of a residual join into a frozen vector with a
+    share for every attribute of the schema.
+
+    Input:  share       The shares dict of a residual join from shares.p
+                        eg {'1': 11, '5': 4, '4': 8}
+            heavyhitters The HH attributes of the residual join
+                        eg {2: '21', 3: '31'}
+            numberAttributes The total number of attributes eg 6
+
+    Output: A tuple of shares, HH attributes and attributes missing from
+            the MINLP solution get share 1
+            eg (1, 11, 1, 1, 8, 4)
+    """
+    vector = [1] * numberAttributes
+    for attr, value in share.iteritems():
+        vector[int(attr)] = int(value)
+    for attr in heavyhitters:
+        vector[int(attr)] = 1
+    return tuple(vector)
+
+
+class shareGrid(object):
+
+    def __init__(self, schema, residuals, shares, heavyhitters,
+                 hashing=None):
+        """ Input:  schema      The binary schema from schema.p
+                    residuals   The residual joins from residualjoins.p
+                    shares      The shares dicts from shares.p, left intact
+                    heavyhitters The HH dicts from heavyhitters.p
+                    hashing     The attributeHash of the job, modulo if None
+        """
+        self.schema = schema
+        numberAttributes = len(schema[0])
+        self.hashing = hashing or attributeHash(
+            numberAttributes=numberAttributes)
+        self.hashValue = self.hashing.value
+        self.shareVectors = [shareVector(share, hh, numberAttributes)
+                             for share, hh in zip(shares, heavyhitters)]
+        # Attribute 0 is never hashed, keys hold attributes 1..n-1
+        self.ownAttrs = [[attr for attr in xrange(1, numberAttributes)
+                          if rel[attr] == 1] for rel in schema]
+        self.templates = [[self.keyTemplates(rel, residual, vector)
+                           for residual, vector in zip(residuals,
+                                                       self.shareVectors)]
+                          for rel in schema]
+
+    def keyTemplates(self, relationSchema, residual, vector):
+        """ The reducer keys of a relation in a residual join, with a '%s'
+        slot for each coordinate the tuple hashes to itself. The
+        replicated coordinates are expanded once here.
+
+        eg for R1(A1,A2), residual ('_', '_', '_', '_', '_', '_') and shares
+           (1, 1, 7, 5, 1, 1) the 5 templates
+           ['_-_-_-_-_-_.%s.%s.0.0.0', ..., '_-_-_-_-_-_.%s.%s.4.0.0']
+        """
+        prefix = '-'.join(residual).replace('%', '%%')
+        ranges = [['%s'] if relationSchema[attr] == 1
+                  else [str(i) for i in xrange(vector[attr])]
+                  for attr in xrange(1, len(vector))]
+        return ['.'.join((prefix,) + coordinates)
+                for coordinates in product(*ranges)]
+
+    def coordinates(self, relation, residualId, inputTuple):
+        """ The hashed coordinates of a tuple on its own attributes """
+        vector = self.shareVectors[residualId]
+        hashValue = self.hashValue
+        return tuple(str(hashValue(attr, inputTuple[attr]) % vector[attr])
+                     for attr in self.ownAttrs[relation])
+
+    def keys(self, relation, residualId, inputTuple):
+        """ All reducer keys of a tuple in a residual join
+
+        Input:  relation    The 0-numbered relation of the tuple
+                residualId  The index of the residual join
+                inputTuple  The extended tuple eg ['_', '0', '21', '_', ...]
+        """
+        coordinates = self.coordinates(relation, residualId, inputTuple)
+        return [template % coordinates
+                for template in self.templates[relation][residualId]]
+
+    def coordinateKeys(self, relation, residualId, coordinates):
+        """ keys of the tuples with the given coordinates, one per own
+        attribute of the relation, already reduced modulo the shares
+        """
+        coordinates = tuple(str(c) for c in coordinates)
+        return [template % coordinates
+                for template in self.templates[relation][residualId]]
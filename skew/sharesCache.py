@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+""" sharesCache Class
+
+    Persistent LRU cache of solved shares. Residual joins with the same
+    cost expression, budget and solver, and relation sizes equal up to
+    scale, are the same optimisation problem and share one entry. A problem
+    whose sizes are all within a tolerance of those of an entry reuses its
+    shares.
+
+"""
+import math
+import os
+import pickle
+from collections import OrderedDict
+from itertools import product
+
+
+class sharesCache(object):
+
+    def __init__(self, filename=None, capacity=10000, tolerance=0.01):
+        """ Input:  filename    The pickle the cache persists to, None keeps
+                                it in memory
+                    capacity    The number of entries kept, the least
+                                recently used are evicted first
+                    tolerance   Relative size difference under which two
+                                problems share an entry, eg 0.01 for 1%
+        """
+        self.filename = filename
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if filename is not None and os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                self.entries = pickle.load(f)
+        # The keys of the entries by bucketKey
+        self.index = {}
+        for key in self.entries:
+            self.indexKey(key)
+
+    def key(self, expressionVars, relationSizes, budget, scaleFree=True,
+            solver='builtin'):
+        """ The cache key of a shares problem
+
+        Input:  expressionVars  The cost expression of sharesCalculator
+                                eg [[3], [], [2]]
+                relationSizes   The residual join sizes of replaceSize
+                budget          The number of reducers, or the reducer
+                                capacity
+                scaleFree       True when the optimum does not change with
+                                the scale of the sizes, as with a reducer
+                                budget. The sizes are then divided by the
+                                largest one.
+                solver          The solver of the shares, 'builtin' or
+                                'couenne'
+
+        Output: (structure, sizes, budget, scaleFree, solver)
+                eg (((3,), (), (2,)), (0.1, 1.0, 0.1), 64, True, 'builtin')
+        """
+        structure = tuple(tuple(sorted(exprVars))
+                          for exprVars in expressionVars)
+        scale = max(relationSizes) if scaleFree else 1.0
+        sizes = tuple(size / float(scale) for size in relationSizes)
+        return (structure, sizes, budget, scaleFree, solver)
+
+    def bucketKey(self, key):
+        """ A key with its sizes on a geometric grid of ratio 1 + tolerance,
+        so that sizes within the tolerance of each other fall in the same or
+        adjacent buckets
+        """
+        structure, sizes, budget, scaleFree, solver = key
+        step = math.log(1 + self.tolerance)
+        buckets = tuple(int(math.floor(math.log(size) / step))
+                        if size > 0 else None for size in sizes)
+        return (structure, buckets, budget, scaleFree, solver)
+
+    def neighbours(self, key):
+        """ The keys of the entries whose sizes are all within the
+        tolerance of the sizes of a key, the key itself first
+        """
+        if key in self.entries:
+            yield key
+        structure, buckets, budget, scaleFree, solver = self.bucketKey(key)
+        for buckets in product(*[[None] if bucket is None else
+                                 [bucket - 1, bucket, bucket + 1]
+                                 for bucket in buckets]):
+            for other in self.index.get(
+                    (structure, buckets, budget, scaleFree, solver), ()):
+                if other != key and all(
+                        a == b or (a > 0 and b > 0 and max(a, b) <=
+                                   (1 + self.tolerance) * min(a, b))
+                        for a, b in zip(key[1], other[1])):
+                    yield other
+
+    def get(self, key):
+        """ The cached shares dict of a key, or of a key with sizes within
+        the tolerance, or None
+        """
+        for other in self.neighbours(key):
+            self.hits += 1
+            shares = self.entries.pop(other)
+            self.entries[other] = shares
+            return dict(shares)
+        self.misses += 1
+        return None
+
+    def put(self, key, shares):
+        if key in self.entries:
+            del self.entries[key]
+        else:
+            self.indexKey(key)
+        self.entries[key] = dict(shares)
+        while len(self.entries) > self.capacity:
+            evicted = self.entries.popitem(last=False)[0]
+            self.index[self.bucketKey(evicted)].remove(evicted)
+
+    def indexKey(self, key):
+        self.index.setdefault(self.bucketKey(key), set()).add(key)
+
+    def save(self):
+        """ Writes the cache to its file, through a rename so that a
+        concurrent reader never sees a partial pickle
+        """
+        if self.filename is None:
+            return
+        partial = self.filename + '.tmp'
+        with open(partial, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(partial, self.filename)
@@ -6,22 +6,24 @@
 
 """
 
-import minlpsolver
+import sharesOptimizer
 
 
 class sharesCalculator(object):
 
     def __init__(self, schema, numberAttributes,
-                 relationSizes, numberReducers, reducerCapacity, heavyhitters,
-                 heavyhittersRelationSizes):
+                 relationSizes, numberReducers, heavyhitters,
+                 heavyhittersRelationSizes, solver='builtin'):
         """
             advanced    boolean If True, then k1*k2*k3=k
+            solver      'builtin' for sharesOptimizer, or 'couenne' for the
+                        MINLP solver of minlpSolver
         """
         # Class input variables
         self.numberAttributes = numberAttributes
         # self.sizesFilename = sizesFilename
         self.numberReducers = numberReducers
-        self.reducerCapacity = reducerCapacity
+        self.solver = solver
         self.heavyhitters = heavyhitters
         self.heavyhittersRelationSizes = heavyhittersRelationSizes
 
@@ -34,11 +36,16 @@ class sharesCalculator(object):
         self.expressionVars = self.constructCostExprVars()
 
     def getShares(self):
-        (shares, commcost, per_red_cost) = minlpsolver.calculateShares(
+        if self.solver == 'couenne':
+            # Pyomo and couenne are only needed for the MINLP solver
+            import minlpSolver
+            calculateShares = minlpSolver.calculateShares
+        else:
+            calculateShares = sharesOptimizer.calculateShares
+        (shares, commcost, per_red_cost) = calculateShares(
             self.expressionVars,
             self.relationSizes,
-            self.numberReducers,
-            self.reducerCapacity)
+            self.numberReducers)
         return (shares, commcost, per_red_cost)
 
     def readRelationSizes(self):
@@ -236,7 +243,8 @@ class sharesCalculatorQ(object):
         self.expressionVars = self.constructCostExprVars()
 
     def getShares(self):
-        (shares, commcost, per_red_cost) = minlpsolver.calculateSharesQ(
+        import minlpSolver
+        (shares, commcost, per_red_cost) = minlpSolver.calculateSharesQ(
             self.expressionVars,
             self.relationSizes,
             self.reducerCapacity)
@@ -0,0 +1,310 @@
+#!/usr/bin/python
+
+""" Built-in shares optimizer
+
+    Minimises the communication cost sum_r size_r * prod_{a in E_r} x_a
+    under prod_a x_a = k over positive integer shares, without an external
+    MINLP solver. In log space, y_a = ln x_a, the relaxed problem is convex:
+    the log of the cost is a log-sum-exp of linear functions of y, over the
+    simplex y >= 0, sum_a y_a = ln k. It is solved by accelerated projected
+    gradient descent, and the relaxed optimum is rounded to an integer
+    factorisation of k followed by a local search that moves factors
+    between shares.
+
+"""
+import heapq
+import math
+
+import numpy as np
+
+
+def shareVars(expressionVars):
+    """ The share variables of a cost expression, sorted
+
+    Input:  expressionVars  eg [[3], [], [2]]
+    Output: eg [2, 3]
+    """
+    return sorted(set(x for l in expressionVars for x in l))
+
+
+def communicationCost(expressionVars, relationSizes, shares):
+    """ The objective of minlpSolver.constructObjective for given shares
+
+    Input:  shares  A shares dict eg {'2': 4, '3': 8}
+    """
+    cost = 0
+    for exprVars, size in zip(expressionVars, relationSizes):
+        term = math.ceil(size)
+        for var in exprVars:
+            term *= shares[str(var)]
+        cost += term
+    return cost
+
+
+def primeFactors(n):
+    """ eg primeFactors(24) = [2, 2, 2, 3] """
+    factors = []
+    p = 2
+    while p * p <= n:
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+        p += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+
+def divisors(n):
+    """ The divisors of n greater than 1 """
+    return [d for d in xrange(2, n + 1) if n % d == 0]
+
+
+def factorizations(k, m):
+    """ All ordered factorisations of k into m positive integers
+
+    eg factorizations(4, 2) yields (1, 4), (2, 2), (4, 1)
+    """
+    if m == 0:
+        if k == 1:
+            yield ()
+        return
+    if m == 1:
+        yield (k,)
+        return
+    for d in [1] + divisors(k):
+        for rest in factorizations(k // d, m - 1):
+            yield (d,) + rest
+
+
+def numberFactorizations(k, m):
+    """ The number of ordered factorisations of k into m positive integers,
+    the product over the prime powers p^e of k of C(e + m - 1, m - 1)
+    """
+    count = 1
+    factors = primeFactors(k)
+    for p in set(factors):
+        e = factors.count(p)
+        for i in xrange(1, e + 1):
+            count = count * (m - 1 + i) // i
+    return count
+
+
+def exhaustiveShares(expressionVars, relationSizes, numberReducers):
+    """ The exact integer optimum over all factorisations of k
+
+    Output: A shares dict eg {'2': 4, '3': 8}
+    """
+    variables = shareVars(expressionVars)
+    if not variables:
+        return {}
+    best = None
+    for factors in factorizations(numberReducers, len(variables)):
+        shares = dict((str(var), x) for var, x in zip(variables, factors))
+        cost = communicationCost(expressionVars, relationSizes, shares)
+        if best is None or cost < best[0]:
+            best = (cost, shares)
+    return best[1]
+
+
+def projectSimplex(y, total):
+    """ The Euclidean projection of y onto {y >= 0, sum(y) = total} """
+    if total <= 0:
+        return np.zeros(len(y))
+    u = np.sort(y)[::-1]
+    cumulative = np.cumsum(u) - total
+    index = np.arange(1, len(y) + 1)
+    rho = np.flatnonzero(u - cumulative / index > 0)[-1]
+    theta = cumulative[rho] / (rho + 1.0)
+    return np.maximum(y - theta, 0.0)
+
+
+def relaxShares(expressionVars, relationSizes, numberReducers,
+                iterations=2000, tolerance=1e-10):
+    """ The optimal real valued shares of the relaxed problem
+
+    Output: A dict from share variable to its real valued share
+            eg {2: 4.0, 3: 8.0}
+    """
+    variables = shareVars(expressionVars)
+    if not variables:
+        return {}
+    position = dict((var, i) for i, var in enumerate(variables))
+    terms = [(exprVars, math.ceil(size))
+             for exprVars, size in zip(expressionVars, relationSizes)
+             if size > 0]
+    total = math.log(numberReducers)
+    if not terms:
+        return dict((var, numberReducers ** (1.0 / len(variables)))
+                    for var in variables)
+    A = np.zeros((len(terms), len(variables)))
+    for r, (exprVars, size) in enumerate(terms):
+        for var in exprVars:
+            A[r, position[var]] = 1.0
+    c = np.log([size for exprVars, size in terms])
+    # Lipschitz constant of the gradient of log-sum-exp(c + A y)
+    step = 1.0 / max(A.sum(axis=1).max(), 1.0)
+
+    def gradient(y):
+        z = c + A.dot(y)
+        p = np.exp(z - z.max())
+        return A.T.dot(p / p.sum())
+
+    y = np.full(len(variables), total / len(variables))
+    previous = y
+    momentum = 1.0
+    for i in xrange(iterations):
+        # FISTA
+        nextMomentum = (1 + math.sqrt(1 + 4 * momentum ** 2)) / 2
+        v = y + (momentum - 1) / nextMomentum * (y - previous)
+        previous = y
+        y = projectSimplex(v - step * gradient(v), total)
+        momentum = nextMomentum
+        if np.abs(y - previous).max() < tolerance:
+            break
+    return dict((var, math.exp(y[position[var]])) for var in variables)
+
+
+def roundShares(expressionVars, relationSizes, numberReducers, relaxed):
+    """ Integer shares whose product is exactly numberReducers, near the
+    relaxed optimum
+
+    The prime factors of numberReducers, largest first, go to the share
+    furthest below its relaxed value. Then any divisor of a share is moved
+    to another share while that lowers the cost.
+
+    Output: A shares dict eg {'2': 4, '3': 8}
+    """
+    variables = shareVars(expressionVars)
+    if not variables:
+        return {}
+    shares = dict((var, 1) for var in variables)
+    for p in sorted(primeFactors(numberReducers), reverse=True):
+        var = max(variables, key=lambda v: (math.log(relaxed[v]) -
+                                            math.log(shares[v]), -v))
+        shares[var] *= p
+
+    def cost(shares):
+        return communicationCost(
+            expressionVars, relationSizes,
+            dict((str(var), share) for var, share in shares.iteritems()))
+
+    best = cost(shares)
+    improved = True
+    while improved:
+        improved = False
+        for source in variables:
+            for d in divisors(shares[source]):
+                for target in variables:
+                    if target == source:
+                        continue
+                    shares[source] //= d
+                    shares[target] *= d
+                    candidate = cost(shares)
+                    if candidate < best:
+                        best = candidate
+                        improved = True
+                        break
+                    shares[source] *= d
+                    shares[target] //= d
+                if improved:
+                    break
+            if improved:
+                break
+    return dict((str(var), share) for var, share in shares.iteritems())
+
+
+def calculateShares(expressionVars, relationSizes, numberReducers,
+                    exhaustiveLimit=1000):
+    """ Drop-in replacement of minlpSolver.calculateShares. Residual joins
+    with at most exhaustiveLimit factorisations of k are solved exactly by
+    enumeration, the others through the relaxation.
+
+    input   expressionVars  A list of lists of expression vars
+                            ex. [[3], [1], [2]]
+            relationSizes A list ex. [1000, 1000, 1000]
+            numberReducers an integer ex. 32
+
+    output (shares, com_cost, com_cost / numberReducers)
+            shares The shares dict ex. {'1': 2, '2': 1, '3': 16}
+    """
+    m = len(shareVars(expressionVars))
+    if numberFactorizations(numberReducers, m) <= exhaustiveLimit:
+        shares = exhaustiveShares(expressionVars, relationSizes,
+                                  numberReducers)
+    else:
+        relaxed = relaxShares(expressionVars, relationSizes, numberReducers)
+        shares = roundShares(expressionVars, relationSizes, numberReducers,
+                             relaxed)
+    com_cost = communicationCost(expressionVars, relationSizes, shares)
+    return (shares, com_cost, com_cost / float(numberReducers))
+
+
+def allocateReducers(problems, numberReducers, exhaustiveLimit=1000):
+    """ Splits numberReducers across residual joins, k_1 + ... + k_n = k,
+    minimising the maximum reducer load, cost / k_i, then the total
+    communication cost.
+
+    Every residual join starts with one reducer. The residual join with
+    the highest load then gets the fewest extra reducers that lower it,
+    as a prime k_i may not, until none are left or its load cannot be
+    lowered. The total communication cost then breaks the tie: leftover
+    reducers go where they add the least cost per reducer while keeping
+    the loads under the maximum, else where the maximum grows least.
+    Residual joins without share variables cannot spread over more than
+    one reducer and keep theirs.
+
+    Input:  problems    A list of (expressionVars, relationSizes), one per
+                        residual join
+    Output: A list of calculateShares outputs, one per residual join, whose
+            shares products add up to numberReducers; less only when no
+            residual join has share variables
+    """
+    if numberReducers < len(problems):
+        raise ValueError('%d reducers cannot hold %d residual joins' % (
+            numberReducers, len(problems)))
+    solved = {}
+
+    def solve(i, budget):
+        if (i, budget) not in solved:
+            expressionVars, relationSizes = problems[i]
+            solved[(i, budget)] = calculateShares(
+                expressionVars, relationSizes, budget, exhaustiveLimit)
+        return solved[(i, budget)]
+
+    budgets = [1] * len(problems)
+    spread = [i for i, (expressionVars, relationSizes) in enumerate(problems)
+              if shareVars(expressionVars)]
+    remaining = numberReducers - len(problems)
+    heap = [(-solve(i, 1)[2], i) for i in spread]
+    heapq.heapify(heap)
+    while remaining and heap:
+        load, i = heapq.heappop(heap)
+        step = next((s for s in xrange(1, remaining + 1)
+                     if solve(i, budgets[i] + s)[2] < -load), None)
+        if step is None:
+            break
+        budgets[i] += step
+        remaining -= step
+        heapq.heappush(heap, (-solve(i, budgets[i])[2], i))
+    maximum = max([solve(i, budgets[i])[2] for i in spread] or [0])
+    while remaining and spread:
+        # The extra reducers that add the least communication cost per
+        # reducer while keeping the load under the maximum, the most
+        # reducers on a tie
+        choices = [((solve(i, budgets[i] + t)[1] - solve(i, budgets[i])[1]) /
+                    float(t), -t, i)
+                   for i in spread for t in xrange(1, remaining + 1)
+                   if solve(i, budgets[i] + t)[2] <= maximum]
+        if not choices:
+            # The maximum grows, by as little as possible, then the cost
+            i = min(spread, key=lambda i: (
+                solve(i, budgets[i] + remaining)[2],
+                solve(i, budgets[i] + remaining)[1] -
+                solve(i, budgets[i])[1]))
+            budgets[i] += remaining
+            break
+        cost, negativeExtra, i = min(choices)
+        budgets[i] -= negativeExtra
+        remaining += negativeExtra
+    return [solve(i, budget) for i, budget in enumerate(budgets)]
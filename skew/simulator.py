@@ -0,0 +1,261 @@
+#!/usr/bin/python
+
+""" planSimulator Class
+
+    Predicts the load of every reducer of a plan without running Hadoop,
+    either from the relation sizes and heavy hitter fractions, or by
+    routing a sample of the input the way the cell key mapper does.
+    Loads are counted per cell, the reducer bucket of a cellIndex, and per
+    reduce task. The cells re-split by a splits.p count as their sub-cells.
+
+"""
+import os
+import pickle
+from operator import methodcaller
+
+import numpy as np
+
+import premap
+from batchRouting import batchRouter
+from cellIndex import cellIndex
+from hashing import HASH_FUNCTIONS, attributeHash
+from router import residualRouter
+from shareGrid import shareGrid
+
+
+class planSimulator(object):
+
+    def __init__(self, schema, residuals, shares, heavyhitters,
+                 numberReducers, hashing=None):
+        """ Input:  schema      The binary schema eg premap.readSchema
+                    residuals   The residual joins from residualjoins.p
+                    shares      The shares dicts from shares.p
+                    heavyhitters The HH dicts from heavyhitters.p
+                    numberReducers The number of reduce tasks
+                    hashing     The attributeHash of the job, modulo if None
+        """
+        self.schema = schema
+        self.residuals = residuals
+        self.numberReducers = numberReducers
+        # As SharesSkewJob.mapper_init builds them
+        hhinvertedIndex = {}
+        for hh in heavyhitters:
+            for attr, value in hh.iteritems():
+                hhinvertedIndex[(attr, value)] = 'HH'
+        self.grid = shareGrid(schema, residuals, shares, heavyhitters,
+                              hashing)
+        self.cells = cellIndex(self.grid, numberReducers)
+        self.batch = batchRouter(
+            schema, residualRouter(schema, residuals, hhinvertedIndex),
+            self.grid, self.cells.coordinateCellIds)
+        self.cellMatrices = {}
+
+    def split(self, splits):
+        """ Routes the sub-cells of a splits.p, see cellIndex.split """
+        self.cells.split(splits)
+        self.batch.splits = self.cells.splitResiduals
+        self.batch.keyCache.clear()
+        self.cellMatrices = {}
+
+    def ownCells(self, relation, residualId):
+        """ The number of distinct coordinates of a relation's own
+        attributes in a residual join
+        """
+        vector = self.grid.shareVectors[residualId]
+        return int(np.prod([vector[attr]
+                            for attr in self.grid.ownAttrs[relation]]))
+
+    def numberCodes(self, relation, residualId):
+        """ The number of coordinate codes of a relation in a residual
+        join, see batchRouter.coordinates
+        """
+        codes = self.ownCells(relation, residualId)
+        if residualId in self.cells.splitResiduals:
+            attr, factor = self.cells.splitResiduals[residualId]
+            if self.schema[relation][attr] == 1:
+                codes *= factor
+        return codes
+
+    def cellMatrix(self, relation, residualId):
+        """ The cell ids of every coordinate code, see
+        batchRouter.coordinates
+
+        Output: (cell ids, codes) two int arrays, the code of every cell id
+                of every code
+        """
+        key = (relation, residualId)
+        if key not in self.cellMatrices:
+            cellIds = [self.batch.keys(relation, residualId, code)
+                       for code in xrange(self.numberCodes(relation,
+                                                           residualId))]
+            self.cellMatrices[key] = (
+                np.fromiter((cellId for ids in cellIds for cellId in ids),
+                            dtype=np.int64),
+                np.repeat(np.arange(len(cellIds)), map(len, cellIds)))
+        return self.cellMatrices[key]
+
+    def expected(self, relationSizes, hhinfo):
+        """ The expected load of every cell, with the residual join sizes of
+        premap.replaceSize and hash coordinates spread uniformly
+
+        Input:  relationSizes   eg [1000, 1000, 1000]
+                hhinfo          The hhinfo of premap.readHeavyHitters
+        Output: A float array with an entry per cell
+        """
+        loads = np.zeros(self.cells.numberCells)
+        relationLoads = []
+        for residualId, residual in enumerate(self.residuals):
+            sizes = premap.replaceSize(residual, relationSizes, hhinfo)
+            start = self.cells.offsets[residualId]
+            end = start + self.cells.cells[residualId]
+            # Every cell of the residual join receives 1 / ownCells of the
+            # tuples of each relation
+            relationLoads.append([size / self.ownCells(relation, residualId)
+                                  for relation, size in enumerate(sizes)])
+            loads[start:end] += sum(relationLoads[-1])
+        # The tuples of a split cell move to its sub-cells, spread over them
+        # for the relations with the split attribute, to every one for the
+        # others
+        for cellId, (first, factor) in self.cells.subCells.iteritems():
+            residualId = int(np.searchsorted(self.cells.offsets, cellId,
+                                             'right')) - 1
+            attr = self.cells.splitResiduals[residualId][0]
+            loads[first:first + factor] = sum(
+                load / float(factor) if self.schema[relation][attr] else load
+                for relation, load in enumerate(relationLoads[residualId]))
+            loads[cellId] = 0
+        return loads
+
+    def sampled(self, lines, scale=None, blockSize=100000):
+        """ The load of every cell when routing input lines
+
+        Input:  lines       Input lines eg ['R1 10 21', 'R2 21 31 40']
+                scale       A factor per 0-numbered relation the counts are
+                            multiplied by, eg size / sample size
+                blockSize   The lines of a relation parsed at once
+        Output: (loads, tuples) a float array with an entry per cell and
+                the number of input tuples per relation
+        """
+        loads = np.zeros(self.cells.numberCells)
+        tuples = [0] * len(self.schema)
+        for relation in xrange(len(self.schema)):
+            name = 'R%d ' % (relation + 1)
+            relationLines = filter(methodcaller('startswith', name), lines)
+            for start in xrange(0, len(relationLines), blockSize):
+                self.route(relation, relationLines[start:start + blockSize],
+                           loads, tuples, scale)
+        return (loads, tuples)
+
+    def route(self, relation, lines, loads, tuples, scale=None):
+        """ Adds the cell counts of a block of lines of a relation """
+        block = self.batch.parse(relation, lines)
+        tuples[relation] += len(block)
+        weight = 1.0 if scale is None else scale[relation]
+        signatures = self.batch.signatures(relation, block)
+        for signature in np.unique(signatures):
+            residualIds = self.batch.routes[relation].get(int(signature))
+            if not residualIds:
+                continue
+            rows = block[signatures == signature]
+            for residualId in residualIds:
+                codes = self.batch.coordinates(relation, residualId, rows)
+                counts = np.bincount(
+                    codes, minlength=self.numberCodes(relation, residualId))
+                cellIds, cellCodes = self.cellMatrix(relation, residualId)
+                loads += weight * np.bincount(
+                    cellIds, weights=counts[cellCodes], minlength=len(loads))
+
+    def taskLoads(self, loads):
+        """ The load of every reduce task, from the cell loads """
+        tasks = np.arange(len(loads)) // self.cells.cellsPerTask
+        tasks[self.cells.totalCells:] = self.cells.subTasks
+        return np.bincount(tasks, weights=loads,
+                           minlength=self.numberReducers)
+
+    def statistics(self, loads, inputTuples):
+        """ Summary of a load prediction
+
+        Input:  loads       The cell loads of expected or sampled
+                inputTuples The number of input tuples
+        Output: A dict eg {'communicationCost': 5120.0, 'replication': 1.7,
+                'maxCellLoad': 90.0, 'maxTaskLoad': 90.0,
+                'meanTaskLoad': 80.0, 'maxMeanRatio': 1.125}
+        """
+        tasks = self.taskLoads(loads)
+        cost = float(loads.sum())
+        mean = cost / self.numberReducers
+        return {'communicationCost': cost,
+                'replication': cost / inputTuples if inputTuples else 0.0,
+                'maxCellLoad': float(loads.max()) if len(loads) else 0.0,
+                'maxTaskLoad': float(tasks.max()),
+                'meanTaskLoad': mean,
+                'maxMeanRatio': float(tasks.max()) / mean if mean else 0.0}
+
+
+def loadPlan(directory, schema, numberReducers, hashing=None):
+    """ The planSimulator of the pickles writePlan wrote to directory """
+    def load(filename):
+        with open(os.path.join(directory, filename), 'rb') as f:
+            return pickle.load(f)
+    return planSimulator(schema, load('residualjoins.p'), load('shares.p'),
+                         load('heavyhitters.p'), numberReducers, hashing)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Predicts the reducer loads of plans written by '
+                    'premap.py, one line per plan')
+    parser.add_argument('plans', nargs='+',
+                        help='Directories with residualjoins.p, shares.p '
+                             'and heavyhitters.p')
+    parser.add_argument('--reducers', type=int, required=True)
+    parser.add_argument('--schema', default=premap.schemaFilename)
+    parser.add_argument('--attributes', type=int, default=6,
+                        help='The total number of attributes eg 6: [A0:A5]')
+    parser.add_argument('--sizes', default=None,
+                        help='A relationsizes.txt, with --heavyhitters for '
+                             'the expected loads, or to scale --sample')
+    parser.add_argument('--heavyhitters', default=None)
+    parser.add_argument('--sample', default=None,
+                        help='Input lines to route, eg simple.in')
+    parser.add_argument('--hash-function', default='modulo',
+                        choices=HASH_FUNCTIONS)
+    parser.add_argument('--hash-seed', type=int, default=0)
+    args = parser.parse_args()
+    if not args.sample and not (args.sizes and args.heavyhitters):
+        parser.error('either --sample or --sizes and --heavyhitters')
+    schema = premap.readSchema(args.schema, args.attributes)
+    sizes = premap.readRelationSizes(args.sizes) if args.sizes else None
+    if args.sample:
+        with open(args.sample) as f:
+            lines = [line.rstrip('\n') for line in f if line.strip()]
+    columns = ['communicationCost', 'replication', 'maxCellLoad',
+               'maxTaskLoad', 'meanTaskLoad', 'maxMeanRatio']
+    print '%-20s %8s' % ('plan', 'mode') + ''.join(
+        ' %18s' % column for column in columns)
+    for directory in args.plans:
+        simulator = loadPlan(directory, schema, args.reducers, attributeHash(
+            args.hash_function, args.hash_seed, args.attributes))
+        results = []
+        if args.sizes and args.heavyhitters:
+            hhinfo = premap.readHeavyHitters(args.heavyhitters,
+                                             args.attributes)[0]
+            results.append(('expected', simulator.statistics(
+                simulator.expected(sizes, hhinfo), sum(sizes))))
+        if args.sample:
+            scale = None
+            if sizes:
+                # Scale the sample up to the relation sizes
+                counts = [0] * len(schema)
+                for line in lines:
+                    counts[int(line[1:line.index(' ')]) - 1] += 1
+                scale = [float(size) / count if count else 0.0
+                         for size, count in zip(sizes, counts)]
+            loads, tuples = simulator.sampled(lines, scale)
+            inputTuples = sum(sizes) if sizes else sum(tuples)
+            results.append(('sampled', simulator.statistics(loads,
+                                                            inputTuples)))
+        for mode, stats in results:
+            print '%-20s %8s' % (directory[-20:], mode) + ''.join(
+                ' %18.3f' % stats[column] for column in columns)
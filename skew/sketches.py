@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+""" spaceSaving Class
+
+    Bounded memory frequency summary (Metwally et al., SpaceSaving) of a
+    stream of values. With capacity counters every count is overestimated
+    by at most N / capacity, N being the length of the stream, and every
+    value with more than N / capacity occurrences is kept.
+
+"""
+import heapq
+import math
+
+
+class spaceSaving(object):
+
+    def __init__(self, capacity):
+        """ Input:  capacity    The number of counters kept, eg
+                                ceil(1 / epsilon) for an error of
+                                epsilon * N
+        """
+        self.capacity = capacity
+        self.total = 0
+        # value -> [count, error]
+        self.counters = {}
+        # (count, value) entries, an entry is stale if the count of its
+        # value has grown since it was pushed
+        self.heap = []
+
+    @classmethod
+    def fromEpsilon(cls, epsilon):
+        return cls(int(math.ceil(1.0 / epsilon)))
+
+    def minimum(self):
+        """ The smallest counter (count, value), fixing stale entries """
+        while True:
+            count, value = self.heap[0]
+            current = self.counters[value][0]
+            if current == count:
+                return count, value
+            heapq.heapreplace(self.heap, (current, value))
+
+    def update(self, value, count=1):
+        self.total += count
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [count, 0]
+            heapq.heappush(self.heap, (count, value))
+        else:
+            # The new value takes over the smallest counter
+            minimum, evicted = self.minimum()
+            del self.counters[evicted]
+            self.counters[value] = [minimum + count, minimum]
+            heapq.heapreplace(self.heap, (minimum + count, value))
+
+    def floor(self):
+        """ The count of a value that has no counter can be at most this """
+        if len(self.counters) < self.capacity:
+            return 0
+        return self.minimum()[0]
+
+    def merge(self, other):
+        """ Merges another summary into this one, the error bound of the
+        result is that of a summary of both streams (Agarwal et al.,
+        Mergeable Summaries)
+        """
+        floors = (self.floor(), other.floor())
+        merged = {}
+        for value in set(self.counters).union(other.counters):
+            count, error = 0, 0
+            for summary, floor in zip((self, other), floors):
+                counter = summary.counters.get(value, (floor, floor))
+                count += counter[0]
+                error += counter[1]
+            merged[value] = [count, error]
+        kept = heapq.nlargest(self.capacity, merged.iteritems(),
+                              key=lambda item: item[1][0])
+        self.total += other.total
+        self.counters = dict(kept)
+        self.heap = [(counter[0], value) for value, counter in kept]
+        heapq.heapify(self.heap)
+        return self
+
+    def estimate(self, value):
+        """ An upper bound of the count of a value """
+        counter = self.counters.get(value)
+        return counter[0] if counter is not None else self.floor()
+
+    def items(self):
+        """ The (value, count, error) of every counter, most frequent first;
+        count - error is a lower bound of the true count
+        """
+        return sorted(((value, c[0], c[1])
+                       for value, c in self.counters.iteritems()),
+                      key=lambda item: (-item[1], item[0]))
+
+    def toList(self):
+        """ A JSON serialisable summary, see fromList """
+        return [self.capacity, self.total,
+                [[value, c[0], c[1]] for value, c in
+                 self.counters.iteritems()]]
+
+    @classmethod
+    def fromList(cls, data):
+        capacity, total, counters = data
+        summary = cls(capacity)
+        summary.total = total
+        summary.counters = dict((value, [count, error])
+                                for value, count, error in counters)
+        summary.heap = [(count, value) for value, count, error in counters]
+        heapq.heapify(summary.heap)
+        return summary
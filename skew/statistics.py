@@ -0,0 +1,326 @@
+#!/usr/bin/python
+
+""" Sampling statistics collector
+
+    Estimates the relation sizes, per attribute distinct counts and heavy
+    hitter fractions of input files of 'R<n> v1 v2 ...' lines, as the
+    mapper reads them, from a random sample of fixed size blocks read
+    through mmap, and writes relationsizes.txt and heavyhitters.txt.
+
+    A line belongs to the block its first byte is in, so the sampled
+    blocks are a simple random sample of clusters of lines: totals are
+    estimated without bias, with a confidence interval from the variance
+    between blocks, and fractions are ratios of two such totals.
+
+"""
+import math
+import mmap
+import os
+import random
+from operator import methodcaller
+
+import numpy as np
+
+from heavyHitters import (formatHeavyHitter, fractions, joinAttributes,
+                          selectHeavyHitters)
+
+
+def blockLines(data, start, end):
+    """ The lines whose first byte is in [start, end) of a mapped file """
+    if start > 0:
+        start = data.find('\n', start - 1) + 1
+        if start == 0 or start >= end:
+            return []
+    stop = data.find('\n', end - 1)
+    if stop == -1:
+        stop = len(data)
+    return [line for line in data[start:stop].split('\n') if line]
+
+
+def sampleFile(filename, blockSize, numberBlocks, rng):
+    """ Reads numberBlocks random blocks of a file, or all of it when it
+    has no more blocks than that
+
+    Output: (blocks, sample) the number of blocks of the file and a list of
+            line lists, one per sampled block
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return (0, [])
+    blocks = -(-size // blockSize)
+    if numberBlocks >= blocks:
+        chosen = xrange(blocks)
+    else:
+        chosen = sorted(rng.sample(xrange(blocks), numberBlocks))
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            sample = [blockLines(data, i * blockSize,
+                                 min((i + 1) * blockSize, size))
+                      for i in chosen]
+        finally:
+            data.close()
+    return (blocks, sample)
+
+
+def parseBlock(schema, lines):
+    """ Splits the lines of a block by relation
+
+    Output: A list with an int64 array per relation, a row per line and a
+            column per attribute of the relation
+    """
+    columns = []
+    for relation, rel in enumerate(schema, 1):
+        name = 'R%d ' % relation
+        width = sum(rel)
+        relationLines = filter(methodcaller('startswith', name), lines)
+        block = np.fromstring(' '.join(relationLines).replace(name, ''),
+                              dtype=np.int64, sep=' ')
+        if len(block) != width * len(relationLines):
+            raise ValueError('Malformed line of R%d' % relation)
+        columns.append(block.reshape(len(relationLines), width))
+    return columns
+
+
+def estimateTotal(samples, values):
+    """ The estimated total of a per block quantity over all files
+
+    Input:  samples The (blocks, sample) of every file, see sampleFile
+            values  An array per file with a row per sampled block
+    Output: (total, variance) arrays with an entry per column of values
+    """
+    total = 0.0
+    variance = 0.0
+    for (blocks, sample), y in zip(samples, values):
+        m = len(y)
+        if m == 0:
+            continue
+        total = total + blocks * y.mean(axis=0)
+        if 1 < m < blocks:
+            # Finite population correction, 0 for a full scan
+            variance = variance + (blocks ** 2 * (1 - m / float(blocks)) *
+                                   y.var(axis=0, ddof=1) / m)
+    total = np.asarray(total, dtype=float)
+    return (total, variance + np.zeros_like(total))
+
+
+def interval(total, variance, z, low=0.0, high=float('inf')):
+    """ (estimate, lower, upper) of a normal confidence interval """
+    half = z * math.sqrt(max(variance, 0.0))
+    return (float(total), max(float(total) - half, low),
+            min(float(total) + half, high))
+
+
+def blockCounts(values, counts, candidates):
+    """ The counts of candidate values in a block
+
+    Input:  values, counts  np.unique of a block column, values sorted
+            candidates      Sorted values
+    """
+    if not len(values):
+        return np.zeros(len(candidates))
+    index = np.minimum(np.searchsorted(values, candidates), len(values) - 1)
+    return np.where(values[index] == candidates, counts[index], 0)
+
+
+def collectStatistics(filenames, schema, attrs=None, threshold=0.01, topK=0,
+                      blockSize=65536, numberBlocks=512, seed=None,
+                      z=1.96):
+    """ Estimates the statistics premap plans from
+
+    Input:  filenames   Input files of 'R<n> v1 v2 ...' lines
+            schema      The binary schema eg premap.readSchema
+            attrs       The attributes to find heavy hitters of, the join
+                        attributes by default
+            threshold, topK As HeavyHittersJob
+            blockSize   Bytes per block
+            numberBlocks Blocks sampled over all files, in proportion to
+                        their sizes
+            z           The normal quantile of the intervals, 1.96 for 95%
+    Output: A dict with
+            'sizes'         (estimate, lower, upper) per relation
+            'distinct'      {(relation, attr): (estimate, lower, upper)}
+                            for 1-numbered relations
+            'heavyhitters'  A list of (attr, value, fractions, intervals)
+                            with a fraction and a (lower, upper) interval
+                            per relation, -0.0 where the relation does
+                            not have the attribute
+            'sampledTuples' The number of tuples read
+    """
+    rng = random.Random(seed)
+    if attrs is None:
+        attrs = joinAttributes(schema)
+    sizes = [os.path.getsize(filename) for filename in filenames]
+    samples = []
+    parsed = []
+    for filename, size in zip(filenames, sizes):
+        share = int(round(numberBlocks * size / float(max(sum(sizes), 1))))
+        blocks, sample = sampleFile(filename, blockSize, max(share, 2), rng)
+        samples.append((blocks, sample))
+        parsed.append([parseBlock(schema, lines) for lines in sample])
+    relations = range(len(schema))
+    # Relation sizes
+    relationCounts = [np.array([[len(block[r]) for r in relations]
+                                for block in blocks],
+                               dtype=float).reshape(-1, len(schema))
+                      for blocks in parsed]
+    totals, variances = estimateTotal(samples, relationCounts)
+    sampledTuples = int(sum(counts.sum() for counts in relationCounts))
+    stats = {'sizes': [interval(totals[r], variances[r], z,
+                                sum(counts[:, r].sum()
+                                    for counts in relationCounts))
+                       for r in relations],
+             'distinct': {}, 'heavyhitters': [],
+             'sampledTuples': sampledTuples}
+    for attr in attrs:
+        owners = [r for r in relations if schema[r][attr] == 1]
+        # np.unique of every block column of the attribute
+        uniques = dict(
+            (r, [[np.unique(block[r][:, sum(schema[r][:attr])],
+                            return_counts=True) for block in blocks]
+                 for blocks in parsed])
+            for r in owners)
+        candidates = set()
+        for r in owners:
+            stats['distinct'][(r + 1, attr)] = distinctCount(
+                uniques[r], sum(counts[:, r].sum()
+                                for counts in relationCounts),
+                stats['sizes'][r])
+            candidates.update(heavyValues(samples, uniques[r], totals[r],
+                                          threshold))
+        candidates = np.array(sorted(candidates), dtype=np.int64)
+        if not len(candidates):
+            continue
+        counts, intervals = {}, {}
+        for r in owners:
+            y = [np.array([blockCounts(values, c, candidates)
+                           for values, c in blockUniques],
+                          dtype=float).reshape(-1, len(candidates))
+                 for blockUniques in uniques[r]]
+            valueTotals = estimateTotal(samples, y)[0]
+            p = valueTotals / totals[r] if totals[r] else valueTotals * 0
+            # Linearised variance of the ratio estimator
+            residuals = [yf - p * counts_[:, [r]]
+                         for yf, counts_ in zip(y, relationCounts)]
+            ratioVariance = estimateTotal(samples, residuals)[1]
+            if totals[r]:
+                ratioVariance = ratioVariance / totals[r] ** 2
+            counts[r + 1] = valueTotals
+            intervals[r] = [interval(p[i], ratioVariance[i], z, 0.0, 1.0)[1:]
+                            for i in xrange(len(candidates))]
+        heavy = selectHeavyHitters(
+            ((int(value), fractions(
+                schema, attr,
+                dict((relation, c[i]) for relation, c in counts.items()),
+                dict((r + 1, totals[r]) for r in relations)))
+             for i, value in enumerate(candidates)), threshold, topK)
+        position = dict((int(value), i) for i, value in enumerate(candidates))
+        for value, f in heavy:
+            stats['heavyhitters'].append((attr, value, f, [
+                intervals[r][position[value]] if r in intervals else None
+                for r in relations]))
+    return stats
+
+
+def heavyValues(samples, blockUniques, total, threshold):
+    """ The values whose estimated fraction reaches threshold """
+    values, weights = [], []
+    for (blocks, sample), fileUniques in zip(samples, blockUniques):
+        for v, c in fileUniques:
+            values.append(v)
+            weights.append(c * blocks / float(len(sample)))
+    if not values or not total:
+        return []
+    values, inverse = np.unique(np.concatenate(values), return_inverse=True)
+    estimates = np.bincount(inverse, weights=np.concatenate(weights))
+    return [int(v) for v in values[estimates / total >= threshold]]
+
+
+def distinctCount(blockUniques, sampled, size):
+    """ The GEE estimate of the number of distinct values, with the values
+    seen once in the sample standing for sqrt(1 / q) values each, q the
+    sampling fraction. The bounds count them once and 1 / q times.
+
+    Input:  blockUniques    np.unique of the column of every block
+            sampled         The sampled tuples of the relation
+            size            The (estimate, lower, upper) relation size
+    """
+    pairs = [pair for fileUniques in blockUniques for pair in fileUniques]
+    if not pairs or not sampled:
+        return (0.0, 0.0, 0.0)
+    values, inverse = np.unique(np.concatenate([v for v, c in pairs]),
+                                return_inverse=True)
+    counts = np.bincount(inverse,
+                         weights=np.concatenate([c for v, c in pairs]))
+    distinct = float(len(values))
+    q = min(sampled / size[0], 1.0) if size[0] else 1.0
+    if q >= 1.0:
+        return (distinct, distinct, distinct)
+    once = float((counts == 1).sum())
+    return (min(math.sqrt(1 / q) * once + distinct - once, size[0]),
+            distinct, min(once / q + distinct - once, size[2]))
+
+
+def writeRelationSizes(filename, sizes):
+    """ Writes relationsizes.txt from the 'sizes' of collectStatistics """
+    with open(filename, 'w') as f:
+        for relation, size in enumerate(sizes, 1):
+            f.write('R%d   %d\n' % (relation, int(round(size[0]))))
+
+
+def writeHeavyHitters(filename, heavyhitters):
+    """ Writes heavyhitters.txt from the 'heavyhitters' of
+    collectStatistics
+    """
+    with open(filename, 'w') as f:
+        for attr, value, hhFractions, intervals in heavyhitters:
+            f.write(formatHeavyHitter(attr, value, hhFractions) + '\n')
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    import premap
+    parser = argparse.ArgumentParser(
+        description='Samples input files and writes relationsizes.txt and '
+                    'heavyhitters.txt')
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--schema', default=premap.schemaFilename)
+    parser.add_argument('--attributes', type=int, default=6,
+                        help='The total number of attributes eg 6: [A0:A5]')
+    parser.add_argument('--threshold', type=float, default=0.01)
+    parser.add_argument('--top-k', type=int, default=0)
+    parser.add_argument('--all-attributes', action='store_true',
+                        help='Heavy hitters of every attribute, not only '
+                             'the join attributes')
+    parser.add_argument('--block-size', type=int, default=65536)
+    parser.add_argument('--blocks', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--confidence', type=float, default=1.96,
+                        help='The normal quantile of the intervals')
+    parser.add_argument('--sizes-out', default=premap.sizesFilename)
+    parser.add_argument('--heavyhitters-out',
+                        default=premap.heavyHittersFilename)
+    args = parser.parse_args()
+    schema = premap.readSchema(args.schema, args.attributes)
+    start = time.time()
+    stats = collectStatistics(
+        args.inputs, schema,
+        range(1, args.attributes) if args.all_attributes else None,
+        args.threshold, args.top_k, args.block_size, args.blocks, args.seed,
+        args.confidence)
+    writeRelationSizes(args.sizes_out, stats['sizes'])
+    writeHeavyHitters(args.heavyhitters_out, stats['heavyhitters'])
+    print 'Sampled %d tuples in %.2fs' % (stats['sampledTuples'],
+                                          time.time() - start)
+    for relation, size in enumerate(stats['sizes'], 1):
+        print 'R%d size %.0f [%.0f, %.0f]' % ((relation,) + size)
+    for (relation, attr), distinct in sorted(stats['distinct'].items()):
+        print 'R%d A%d distinct %.0f [%.0f, %.0f]' % (
+            (relation, attr) + distinct)
+    for attr, value, f, intervals in stats['heavyhitters']:
+        print 'A%d %d %s' % (attr, value, ' '.join(
+            'R%d:%.4f[%.4f,%.4f]' % ((relation, p) + bounds)
+            for relation, (p, bounds) in enumerate(zip(f, intervals), 1)
+            if bounds is not None))
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+""" Packed value encoding for the shuffle
+
+    A mapper value is packed as the secondary sort rank and the relation
+    (one byte each), followed by the relation's own attribute values as
+    fixed-width little-endian integers. Attributes the relation does not
+    have are not shipped. A combined value is followed by its multiplicity
+    as a 32 bit integer.
+
+"""
+import re
+import struct
+
+from mrjob.protocol import RawProtocol
+
+# Hadoop streaming splits records on '\n' and '\r' and key fields on '\t'
+_ESCAPES = {'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_UNESCAPES = dict((v[1], k) for k, v in _ESCAPES.iteritems())
+_ESCAPE_RE = re.compile(r'[\\\n\r\t]')
+_UNESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+WIDTHS = {'32': 'i', '64': 'q'}
+
+MULTIPLICITY = struct.Struct('<I')
+
+
+def escape(data):
+    if _ESCAPE_RE.search(data) is None:
+        return data
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES[m.group(0)], data)
+
+
+def unescape(data):
+    if '\\' not in data:
+        return data
+    return _UNESCAPE_RE.sub(lambda m: _UNESCAPES[m.group(1)], data)
+
+
+class PackedValueProtocol(RawProtocol):
+    """ Raw text keys and packed binary values, escaped so that they
+    survive the line oriented streaming shuffle.
+    """
+
+    def read(self, line):
+        key, value = super(PackedValueProtocol, self).read(line)
+        return key, unescape(value)
+
+    def write(self, key, value):
+        return super(PackedValueProtocol, self).write(key, escape(value))
+
+
+class packedCodec(object):
+
+    def __init__(self, schema, width='64'):
+        """ Input:  schema  The binary schema, as loaded from schema.p
+                    width   '32' or '64' bit attribute values
+        """
+        self.schema = schema
+        self.numberAttributes = len(schema[0])
+        self.relationAttrs = [[attr for attr, v in enumerate(rel) if v == 1]
+                              for rel in schema]
+        self.structs = [struct.Struct('<BB%d%s' % (len(attrs), WIDTHS[width]))
+                        for attrs in self.relationAttrs]
+
+    def pack(self, relation, inputTuple, rank=0):
+        """ Packs an extended tuple
+
+        Input:  relation    The 1-numbered relation
+                inputTuple  The extended tuple eg ['_', '0', '21', '_', ...]
+                rank        The secondary sort rank of the relation
+        Output: eg for R1(A1,A2) and 64 bit values 18 bytes
+        """
+        return self.structs[relation-1].pack(
+            rank, relation,
+            *[int(inputTuple[attr]) for attr in self.relationAttrs[relation-1]])
+
+    def unpack(self, value):
+        """ Unpacks a value into its relation and extended tuple
+
+        Output: (relation, tuple) with the relation 1-numbered and integer
+                attribute values eg (1, ['_', 0, 21, '_', '_', '_'])
+        """
+        relation = ord(value[1])
+        values = self.structs[relation-1].unpack(value)
+        extended = ['_'] * self.numberAttributes
+        for attr, v in zip(self.relationAttrs[relation-1], values[2:]):
+            extended[attr] = v
+        return relation, extended
+
+    def countValue(self, value, count):
+        """ Appends the multiplicity of a packed value, unless it is 1 """
+        if count == 1:
+            return value
+        return value + MULTIPLICITY.pack(count)
+
+    def splitCount(self, value):
+        """ The packed value and multiplicity of a countValue """
+        size = self.structs[ord(value[1])-1].size
+        if len(value) == size:
+            return value, 1
+        return value[:size], MULTIPLICITY.unpack(value[size:])[0]
+
+    def unpackCounted(self, value):
+        """ unpack of a countValue
+
+        Output: (relation, (tuple, multiplicity))
+        """
+        value, count = self.splitCount(value)
+        relation, extended = self.unpack(value)
+        return relation, (extended, count)
@@ -0,0 +1,93 @@
+import random
+from collections import Counter
+
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+
+
+def makeJob(extra=[]):
+    job = SharesSkewJob(['--schemaFile', 'schema.p',
+                         '--residualsFile', 'residualjoins.p',
+                         '--sharesFile', 'shares.p',
+                         '--hhFile', 'heavyhitters.p',
+                         '--sizesFile', 'relationsizes.txt'] + extra)
+    job.sandbox()
+    job.mapper_init()
+    return job
+
+
+def makeLines(numberTuples):
+    """ Ordinary values and the HH values of heavyhitters.p """
+    random.seed(111)
+
+    def value(hh):
+        if random.random() < 0.3:
+            return random.choice(hh)
+        return str(random.randrange(112312311))
+    lines = []
+    for i in xrange(numberTuples):
+        relation = random.choice([1, 2, 3])
+        if relation == 1:
+            values = [value(['0']), value(['21', '22', '23', '24', '25'])]
+        elif relation == 2:
+            values = [value(['21', '22', '23', '24', '25']),
+                      value(['31', '32', '33', '34', '35']), value(['40'])]
+        else:
+            values = [value(['31', '32', '33', '34', '35']), value(['40'])]
+        lines.append('R%d %s' % (relation, ' '.join(values)))
+    return lines
+
+
+def assertParity(extra, lines=None):
+    lines = lines or makeLines(500)
+    job = makeJob(extra)
+    expected_result = Counter(pair for line in lines
+                              for pair in job.identityMapper(None, line))
+    job = makeJob(extra + ['--batch-size', '64'])
+    result = Counter()
+    for line in lines:
+        result.update(job.batchMapper(None, line))
+    result.update(job.batchMapper_final())
+    assert_equal(result, expected_result)
+
+
+def test_batchMapperParity():
+    assertParity([])
+
+
+def test_batchMapperParityCellKeys():
+    assertParity(['--key-format', 'cell', '--reduce-number', '37'])
+
+
+def test_batchMapperParityPacked():
+    assertParity(['--internal-format', 'packed', '--secondary-sort'])
+
+
+def test_batchMapperParityHashed():
+    assertParity(['--key-format', 'cell', '--reduce-number', '37',
+                  '--hash-function', 'multiply-shift', '--hash-seed', '3'])
+
+
+def test_batchMapperParityNonCanonical():
+    # '021', '+21' and '-0' are ordinary values to the text mapper, not the
+    # HH values 21 and 0
+    random.seed(7)
+    lines = []
+    for line in makeLines(500):
+        tokens = line.split(' ')
+        if random.random() < 0.2:
+            tokens[1] = ('-0' if tokens[1] == '0' else
+                         random.choice(['0', '+']) + tokens[1])
+        lines.append(' '.join(tokens))
+    assert any(line.split(' ')[1][0] in '0+' for line in lines)
+    assertParity([], lines)
+    assertParity(['--key-format', 'cell', '--reduce-number', '37'], lines)
+
+
+def test_parseMalformedBlock():
+    job = makeJob(['--batch-size', '64'])
+    assert_raises(ValueError, job.batch.parse, 1, ['R2 21 31 40', 'R2 21'])
+    assert_raises(ValueError, job.batch.parse, 0, ['R1 10 21', 'R1 5',
+                                                   'R1 5 6 7'])
+    assert_raises(ValueError, job.batch.parse, 0, ['R1 10 021'])
@@ -0,0 +1,93 @@
+import os
+import pickle
+import shutil
+import tempfile
+from collections import Counter
+from io import BytesIO
+
+import numpy as np
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+from skew.binaryInput import (columnFile, convertText, manifestLines,
+                              parseManifestLine)
+from tests.batchRouting_tests import makeLines
+
+
+def test_convertRoundTrip():
+    lines = makeLines(500)
+    schema = pickle.load(open('schema.p', 'rb'))
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = convertText(lines, directory, schema, blockSize=64)
+        assert_equal(sorted(filenames), [1, 2, 3])
+        for relation, filename in filenames.iteritems():
+            expected_result = [[int(v) for v in line.split(' ')[1:]]
+                               for line in lines
+                               if line.startswith('R%d ' % relation)]
+            columns = columnFile(filename)
+            assert_equal(columns.relation, relation)
+            assert_equal(columns.numberRows, len(expected_result))
+            rows = columns.rows(0, columns.numberRows)
+            assert_equal(rows.tolist(), expected_result)
+            # A view of the mapped file, not a copy
+            assert np.may_share_memory(rows, columns.columns)
+            assert_equal(columns.rows(5, 9).tolist(), expected_result[5:9])
+        manifest = manifestLines([filenames[1]], 50)
+        assert_equal(parseManifestLine(manifest[0]), (filenames[1], 0, 50))
+        assert_equal(parseManifestLine(manifest[-1])[2],
+                     columnFile(filenames[1]).numberRows)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_convertMalformedLine():
+    directory = tempfile.mkdtemp()
+    try:
+        schema = pickle.load(open('schema.p', 'rb'))
+        for lines in [['R2 21 31 40', 'R2 21'],
+                      ['R1 10 21', 'R1 abc 4', 'R1 5 6', 'R1 7 8'],
+                      ['R1 10 21', 'R1 5', 'R1 5 6 7'],
+                      ['R1 10 2.5'], ['R1 10 021'], ['R1 +10 21']]:
+            assert_raises(ValueError, convertText, lines, directory, schema)
+    finally:
+        shutil.rmtree(directory)
+
+
+def runJob(args, lines):
+    job = SharesSkewJob(['-r', 'inline', '--schemaFile', 'schema.p',
+                         '--residualsFile', 'residualjoins.p',
+                         '--sharesFile', 'shares.p',
+                         '--hhFile', 'heavyhitters.p'] + args + ['-'])
+    job.sandbox(stdin=BytesIO('\n'.join(lines) + '\n'))
+    with job.make_runner() as runner:
+        runner.run()
+        return Counter(job.parse_output_line(line)
+                       for line in runner.stream_output())
+
+
+def assertBinaryParity(extra):
+    lines = makeLines(400)
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = convertText(lines, directory,
+                                pickle.load(open('schema.p', 'rb')))
+        manifest = manifestLines(
+            [filenames[relation] for relation in sorted(filenames)], 70)
+        expected_result = runJob(extra, lines)
+        assert expected_result
+        result = runJob(extra + ['--binary-input', '--batch-size', '32'],
+                        manifest)
+        assert_equal(result, expected_result)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_binaryInputJob():
+    assertBinaryParity(['--join-output', 'tuples'])
+
+
+def test_binaryInputPackedCellKeys():
+    assertBinaryParity(['--internal-format', 'packed', '--key-format',
+                        'cell', '--reduce-number', '8', '--secondary-sort',
+                        '--sizesFile', 'relationsizes.txt'])
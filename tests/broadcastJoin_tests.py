@@ -0,0 +1,115 @@
+import os
+import pickle
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from io import BytesIO
+
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+from skew import premap
+from skew.broadcastJoin import (broadcastKey, isBroadcastKey, residualKey,
+                                sideTables, spreadKey, writeSideFile)
+from skew.cellIndex import keyFieldPartition
+from tests.batchRouting_tests import makeJob, makeLines
+
+
+def test_broadcastResiduals():
+    sizes = [1000, 1000, 1000]
+    combs, sharesAllResiduals = premap.planResidualJoins(
+        'heavyhitters.txt', 6, 64, sizes, workers=1)
+    hhinfo = premap.readHeavyHitters('heavyhitters.txt', 6)[0]
+    broadcast = premap.broadcastResiduals(combs, sharesAllResiduals, sizes,
+                                          hhinfo, 20)
+    # R1 holds 50 tuples with A2 = 2, R2 0.5 and R3 10 with A3 = 31 too
+    assert_equal(broadcast[combs.index(('_', '_', '2', '31', '_', '_'))], 1)
+    assert 0 not in broadcast
+    # Shipping to 1000 mappers costs more than the shuffle
+    assert_equal(premap.broadcastResiduals(combs, sharesAllResiduals, sizes,
+                                           hhinfo, 20, 1000), {})
+
+
+def runJob(args, lines):
+    job = SharesSkewJob(['-r', 'inline', '--schemaFile', 'schema.p',
+                         '--residualsFile', 'residualjoins.p',
+                         '--sharesFile', 'shares.p',
+                         '--hhFile', 'heavyhitters.p'] + args + ['-'])
+    job.sandbox(stdin=BytesIO('\n'.join(lines) + '\n'))
+    with job.make_runner() as runner:
+        runner.run()
+        return [job.parse_output_line(line)[1]
+                for line in runner.stream_output()]
+
+
+def writeBroadcastFile(directory, lines):
+    load = lambda filename: pickle.load(open(filename, 'rb'))
+    schema, residuals = load('schema.p'), load('residualjoins.p')
+    heavyhitters = load('heavyhitters.p')
+    # Residual joins with a HH value on A2 are joined map-side against R2
+    broadcast = dict((residualId, 2)
+                     for residualId, residual in enumerate(residuals)
+                     if residual[2] != '_')
+    sideFile = os.path.join(directory, 'broadcasttuples.p')
+    writeSideFile(sideFile, broadcast, sideTables(
+        lines, schema, residuals, heavyhitters, broadcast))
+    return sideFile
+
+
+def assertBroadcastParity(extra):
+    lines = makeLines(400)
+    directory = tempfile.mkdtemp()
+    try:
+        sideFile = writeBroadcastFile(directory, lines)
+        for output in ['count', 'tuples']:
+            args = ['--join-output', output] + extra
+            expected_result = runJob(args, lines)
+            result = runJob(args + ['--broadcastFile', sideFile], lines)
+            if output == 'count':
+                assert sum(expected_result) > 0
+                assert_equal(sum(result), sum(expected_result))
+            else:
+                assert_equal(Counter(result), Counter(expected_result))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_broadcastJob():
+    assertBroadcastParity([])
+
+
+def test_broadcastBatchJob():
+    assertBroadcastParity(['--batch-size', '64', '--secondary-sort',
+                           '--key-format', 'cell', '--reduce-number', '8'])
+
+
+def test_broadcastKeysSpread():
+    lines = makeLines(400)
+    directory = tempfile.mkdtemp()
+    try:
+        job = makeJob(['--join-output', 'tuples', '--key-format', 'cell',
+                       '--reduce-number', '8', '--broadcastFile',
+                       writeBroadcastFile(directory, lines)])
+        pairs = [(key, value) for line in lines
+                 for key, value in job.identityMapper(None, line)
+                 if isBroadcastKey(key)]
+        # The joined tuples of a residual join reach several reduce tasks
+        tasks = defaultdict(set)
+        for key, value in pairs:
+            tasks[residualKey(key)].add(keyFieldPartition(
+                key.split('.', 1)[0], 8))
+        assert max(len(t) for t in tasks.itervalues()) > 1
+        # and are output under the key of the residual join
+        key = pairs[0][0]
+        assert_equal(set(k for k, v in job.broadcastReducer(
+            key, [v for k, v in pairs if k == key])), set([residualKey(key)]))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_residualKey():
+    assert_equal(residualKey(spreadKey(3, 5)), broadcastKey(3))
+    assert_equal(residualKey(spreadKey(3, 1, ['0', '1'])), 'broadcast.3')
+    assert_equal(residualKey(broadcastKey(12)), 'broadcast.12')
+    assert isBroadcastKey(spreadKey(3, 1, ['0', '1']))
+    assert not isBroadcastKey('_-_-2-_-_-_.3.0.0.0.0')
@@ -0,0 +1,49 @@
+from nose.tools import *
+
+from skew.cellIndex import cellIndex, keyFieldHash, keyFieldPartition, taskLabels
+from skew.shareGrid import shareGrid
+
+schema = [
+    [0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 0, 1, 1, 0]
+]
+residuals = [('_', '_', '_', '_', '_', '_'), ('_', '_', '21', '_', '_', '_')]
+shares = [{'2': 7, '3': 5}, {'1': 2, '3': 8}]
+heavyhitters = [{}, {2: '21'}]
+
+
+def test_keyFieldHash():
+    # Java: "17".hashCode() == 1574
+    assert_equal(keyFieldHash('17'), 1574)
+
+
+def test_taskLabels():
+    labels = taskLabels(37)
+    result = [keyFieldPartition(label, 37) for label in labels]
+    assert_equal(result, range(37))
+
+
+def test_cellIdsAreDense():
+    cells = cellIndex(shareGrid(schema, residuals, shares, heavyhitters), 4)
+    assert_equal(cells.offsets, [0, 35])
+    assert_equal(cells.totalCells, 51)
+    assert_equal(cells.cellsPerTask, 13)
+    # R2 hashes on A2, A3 and A5, so each R2 tuple lands on a single cell
+    seen = set()
+    for a2 in range(7):
+        for a3 in range(5):
+            inputTuple = ['_', '_', str(a2), str(a3), '_', '0']
+            seen.update(cells.cellIds(1, 0, inputTuple))
+    assert_equal(seen, set(range(35)))
+
+
+def test_cellIdsMatchStringKeys():
+    grid = shareGrid(schema, residuals, shares, heavyhitters)
+    cells = cellIndex(grid, 4)
+    inputTuple = ['_', '12', '21', '_', '_', '_']
+    result = cells.cellIds(0, 1, inputTuple)
+    assert_equal(len(result), len(grid.keys(0, 1, inputTuple)))
+    # A1 = 12 % 2 = 0 and A3 replicated over 8 cells
+    assert_equal(result, range(35, 43))
+    assert_equal(cells.key(35), cells.labels[2] + '.35')
@@ -0,0 +1,136 @@
+import os
+import pickle
+import random
+import shutil
+import tempfile
+from collections import Counter
+
+from nose.tools import *
+
+from skew.cellSplits import planSplits, splitAttributes
+from tests.batchRouting_tests import makeJob, makeLines
+from tests.broadcastJoin_tests import runJob
+from tests.simulator_tests import makeSimulator
+
+
+def skewedLines(numberTuples):
+    """ makeLines with the ordinary A3 value 7 in 40% of the R2 and R3
+    tuples, a heavy hitter heavyhitters.p misses
+    """
+    random.seed(5)
+    lines = []
+    for line in makeLines(numberTuples):
+        tokens = line.split(' ')
+        if tokens[0] == 'R2' and random.random() < 0.4:
+            tokens[2] = '7'
+        elif tokens[0] == 'R3' and random.random() < 0.4:
+            tokens[1] = '7'
+        lines.append(' '.join(tokens))
+    return lines
+
+
+def writeSplits(directory, lines, numberReducers=256):
+    simulator = makeSimulator(numberReducers)
+    splits = planSplits(simulator, lines)
+    filename = os.path.join(directory, 'splits.p')
+    with open(filename, 'wb') as f:
+        pickle.dump(splits, f)
+    return filename
+
+
+def test_splitAttributes():
+    schema = pickle.load(open('schema.p', 'rb'))
+    assert_equal(splitAttributes(schema, ('_', '_', '21', '_', '_', '_')),
+                 [1, 3, 4, 5])
+
+
+def assertPlanSplits(numberReducers):
+    lines = skewedLines(4000)
+    simulator = makeSimulator(numberReducers)
+    loads, tuples = simulator.sampled(lines)
+    before = simulator.statistics(loads, sum(tuples))
+    splits = planSplits(simulator, lines)
+    assert_equal(splits['reducers'], numberReducers)
+    loads = simulator.sampled(lines)[0]
+    # The split cells are replaced by their sub-cells
+    assert_equal(loads[splits['cells'].keys()].sum(), 0)
+    after = simulator.statistics(loads, sum(tuples))
+    assert after['maxTaskLoad'] < 0.5 * before['maxTaskLoad']
+    return splits
+
+
+def test_planSplitsMovesCells():
+    # Few reduce tasks of many cells each, no cell outweighs a task
+    splits = assertPlanSplits(8)
+    assert_equal(set(factor for first, factor in
+                     splits['cells'].itervalues()), set([1]))
+
+
+def test_planSplitsSplitsCells():
+    splits = assertPlanSplits(256)
+    assert max(factor for first, factor in
+               splits['cells'].itervalues()) > 1
+
+
+def test_splitKeys():
+    lines = skewedLines(2000)
+    directory = tempfile.mkdtemp()
+    try:
+        extra = ['--key-format', 'cell', '--reduce-number', '256',
+                 '--splitsFile', writeSplits(directory, lines)]
+        job = makeJob(extra)
+        expected_result = Counter(pair for line in lines
+                                  for pair in job.identityMapper(None, line))
+        # The batch mapper routes the sub-cells alike
+        job = makeJob(extra + ['--batch-size', '64'])
+        result = Counter()
+        for line in lines:
+            result.update(job.batchMapper(None, line))
+        result.update(job.batchMapper_final())
+        assert_equal(result, expected_result)
+        # and so does the simulator
+        cellLoads = Counter()
+        for (key, value), count in expected_result.iteritems():
+            cellLoads[int(key.split('.')[1])] += count
+        simulator = makeSimulator(256)
+        with open(extra[-1], 'rb') as f:
+            simulator.split(pickle.load(f))
+        loads = simulator.sampled(lines, blockSize=128)[0]
+        assert_equal(dict((cellId, int(load)) for cellId, load
+                          in enumerate(loads) if load), dict(cellLoads))
+        # Sub-cell keys carry the label of their task
+        for key in expected_result:
+            label, cellId = key[0].split('.')
+            assert_equal(label, job.cells.labels[job.cells.task(int(cellId))])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_splitJobParity():
+    lines = skewedLines(300)
+    directory = tempfile.mkdtemp()
+    try:
+        splitsFile = writeSplits(directory, lines)
+        for output in ['count', 'tuples']:
+            args = ['--join-output', output, '--key-format', 'cell',
+                    '--reduce-number', '256']
+            expected_result = runJob(args, lines)
+            result = runJob(args + ['--splitsFile', splitsFile], lines)
+            if output == 'count':
+                assert sum(expected_result) > 0
+                assert_equal(sum(result), sum(expected_result))
+            else:
+                assert_equal(Counter(result), Counter(expected_result))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_splitsReducersMismatch():
+    directory = tempfile.mkdtemp()
+    try:
+        splitsFile = writeSplits(directory, skewedLines(500))
+        assert_raises(ValueError, makeJob, [
+            '--key-format', 'cell', '--reduce-number', '64',
+            '--splitsFile', splitsFile])
+    finally:
+        shutil.rmtree(directory)
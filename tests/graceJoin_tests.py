@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+from collections import Counter
+from io import BytesIO
+
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+from skew.graceJoin import graceHashJoin
+from skew.joinEngine import multiwayJoin, trieJoin
+from tests.batchRouting_tests import makeLines
+from tests.broadcastJoin_tests import runJob
+from tests.joinEngine_tests import (nestedLoopJoin, randomTables,
+                                    weightTables)
+
+schema = [
+    [1, 1, 0, 0, 0],
+    [0, 1, 1, 0, 0],
+    [0, 0, 1, 1, 0],
+    [0, 0, 0, 1, 1]
+]
+
+
+def graceJoin(engine, tables, directory, weighted=False, probe=None):
+    # A budget of one byte spills on the first tuple
+    join = graceHashJoin(engine, 1, 4, weighted=weighted, probe=probe,
+                         directory=directory)
+    for relation, table in enumerate(tables):
+        if relation != probe:
+            for t in table:
+                join.add(relation, t)
+    return join
+
+
+def test_partitionAttribute():
+    join = graceHashJoin(multiwayJoin(schema), 1000000)
+    for relation, size in enumerate([5, 1, 100, 100]):
+        for i in xrange(size):
+            join.add(relation, ['_'] * 5)
+    # A2 replicates R3 and R4, A3 replicates R1 and R4, A4 R1 and R2
+    assert_equal(join.partitionAttribute(), 3)
+    join.probe = 1
+    assert_equal(join.partitionAttribute(), 2)
+
+
+def test_graceJoin():
+    tables = randomTables(schema, 6, 3)
+    expected_result = nestedLoopJoin(schema, tables)
+    directory = tempfile.mkdtemp()
+    try:
+        for engine in [multiwayJoin(schema), trieJoin(schema)]:
+            join = graceJoin(engine, tables, directory)
+            assert_equal(sorted(join.join()), expected_result)
+            assert join.partitions > 0 and join.spilledBytes > 0
+            join = graceJoin(engine, tables, directory)
+            assert_equal(join.join(countOnly=True), len(expected_result))
+            join = graceJoin(engine, tables, directory, probe=1)
+            assert_equal(sorted(join.streamJoin(1, iter(tables[1]))),
+                         expected_result)
+            # The spill files are removed once joined
+            assert_equal(os.listdir(directory), [])
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_weightedGraceJoin():
+    tables = randomTables(schema, 6, 2)
+    expected_result = nestedLoopJoin(schema, tables)
+    weighted = weightTables(tables)
+    for engine in [multiwayJoin(schema), trieJoin(schema)]:
+        join = graceJoin(engine, weighted, None, weighted=True)
+        assert_equal(join.join(countOnly=True), len(expected_result))
+        join = graceJoin(engine, weighted, None, weighted=True, probe=2)
+        assert_equal(sorted(join.streamJoin(2, iter(weighted[2]))),
+                     expected_result)
+
+
+def test_partitionsOfOneResidue():
+    # Packed values are ints the mapper sent to the bucket by value % share:
+    # with share 4 every value of the bucket is 1 modulo 4
+    join = graceHashJoin(multiwayJoin(schema), 1, 16)
+    for i in xrange(400):
+        join.add(0, ['_', 4 * i + 1, '_', '_', '_'])
+        join.add(1, ['_', 4 * i + 1, 7, '_', '_'])
+    try:
+        assert_equal(join.attribute, 1)
+        partitions = set(partition for relation, partition in join.files)
+        assert_equal(len(partitions), 16)
+        assert_equal(join.join(countOnly=True), 0)
+    finally:
+        if join.spillDirectory and os.path.exists(join.spillDirectory):
+            shutil.rmtree(join.spillDirectory)
+
+
+def test_inMemoryJoin():
+    tables = randomTables(schema, 6, 3)
+    join = graceHashJoin(multiwayJoin(schema), float('inf'))
+    for relation, table in enumerate(tables):
+        for t in table:
+            join.add(relation, t)
+    assert_equal(sorted(join.join()), nestedLoopJoin(schema, tables))
+    assert_equal(join.partitions, 0)
+    assert join.files is None
+
+
+def assertSpillingParity(extra, lines=None):
+    lines = lines or makeLines(400)
+    for output in ['count', 'tuples']:
+        args = ['--join-output', output] + extra
+        expected_result = runJob(args, lines)
+        result = runJob(args + ['--join-memory-mb', '0.001'], lines)
+        if output == 'count':
+            assert sum(expected_result) > 0
+            assert_equal(sum(result), sum(expected_result))
+        else:
+            assert_equal(Counter(result), Counter(expected_result))
+
+
+def test_spillingJob():
+    assertSpillingParity([])
+
+
+def test_spillingJobTextValues():
+    # Values that are not integers reach the reducer as unicode from JSON
+    lines = [' '.join([line.split(' ')[0]] + ['id' + v for v in
+                                              line.split(' ')[1:]])
+             for line in makeLines(400)]
+    assertSpillingParity([], lines)
+
+
+def test_spillingJobPackedSecondarySort():
+    assertSpillingParity(['--internal-format', 'packed', '--secondary-sort',
+                          '--sizesFile', 'relationsizes.txt',
+                          '--join-algorithm', 'trie'])
+
+
+def test_spillingCombinedJob():
+    assertSpillingParity(['--combine', '--key-format', 'cell',
+                          '--reduce-number', '4'])
+
+
+def test_spillCounters():
+    job = SharesSkewJob(['-r', 'inline', '--schemaFile', 'schema.p',
+                         '--residualsFile', 'residualjoins.p',
+                         '--sharesFile', 'shares.p',
+                         '--hhFile', 'heavyhitters.p',
+                         '--join-memory-mb', '0.001', '-'])
+    job.sandbox(stdin=BytesIO('\n'.join(makeLines(400)) + '\n'))
+    with job.make_runner() as runner:
+        runner.run()
+        counters = runner.counters()[0]['join']
+    assert counters['spilled buckets'] > 0
+    assert counters['spill partitions'] >= counters['spilled buckets']
+    assert counters['spilled bytes'] > 0
@@ -0,0 +1,83 @@
+from collections import Counter
+
+import numpy as np
+from nose.tools import *
+
+from skew.hashing import FNV_OFFSET, attributeHash, fnv1a
+from tests.batchRouting_tests import makeJob, makeLines
+from tests.broadcastJoin_tests import runJob
+
+
+def test_fnv1a():
+    assert_equal(fnv1a(''), FNV_OFFSET)
+    assert_equal(fnv1a('a'), 0xaf63dc4c8601ec8c)
+    assert_equal(fnv1a(u'Z\xfcrich'), fnv1a('Z\xc3\xbcrich'))
+
+
+def test_moduloIsIdentity():
+    hashing = attributeHash()
+    assert_equal(hashing.value(2, '21'), 21)
+    assert_equal(hashing.value(2, '-7') % 5, 3)
+    # Values that are not integers are hashed from their bytes
+    assert_equal(hashing.value(2, 'Paris'), fnv1a('Paris'))
+
+
+def test_columnMatchesValue():
+    column = np.array([-5, 0, 21, 112312311, 2**62, -2**63], dtype=np.int64)
+    for name in ['modulo', 'multiply-shift']:
+        hashing = attributeHash(name, seed=4)
+        assert_equal(list(hashing.column(3, column)),
+                     [hashing.value(3, str(v)) for v in column])
+
+
+def test_seedsAndAttributesAreIndependent():
+    values = [str(112312311 + i) for i in xrange(8)]
+    hashes = [[h.value(attr, v) for v in values] for h, attr in [
+        (attributeHash('multiply-shift', 0), 1),
+        (attributeHash('multiply-shift', 0), 2),
+        (attributeHash('multiply-shift', 1), 1)]]
+    assert_equal(len(set(map(tuple, hashes))), 3)
+
+
+def test_multiplyShiftSpreadsConsecutiveValues():
+    # Consecutive ids, one coordinate per id modulo 8
+    hashing = attributeHash('multiply-shift', seed=0)
+    counts = np.bincount([hashing.value(1, str(112312311 + i)) % 8
+                          for i in xrange(8000)], minlength=8)
+    assert counts.min() > 850
+
+
+def test_hashedJobParity():
+    lines = makeLines(400)
+    # Non HH values as strings
+    hh = set(['0', '21', '22', '23', '24', '25', '31', '32', '33', '34', '35',
+              '40'])
+    textLines = [' '.join([line.split(' ')[0]] + [
+        v if v in hh else 'id' + v for v in line.split(' ')[1:]])
+        for line in lines]
+    expected_result = sum(runJob([], lines))
+    assert expected_result > 0
+    for extra in [[], ['--hash-function', 'multiply-shift', '--hash-seed',
+                       '7', '--key-format', 'cell', '--reduce-number', '8'],
+                  ['--batch-size', '64', '--key-format', 'cell',
+                   '--reduce-number', '8']]:
+        assert_equal(sum(runJob(extra, textLines)), expected_result)
+
+
+def test_hashedBatchMapperParity():
+    # Blocks with values that are not integers fall back to the line mapper
+    lines = ['R2 21 31 id40', 'R2 21 31 40', 'R1 0 21', 'R3 31 id7']
+    extra = ['--key-format', 'cell', '--reduce-number', '8']
+    job = makeJob(extra)
+    expected_result = Counter(pair for line in lines
+                              for pair in job.identityMapper(None, line))
+    job = makeJob(extra + ['--batch-size', '2'])
+    result = Counter()
+    for line in lines:
+        result.update(job.batchMapper(None, line))
+    result.update(job.batchMapper_final())
+    assert_equal(result, expected_result)
+    # Lines of the wrong arity still fail
+    job = makeJob(extra + ['--batch-size', '2'])
+    assert_raises(ValueError, job.routeBlock, 2, ['R2 21 31 id40',
+                                                  'R2 21'])
@@ -0,0 +1,67 @@
+from io import BytesIO
+
+from nose.tools import *
+
+from heavyhittersjob import HeavyHittersJob
+from skew.heavyHitters import (formatHeavyHitter, fractions, joinAttributes,
+                               selectHeavyHitters)
+
+schema = [
+    [0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 0, 1, 1, 0]
+]
+
+
+def test_joinAttributes():
+    assert_equal(joinAttributes(schema), [2, 3])
+
+
+def test_formatHeavyHitter():
+    f = fractions(schema, 2, {1: 5, 2: 5}, {1: 100, 2: 100, 3: 100})
+    result = formatHeavyHitter(2, 2, f)
+    assert_equal(result, 'A2   2   R1:0.05,R2:0.05,R3:-0.0')
+
+
+def test_selectHeavyHitters():
+    candidates = [(1, [0.5, -0.0]), (2, [0.01, 0.2]), (3, [0.001, 0.002])]
+    assert_equal([v for v, f in selectHeavyHitters(candidates, 0.01)],
+                 [1, 2])
+    assert_equal([v for v, f in selectHeavyHitters(candidates, 0.0, 1)],
+                 [1])
+
+
+def test_heavyHittersJob():
+    lines = ['R1 1 21', 'R1 2 21', 'R1 3 7', 'R1 4 8',
+             'R2 21 31 1', 'R2 22 31 2',
+             'R3 31 1', 'R3 5 2', 'R3 6 3', 'R3 7 4']
+    job = HeavyHittersJob(['-r', 'inline', '--schemaFile', 'schema.p',
+                           '--threshold', '0.3', '-'])
+    job.sandbox(stdin=BytesIO('\n'.join(lines) + '\n'))
+    with job.make_runner() as runner:
+        runner.run()
+        result = sorted(line.rstrip('\n') for line in runner.stream_output())
+    expected_result = [
+        'A2   21   R1:0.5,R2:0.5,R3:-0.0',
+        'A2   22   R1:0.0,R2:0.5,R3:-0.0',
+        'A3   31   R1:-0.0,R2:1.0,R3:0.25',
+    ]
+    assert_equal(result, expected_result)
+
+
+def test_heavyHittersJobSpaceSaving():
+    lines = ['R2 %d 31 %d' % (20 + i % 3, i) for i in range(30)]
+    lines += ['R2 %d 32 %d' % (100 + i, i) for i in range(70)]
+    job = HeavyHittersJob(['-r', 'inline', '--schemaFile', 'schema.p',
+                           '--method', 'spacesaving', '--epsilon', '0.05',
+                           '--threshold', '0.2', '-'])
+    job.sandbox(stdin=BytesIO('\n'.join(lines) + '\n'))
+    with job.make_runner() as runner:
+        runner.run()
+        result = sorted(line.rstrip('\n') for line in runner.stream_output())
+    # 20, 21 and 22 hold 0.1 each and may be overestimated by 0.05
+    expected_result = [
+        'A3   31   R1:-0.0,R2:0.3,R3:0.0',
+        'A3   32   R1:-0.0,R2:0.7,R3:0.0',
+    ]
+    assert_equal(result, expected_result)
@@ -0,0 +1,245 @@
+import itertools
+import random
+from collections import Counter
+
+from nose.tools import *
+
+from skew.joinEngine import (countValue, extendTupleValue, leapfrogIntersect,
+                             multiwayJoin, parseCountedValue, parseValue,
+                             privateAttributes, projectTuple, relationOrder,
+                             splitCount, trieJoin)
+from tests.broadcastJoin_tests import runJob
+
+
+def extend(values, rel):
+    t = ['_'] * len(rel)
+    for attr, v in zip([a for a, x in enumerate(rel) if x == 1], values):
+        t[attr] = v
+    return t
+
+
+def randomTables(schema, size, domain):
+    random.seed(123)
+    return [[extend([str(random.randrange(domain)) for _ in range(sum(rel))],
+                    rel) for _ in range(size * (r + 1))]
+            for r, rel in enumerate(schema)]
+
+
+def nestedLoopJoin(schema, tables):
+    results = []
+    for combination in itertools.product(*tables):
+        joined = ['_'] * len(schema[0])
+        for rel, t in zip(schema, combination):
+            for attr, v in enumerate(rel):
+                if v == 1:
+                    if joined[attr] not in ('_', t[attr]):
+                        break
+                    joined[attr] = t[attr]
+            else:
+                continue
+            break
+        else:
+            results.append(joined)
+    return sorted(results)
+
+
+def test_parseValue():
+    result = parseValue("2:_+_+21+31+_+40")
+    expected_result = (2, ['_', '_', '21', '31', '_', '40'])
+    assert_equal(result, expected_result)
+
+
+def test_extendTupleValue():
+    assert_equal(extendTupleValue(['0', '21'], [0, 1, 1, 0, 0, 0]),
+                 ['_', '0', '21', '_', '_', '_'])
+
+
+def test_plan():
+    schema = [
+        [0, 1, 1, 0, 0, 0],
+        [0, 0, 1, 1, 0, 1],
+        [0, 0, 0, 1, 1, 0]
+    ]
+    result = multiwayJoin(schema).plan([10, 500, 20])
+    expected_result = (1, [(0, [2]), (2, [3])])
+    assert_equal(result, expected_result)
+
+
+def test_chainJoin():
+    schema = [
+        [1, 1, 0, 0, 0],
+        [0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 0],
+        [0, 0, 0, 1, 1]
+    ]
+    tables = randomTables(schema, 6, 3)
+    engine = multiwayJoin(schema)
+    expected_result = nestedLoopJoin(schema, tables)
+    assert_equal(sorted(engine.join(tables)), expected_result)
+    assert_equal(engine.join(tables, countOnly=True), len(expected_result))
+
+
+def test_starJoin():
+    schema = [
+        [1, 1, 1, 1, 0, 0, 0],
+        [1, 0, 0, 0, 1, 0, 0],
+        [0, 1, 0, 0, 0, 1, 0],
+        [0, 0, 1, 0, 0, 0, 1],
+        [0, 0, 0, 1, 0, 0, 0]
+    ]
+    tables = randomTables(schema, 3, 2)
+    engine = multiwayJoin(schema)
+    expected_result = nestedLoopJoin(schema, tables)
+    assert_equal(sorted(engine.join(tables)), expected_result)
+    assert_equal(engine.join(tables, countOnly=True), len(expected_result))
+
+
+def test_emptyRelation():
+    schema = [[1, 1, 0], [0, 1, 1]]
+    tables = [[['1', '2', '_']], []]
+    assert_equal(multiwayJoin(schema).join(tables, countOnly=True), 0)
+
+
+def test_leapfrogIntersect():
+    result = leapfrogIntersect([['1', '3', '5', '7'], ['3', '4', '7'],
+                                ['0', '3', '7', '9']])
+    expected_result = [('3', [1, 0, 1]), ('7', [3, 2, 2])]
+    assert_equal(result, expected_result)
+
+
+def test_trieJoinTriangle():
+    schema = [
+        [1, 1, 0],
+        [0, 1, 1],
+        [1, 0, 1]
+    ]
+    tables = randomTables(schema, 8, 4)
+    # Duplicate tuples join once per copy
+    tables[0].append(list(tables[0][0]))
+    engine = trieJoin(schema)
+    expected_result = nestedLoopJoin(schema, tables)
+    assert_equal(sorted(engine.join(tables)), expected_result)
+    assert_equal(engine.join(tables, countOnly=True), len(expected_result))
+
+
+def test_trieJoinChain():
+    schema = [
+        [1, 1, 0, 0, 0],
+        [0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 0],
+        [0, 0, 0, 1, 1]
+    ]
+    tables = randomTables(schema, 6, 3)
+    expected_result = nestedLoopJoin(schema, tables)
+    assert_equal(sorted(trieJoin(schema).join(tables)), expected_result)
+
+
+def test_relationOrder():
+    assert_equal(relationOrder([5000, 10000, 500]), [3, 1, 2])
+
+
+def test_streamJoin():
+    schema = [
+        [1, 1, 0, 0, 0],
+        [0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 0],
+        [0, 0, 0, 1, 1]
+    ]
+    tables = randomTables(schema, 6, 3)
+    expected_result = nestedLoopJoin(schema, tables)
+    for engine in [multiwayJoin(schema), trieJoin(schema)]:
+        builds = [list(t) for t in tables]
+        probeTuples = iter(builds[1])
+        builds[1] = []
+        result = sorted(engine.streamJoin(builds, 1, probeTuples))
+        assert_equal(result, expected_result)
+
+
+def test_privateAttributes():
+    schema = [
+        [0, 1, 1, 0, 0, 0],
+        [0, 0, 1, 1, 0, 1],
+        [0, 0, 0, 1, 1, 0]
+    ]
+    assert_equal(privateAttributes(schema), [1, 4, 5])
+    assert_equal(projectTuple(['_', '0', '21', '_', '_', '_'], [1, 4, 5]),
+                 ['_', '_', '21', '_', '_', '_'])
+
+
+def test_countValue():
+    value = countValue("2:_+_+21+31+_+40", 3)
+    assert_equal(value, "2:_+_+21+31+_+40*3")
+    assert_equal(splitCount(value), ("2:_+_+21+31+_+40", 3))
+    assert_equal(countValue("01:2:_+_+21", 1), "01:2:_+_+21")
+    assert_equal(parseCountedValue("01:2:_+_+21"), (2, (['_', '_', '21'], 1)))
+
+
+def weightTables(tables):
+    """ The distinct tuples of every relation with their multiplicity """
+    return [[(list(t), w) for t, w in Counter(map(tuple, table)).items()]
+            for table in tables]
+
+
+def test_weightedJoin():
+    schema = [
+        [1, 1, 0, 0, 0],
+        [0, 1, 1, 0, 0],
+        [0, 0, 1, 1, 0],
+        [0, 0, 0, 1, 1]
+    ]
+    # A small domain repeats tuples
+    tables = randomTables(schema, 6, 2)
+    expected_result = nestedLoopJoin(schema, tables)
+    weighted = weightTables(tables)
+    assert sum(len(t) for t in weighted) < sum(len(t) for t in tables)
+    for engine in [multiwayJoin(schema), trieJoin(schema)]:
+        assert_equal(sorted(engine.join(weighted, weighted=True)),
+                     expected_result)
+        assert_equal(engine.join(weighted, countOnly=True, weighted=True),
+                     len(expected_result))
+        builds = list(weighted)
+        probeTuples = iter(builds[1])
+        builds[1] = []
+        assert_equal(engine.streamJoin(builds, 1, probeTuples,
+                                       countOnly=True, weighted=True),
+                     len(expected_result))
+
+
+def assertCombinedParity(extra):
+    # Few distinct values, most tuples repeat
+    random.seed(7)
+    lines = []
+    for i in xrange(90):
+        relation = random.choice([1, 2, 3])
+        if relation == 1:
+            values = [random.choice(['0', '1']), random.choice(['21', '5'])]
+        elif relation == 2:
+            values = [random.choice(['21', '5']), random.choice(['31', '6']),
+                      random.choice(['40', '7'])]
+        else:
+            values = [random.choice(['31', '6']), random.choice(['8', '9'])]
+        lines.append('R%d %s' % (relation, ' '.join(values)))
+    for output in ['count', 'tuples']:
+        args = ['--join-output', output] + extra
+        expected_result = runJob(args, lines)
+        result = runJob(args + ['--combine'], lines)
+        if output == 'count':
+            assert sum(expected_result) > 0
+            assert_equal(sum(result), sum(expected_result))
+        else:
+            assert_equal(Counter(result), Counter(expected_result))
+
+
+def test_combinedJob():
+    assertCombinedParity([])
+
+
+def test_combinedBatchJob():
+    assertCombinedParity(['--batch-size', '16', '--key-format', 'cell',
+                          '--reduce-number', '8'])
+
+
+def test_combinedJobPackedSecondarySort():
+    assertCombinedParity(['--internal-format', 'packed', '--secondary-sort',
+                          '--sizesFile', 'relationsizes.txt',
+                          '--join-algorithm', 'trie'])
@@ -0,0 +1,111 @@
+import os
+import pickle
+import shutil
+import tempfile
+from collections import Counter
+
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+from skew.cellIndex import keyFieldPartition
+from skew.localEngine import (lineSplits, localEngine, splitLines,
+                              textPartition, textSplits)
+from skew.simulator import planSimulator
+from tests.batchRouting_tests import makeJob, makeLines
+from tests.broadcastJoin_tests import runJob
+
+jobArgs = ['--schemaFile', 'schema.p', '--residualsFile', 'residualjoins.p',
+           '--sharesFile', 'shares.p', '--hhFile', 'heavyhitters.p']
+
+
+def test_textPartition():
+    # Text.hashCode starts from 1 where String.hashCode, 1574 for "17",
+    # starts from 0
+    assert_equal(textPartition('17', 10000), 31 * 31 + 1574)
+
+
+def test_splitLines():
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'input.txt')
+        lines = makeLines(300)
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        for splitBytes in [1, 7, 100, 10 ** 6]:
+            assert_equal([line for split in textSplits([filename],
+                                                       splitBytes)
+                          for line in splitLines(*split)], lines)
+        assert_equal([list(splitLines(*split))
+                      for split in lineSplits([filename])],
+                     [[line] for line in lines])
+    finally:
+        shutil.rmtree(directory)
+
+
+def assertEngineParity(extra, workers=2):
+    lines = makeLines(400)
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'input.txt')
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        output = os.path.join(directory, 'output')
+        engine = localEngine(SharesSkewJob, jobArgs + extra, 8, workers,
+                             splitBytes=2000, spillRecords=100)
+        report = engine.run([filename], output)
+        expected_result = runJob(extra, lines)
+        assert report['mapTasks'] > 1
+        assert_equal(len(report['reducers']), 8)
+        assert_equal(sum(s['values'] for s in report['reducers']),
+                     report['counters']['group']['intermediate_tuples']
+                     if '--combine' not in extra else
+                     report['counters']['combiner']['values out'])
+        job = SharesSkewJob(jobArgs + extra)
+        result = []
+        for part in sorted(os.listdir(output)):
+            with open(os.path.join(output, part)) as f:
+                result.extend(job.parse_output_line(line)[1] for line in f)
+        if '--join-output' in extra:
+            assert_equal(Counter(result), Counter(expected_result))
+        else:
+            assert_equal(sum(result), sum(expected_result))
+        assert_equal(report['joinResults'], sum(expected_result)
+                     if '--join-output' not in extra
+                     else len(expected_result))
+        return report
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_engineStringKeys():
+    assertEngineParity([])
+
+
+def test_engineTuplesCombined():
+    assertEngineParity(['--join-output', 'tuples', '--combine',
+                        '--batch-size', '16'], workers=0)
+
+
+def test_engineStringKeysSecondarySort():
+    extra = ['--internal-format', 'raw', '--secondary-sort']
+    report = assertEngineParity(extra)
+    job = makeJob(extra)
+    keys = [key for line in makeLines(400)
+            for key, value in job.identityMapper(None, line)]
+    # Partitioned as KeyFieldBasedPartitioner does, not as HashPartitioner
+    loads = Counter(keyFieldPartition(key, 8) for key in keys)
+    assert_equal([s['values'] for s in report['reducers']],
+                 [loads[task] for task in xrange(8)])
+    assert_not_equal(loads, Counter(textPartition(key, 8) for key in keys))
+
+
+def test_engineCellKeysMatchSimulator():
+    extra = ['--key-format', 'cell', '--reduce-number', '8',
+             '--internal-format', 'raw', '--secondary-sort']
+    report = assertEngineParity(extra)
+    load = lambda filename: pickle.load(open(filename, 'rb'))
+    simulator = planSimulator(load('schema.p'), load('residualjoins.p'),
+                              load('shares.p'), load('heavyhitters.p'), 8)
+    loads, tuples = simulator.sampled(makeLines(400))
+    assert_equal([s['values'] for s in report['reducers']],
+                 [int(load) for load in simulator.taskLoads(loads)])
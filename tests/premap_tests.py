@@ -67,3 +67,72 @@ def test_readRelationSizes():
     result = premap.readRelationSizes('relationsizes.txt')
     expected_result = [5000, 10000, 500]
     assert_equal(result, expected_result)
+
+
+def test_planResidualJoins():
+    sizes = [1000, 1000, 1000]
+    expected_result = premap.calculateResidualJoins('heavyhitters.txt', 6,
+                                                    64, sizes)
+    serial = premap.planResidualJoins('heavyhitters.txt', 6, 64, sizes,
+                                      workers=1)
+    parallel = premap.planResidualJoins('heavyhitters.txt', 6, 64, sizes,
+                                        workers=2)
+    assert_equal(serial, expected_result)
+    assert_equal(parallel, expected_result)
+
+
+def test_writePlan():
+    import pickle
+    import shutil
+    import tempfile
+    combs, sharesAllResiduals = premap.planResidualJoins(
+        'heavyhitters.txt', 6, 64, [1000, 1000, 1000], workers=1)
+    directory = tempfile.mkdtemp()
+    try:
+        premap.writePlan(combs, sharesAllResiduals, directory)
+        residuals = pickle.load(open(directory + '/residualjoins.p', 'rb'))
+        heavyhitters = pickle.load(open(directory + '/heavyhitters.p', 'rb'))
+        shares = pickle.load(open(directory + '/shares.p', 'rb'))
+    finally:
+        shutil.rmtree(directory)
+    assert_equal(residuals[4], ('_', '_', '2', '31', '_', '_'))
+    assert_equal(heavyhitters[4], {2: '2', 3: '31'})
+    assert_equal(shares[4], sharesAllResiduals[4][0])
+
+
+def test_replanResidualJoins():
+    import os
+    import tempfile
+    sizes = [1000, 1000, 1000]
+    fd, filename = tempfile.mkstemp()
+    with os.fdopen(fd, 'w') as f:
+        f.write('A2   2   R1:0.05,R2:0.05,R3:-0.0\n'
+                'A3   31   R1:-0.0,R2:0.01,R3:0.01\n'
+                'A3   33   R1:-0.0,R2:0.02,R3:0.01\n')
+    try:
+        combs, sharesAllResiduals = premap.planResidualJoins(
+            'heavyhitters.txt', 6, 64, sizes, workers=1)
+        result = premap.replanResidualJoins(
+            combs, [s[0] for s in sharesAllResiduals], 'heavyhitters.txt',
+            filename, 6, 64, sizes, workers=1)
+        expected_result = premap.planResidualJoins(filename, 6, 64, sizes,
+                                                   workers=1)
+        hhinfo = premap.readHeavyHitters(filename, 6)[0]
+        diff = premap.diffHeavyHitters(
+            premap.readHeavyHitters('heavyhitters.txt', 6)[0], hhinfo)
+    finally:
+        os.remove(filename)
+    assert_equal(result[:2], expected_result)
+    # Only the residual joins with A3 = 31 keep their replaceSize inputs
+    assert_equal([result[0][i] for i in result[2]],
+                 [c for c in result[0] if c[3] != '31'])
+    assert_equal(diff, ([(3, 33)], [(3, 32)], []))
+
+
+def test_planResidualJoinsGlobal():
+    combs, sharesAllResiduals = premap.planResidualJoinsGlobal(
+        'heavyhitters.txt', 6, 64, [1000, 1000, 1000])
+    budgets = [reduce(lambda x, y: x * y, s[0].values(), 1)
+               for s in sharesAllResiduals]
+    assert_equal(len(combs), len(sharesAllResiduals))
+    assert_equal(sum(budgets), 64)
@@ -0,0 +1,71 @@
+import os
+import pickle
+import shutil
+import tempfile
+from collections import defaultdict
+from io import BytesIO
+
+from nose.tools import *
+
+from sharesskew import SharesSkewJob
+from skew.planFile import writePlanFile
+from skew.queryPlan import keyPlanId
+from tests.batchRouting_tests import makeLines
+
+
+def test_keyPlanId():
+    assert_equal(keyPlanId('1/_-_-2-_-_-_.3.0.0.0.0'), 1)
+    assert_equal(keyPlanId('7.12/52'), 12)
+
+
+def runJob(args, lines):
+    job = SharesSkewJob(['-r', 'inline'] + args + ['-'])
+    job.sandbox(stdin=BytesIO('\n'.join(lines) + '\n'))
+    counts = defaultdict(int)
+    with job.make_runner() as runner:
+        runner.run()
+        for line in runner.stream_output():
+            key, value = job.parse_output_line(line)
+            counts[keyPlanId(key) if '/' in key else None] += value
+    return dict(counts)
+
+
+def assertMultiPlan(extra):
+    lines = makeLines(300)
+    load = lambda filename: pickle.load(open(filename, 'rb'))
+    schema, residuals = load('schema.p'), load('residualjoins.p')
+    heavyhitters = load('heavyhitters.p')
+    planShares = [load('shares.p'), [{} for residual in residuals]]
+    directory = tempfile.mkdtemp()
+    try:
+        expected_result = {}
+        planArgs = []
+        for planId, shares in enumerate(planShares):
+            sharesFile = os.path.join(directory, 'shares%d.p' % planId)
+            pickle.dump(shares, open(sharesFile, 'wb'))
+            expected_result[planId] = runJob(
+                ['--schemaFile', 'schema.p',
+                 '--residualsFile', 'residualjoins.p',
+                 '--hhFile', 'heavyhitters.p',
+                 '--sharesFile', sharesFile] + extra, lines)[None]
+            planFile = os.path.join(directory, 'plan%d.p' % planId)
+            writePlanFile(planFile, schema, residuals, shares, heavyhitters)
+            planArgs += ['--planFile', planFile]
+        result = runJob(planArgs + extra, lines)
+    finally:
+        shutil.rmtree(directory)
+    assert expected_result[0] > 0
+    assert_equal(result, expected_result)
+
+
+def test_multiPlanStringKeys():
+    assertMultiPlan([])
+
+
+def test_multiPlanCellKeys():
+    assertMultiPlan(['--key-format', 'cell', '--reduce-number', '8',
+                     '--secondary-sort', '--internal-format', 'packed'])
+
+
+def test_multiPlanCombined():
+    assertMultiPlan(['--combine', '--internal-format', 'packed'])
@@ -0,0 +1,43 @@
+import pickle
+
+from nose.tools import *
+
+from sharesskew import decideSingleResidual, extendTupleValue
+from skew.router import residualRouter
+
+
+def loadPlan():
+    schema = pickle.load(open('schema.p', 'rb'))
+    residuals = pickle.load(open('residualjoins.p', 'rb'))
+    heavyhitters = pickle.load(open('heavyhitters.p', 'rb'))
+    hhinvertedIndex = {}
+    for t in heavyhitters:
+        for k, v in t.iteritems():
+            hhinvertedIndex[(k, v)] = "HH"
+    return schema, residuals, heavyhitters, hhinvertedIndex
+
+
+def test_routeMatchesLinearScan():
+    schema, residuals, heavyhitters, hhinvertedIndex = loadPlan()
+    router = residualRouter(schema, residuals, hhinvertedIndex)
+    lines = ['R1 10 0', 'R1 10 21', 'R2 21 31 40', 'R2 22 7 40',
+             'R2 0 35 40', 'R3 31 40', 'R3 3 40']
+    for line in lines:
+        tokens = line.split(' ')
+        relation = int(tokens[0][1:])
+        inputTuple = extendTupleValue(tokens[1:], schema[relation-1])
+        expected_result = [i for i, residual in enumerate(residuals)
+                           if decideSingleResidual(inputTuple, residual,
+                                                   heavyhitters,
+                                                   hhinvertedIndex)]
+        result = list(router.route(relation-1, inputTuple))
+        assert_equal(result, expected_result)
+
+
+def test_routeHHTuple():
+    schema, residuals, heavyhitters, hhinvertedIndex = loadPlan()
+    router = residualRouter(schema, residuals, hhinvertedIndex)
+    inputTuple = extendTupleValue(['21', '31', '40'], schema[1])
+    result = [residuals[i] for i in router.route(1, inputTuple)]
+    expected_result = [('_', '_', '21', '31', '_', '_')]
+    assert_equal(result, expected_result)
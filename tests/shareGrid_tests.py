@@ -0,0 +1,36 @@
+from nose.tools import *
+
+from skew.shareGrid import shareGrid, shareVector
+
+schema = [
+    [0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 0, 1, 1, 0]
+]
+
+
+def test_shareVector():
+    result = shareVector({'1': 11, '5': 4, '4': 8}, {2: '21', 3: '31'}, 6)
+    expected_result = (1, 11, 1, 1, 8, 4)
+    assert_equal(result, expected_result)
+
+
+def test_keys():
+    residuals = [('_', '_', '_', '_', '_', '_')]
+    shares = [{'2': 7, '3': 5}]
+    grid = shareGrid(schema, residuals, shares, [{}])
+    result = grid.keys(2, 0, ['_', '_', '_', '3', '40', '_'])
+    expected_result = ['_-_-_-_-_-_.0.%d.3.0.0' % i for i in range(7)]
+    assert_equal(result, expected_result)
+    # The plan's shares dicts are left untouched
+    assert_equal(shares, [{'2': 7, '3': 5}])
+
+
+def test_keysHHResidual():
+    residuals = [('_', '_', '21', '31', '_', '_')]
+    shares = [{'1': 2, '5': 3, '4': 1}]
+    grid = shareGrid(schema, residuals, shares, [{2: '21', 3: '31'}])
+    result = grid.keys(1, 0, ['_', '_', '21', '31', '_', '40'])
+    expected_result = ['_-_-21-31-_-_.0.0.0.0.1',
+                       '_-_-21-31-_-_.1.0.0.0.1']
+    assert_equal(result, expected_result)
@@ -0,0 +1,81 @@
+import math
+import os
+import shutil
+import tempfile
+
+from nose.tools import *
+
+from skew import premap
+from skew.sharesCache import sharesCache
+
+
+def test_keyScaleAndTolerance():
+    cache = sharesCache(tolerance=0.01)
+    key = cache.key([[3], [], [2]], [1000, 10000, 1000], 64)
+    assert_equal(cache.key([[3], [], [2]], [500, 5000, 500], 64), key)
+    assert_not_equal(cache.key([[3], [], [2]], [500, 5000, 500], 64,
+                               scaleFree=False),
+                     cache.key([[3], [], [2]], [1000, 10000, 1000], 64,
+                               scaleFree=False))
+    # The solver is part of the problem
+    assert_not_equal(cache.key([[3], [], [2]], [1000, 10000, 1000], 64,
+                               solver='couenne'), key)
+    cache.put(key, {'2': 8, '3': 8})
+    assert_equal(cache.get(cache.key([[3], [], [2]], [1002, 10000, 1001],
+                                     64)), {'2': 8, '3': 8})
+    assert_equal(cache.get(cache.key([[3], [], [2]], [1200, 10000, 1000],
+                                     64)), None)
+    assert_equal(cache.get(cache.key([[3], [], [2]], [1000, 10000, 1000],
+                                     64, solver='couenne')), None)
+
+
+def test_toleranceAcrossBuckets():
+    # Sizes within the tolerance hit however they fall on the grid, and
+    # sizes beyond it miss even in an adjacent bucket
+    cache = sharesCache(tolerance=0.01)
+    step = math.log(1.01)
+    edge = math.exp(7 * step)
+    cache.put(cache.key([[2]], [edge * 0.999], 8, scaleFree=False), {'2': 8})
+    assert_equal(cache.get(cache.key([[2]], [edge * 1.005], 8,
+                                     scaleFree=False)), {'2': 8})
+    assert_equal(cache.get(cache.key([[2]], [edge * 1.0095], 8,
+                                     scaleFree=False)), None)
+    cache = sharesCache(tolerance=0.01)
+    cache.put(cache.key([[2]], [edge * 1.0001], 8, scaleFree=False), {'2': 8})
+    assert_equal(cache.get(cache.key([[2]], [edge * 1.0099], 8,
+                                     scaleFree=False)), {'2': 8})
+    assert_equal(cache.get(cache.key([[2]], [edge * 1.0101 * 1.0001], 8,
+                                     scaleFree=False)), None)
+
+
+def test_lruEviction():
+    cache = sharesCache(capacity=2)
+    a, b, c = [cache.key([[2]], [size], 8, scaleFree=False)
+               for size in [1, 2, 4]]
+    cache.put(a, {'1': 2})
+    cache.put(b, {'1': 4})
+    cache.get(a)
+    cache.put(c, {'1': 8})
+    assert_equal(cache.get(b), None)
+    assert_equal(cache.get(a), {'1': 2})
+    assert_equal(cache.get(c), {'1': 8})
+
+
+def test_persistedReplanning():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'sharescache.p')
+    sizes = [1000, 1000, 1000]
+    try:
+        expected_result = premap.planResidualJoins(
+            'heavyhitters.txt', 6, 64, sizes, workers=1)
+        result = premap.planResidualJoins(
+            'heavyhitters.txt', 6, 64, sizes, workers=1,
+            cache=sharesCache(filename))
+        assert_equal(result, expected_result)
+        cache = sharesCache(filename)
+        result = premap.planResidualJoins(
+            'heavyhitters.txt', 6, 64, sizes, workers=1, cache=cache)
+        assert_equal(result, expected_result)
+        assert_equal(cache.misses, 0)
+    finally:
+        shutil.rmtree(directory)
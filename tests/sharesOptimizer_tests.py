@@ -0,0 +1,87 @@
+import random
+
+from nose.tools import *
+
+from skew.sharesOptimizer import (allocateReducers, calculateShares,
+                                  communicationCost,
+                                  exhaustiveShares, factorizations,
+                                  numberFactorizations, relaxShares)
+
+
+def test_numberFactorizations():
+    for k, m in [(1, 3), (64, 3), (720, 4), (97, 2)]:
+        assert_equal(numberFactorizations(k, m),
+                     len(list(factorizations(k, m))))
+
+
+def test_relaxedChainJoin():
+    # R1(A1,A2) R2(A2,A3,A5) R3(A3,A4): cost r1 * x3 + r3 * x2
+    relaxed = relaxShares([[3], [], [2]], [1000, 10000, 4000], 64)
+    assert_almost_equal(relaxed[2], 4.0, places=4)
+    assert_almost_equal(relaxed[3], 16.0, places=4)
+
+
+def test_calculateShares():
+    result = calculateShares([[3], [], [2]], [1000, 10000, 1000], 64)
+    expected_result = ({'2': 8, '3': 8}, 26000, 26000 / 64.0)
+    assert_equal(result, expected_result)
+
+
+def test_relaxedRoundingMatchesExhaustive():
+    random.seed(111)
+    for trial in range(50):
+        expressionVars = [random.sample([1, 3, 4, 5], random.randint(0, 3))
+                          for r in range(3)]
+        if not any(expressionVars):
+            continue
+        sizes = [random.choice([10, 500, 10000, 2e5]) for r in range(3)]
+        k = random.choice([12, 64, 210, 256])
+        shares, cost, perReducer = calculateShares(expressionVars, sizes, k,
+                                                   exhaustiveLimit=0)
+        assert_equal(reduce(lambda x, y: x * y, shares.values()), k)
+        best = exhaustiveShares(expressionVars, sizes, k)
+        assert_equal(cost, communicationCost(expressionVars, sizes, best))
+
+
+def test_noShareVariables():
+    assert_equal(calculateShares([[], []], [10, 20], 8), ({}, 30, 30 / 8.0))
+
+
+def test_allocateReducers():
+    problems = [([[3], [], [2]], [1000, 10000, 1000]),
+                ([[3], [], []], [100, 1000, 100]),
+                ([[], []], [10, 20])]
+    results = allocateReducers(problems, 64)
+    budgets = [reduce(lambda x, y: x * y, shares.values(), 1)
+               for shares, cost, perReducer in results]
+    assert_equal(sum(budgets), 64)
+    assert_equal(budgets[2], 1)
+    # No even split of the spare reducers has a lower maximum load
+    load = max(cost / budget for (shares, cost, p), budget
+               in zip(results, budgets))
+    for k in range(1, 63):
+        even = [calculateShares(problems[0][0], problems[0][1], k),
+                calculateShares(problems[1][0], problems[1][1], 63 - k)]
+        assert max(even[0][2], even[1][2]) >= load
+
+
+def test_allocateReducersTotalCost():
+    problems = [([[3], [], [2]], [100, 1000, 1000]),
+                ([[2], []], [1000, 100]),
+                ([[3], [], [2]], [5000, 5000, 5000])]
+    results = allocateReducers(problems, 16)
+    budgets = [reduce(lambda x, y: x * y, shares.values(), 1)
+               for shares, cost, perReducer in results]
+    assert_equal(budgets, [3, 1, 12])
+    # The leftover reducers of [1, 3, 12] give the same maximum load at a
+    # higher total communication cost
+    other = [calculateShares(expressionVars, relationSizes, budget)
+             for (expressionVars, relationSizes), budget
+             in zip(problems, [1, 3, 12])]
+    assert_almost_equal(max(r[2] for r in results), max(r[2] for r in other))
+    assert_equal(sum(r[1] for r in results), 43400)
+    assert_equal(sum(r[1] for r in other), 45200)
+
+
+def test_allocateReducersBudget():
+    assert_raises(ValueError, allocateReducers, [([[1]], [10])] * 3, 2)
@@ -0,0 +1,77 @@
+import pickle
+from collections import Counter
+
+from nose.tools import *
+
+from skew import premap
+from skew.hashing import attributeHash
+from skew.simulator import planSimulator
+from tests.batchRouting_tests import makeJob, makeLines
+
+
+def makeSimulator(numberReducers=64, hashing=None):
+    return planSimulator(pickle.load(open('schema.p', 'rb')),
+                         pickle.load(open('residualjoins.p', 'rb')),
+                         pickle.load(open('shares.p', 'rb')),
+                         pickle.load(open('heavyhitters.p', 'rb')),
+                         numberReducers, hashing)
+
+
+def test_sampledMatchesCellKeys():
+    assertSampledMatchesCellKeys([])
+
+
+def test_sampledMatchesHashedCellKeys():
+    assertSampledMatchesCellKeys(['--hash-function', 'multiply-shift',
+                                  '--hash-seed', '9'],
+                                 attributeHash('multiply-shift', 9))
+
+
+def assertSampledMatchesCellKeys(extra, hashing=None):
+    lines = makeLines(2000)
+    job = makeJob(['--key-format', 'cell', '--reduce-number', '64'] + extra)
+    expected_result = Counter()
+    for line in lines:
+        for key, value in job.identityMapper(None, line):
+            expected_result[int(key.split('.')[1])] += 1
+    simulator = makeSimulator(hashing=hashing)
+    loads, tuples = simulator.sampled(lines, blockSize=128)
+    assert_equal(dict((cellId, int(load)) for cellId, load
+                      in enumerate(loads) if load), dict(expected_result))
+    assert_equal(sum(tuples), 2000)
+    stats = simulator.statistics(loads, sum(tuples))
+    assert_equal(stats['communicationCost'], sum(expected_result.values()))
+    assert_almost_equal(stats['maxMeanRatio'], stats['maxTaskLoad'] /
+                        (stats['communicationCost'] / 64))
+
+
+def test_expectedCommunicationCost():
+    # R1(A1,A2) R2(A2,A3,A5) R3(A3,A4), one residual join with shares
+    # x2 = 4, x3 = 2: R1 is replicated 2 times and R3 4 times
+    schema = premap.readSchema('relations.txt', 6)
+    residual = ('_',) * 6
+    simulator = planSimulator(schema, [residual], [{'2': 4, '3': 2}],
+                              [{}], 8)
+    loads = simulator.expected([1000, 2000, 3000], {'attributes': {}})
+    assert_equal(len(loads), 8)
+    assert_almost_equal(loads.sum(), 1000 * 2 + 2000 + 3000 * 4)
+    assert_almost_equal(loads.max(), loads.min())
+    stats = simulator.statistics(loads, 6000)
+    assert_almost_equal(stats['replication'], 16000 / 6000.0)
+    assert_almost_equal(stats['maxMeanRatio'], 1.0)
+
+
+def test_expectedSplitCells():
+    # As above, cell 0 split in two on A4, of R3 only, and cell 3 moved
+    schema = premap.readSchema('relations.txt', 6)
+    simulator = planSimulator(schema, [('_',) * 6], [{'2': 4, '3': 2}],
+                              [{}], 8)
+    simulator.split({'residuals': {0: (4, 2)}, 'cells': {0: (8, 2),
+                                                         3: (10, 1)},
+                     'tasks': [5, 6, 7], 'reducers': 8})
+    loads = simulator.expected([1000, 2000, 3000], {'attributes': {}})
+    assert_equal(len(loads), 11)
+    # R1 and R2 go to both sub-cells, R3 to one of them
+    assert_equal(list(loads[[0, 3, 8, 9, 10]]), [0, 0, 1250, 1250, 2000])
+    assert_equal(list(simulator.taskLoads(loads)),
+                 [0, 2000, 2000, 0, 2000, 3250, 3250, 4000])
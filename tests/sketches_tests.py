@@ -0,0 +1,56 @@
+import random
+from collections import Counter
+
+from nose.tools import *
+
+from skew.sketches import spaceSaving
+
+
+def zipfStream(n):
+    random.seed(111)
+    stream = []
+    for i in xrange(n):
+        if random.random() < 0.3:
+            stream.append(str(random.randint(1, 5)))
+        else:
+            stream.append(str(random.randrange(10**6)))
+    return stream
+
+
+def assertBounds(summary, stream):
+    exact = Counter(stream)
+    bound = len(stream) / float(summary.capacity)
+    assert_equal(summary.total, len(stream))
+    assert_true(len(summary.counters) <= summary.capacity)
+    for value, count in exact.iteritems():
+        estimate = summary.estimate(value)
+        assert_true(count <= estimate <= count + bound)
+        if count > bound:
+            assert_true(value in summary.counters)
+
+
+def test_exactBelowCapacity():
+    summary = spaceSaving(10)
+    for value in 'aabac':
+        summary.update(value)
+    assert_equal(summary.items(), [('a', 3, 0), ('b', 1, 0), ('c', 1, 0)])
+
+
+def test_errorBound():
+    stream = zipfStream(5000)
+    summary = spaceSaving.fromEpsilon(0.01)
+    for value in stream:
+        summary.update(value)
+    assertBounds(summary, stream)
+
+
+def test_mergeErrorBound():
+    stream = zipfStream(6000)
+    summaries = []
+    for part in (stream[:1000], stream[1000:4500], stream[4500:]):
+        summary = spaceSaving(100)
+        for value in part:
+            summary.update(value)
+        summaries.append(spaceSaving.fromList(summary.toList()))
+    merged = summaries[0].merge(summaries[1]).merge(summaries[2])
+    assertBounds(merged, stream)
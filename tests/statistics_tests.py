@@ -0,0 +1,92 @@
+import mmap
+import os
+import random
+import shutil
+import tempfile
+
+from nose.tools import *
+
+from skew import premap
+from skew.statistics import (blockLines, collectStatistics,
+                             writeHeavyHitters, writeRelationSizes)
+
+schema = premap.readSchema('relations.txt', 6)
+
+
+def writeInput(filename, numberTuples):
+    """ A2 = 7 in 5% of R1 and 2% of R2, A3 = 31 in 10% of R2 and 20% of R3
+    """
+    random.seed(111)
+
+    def value(hh, p):
+        return hh if random.random() < p else random.randrange(10 ** 6)
+    with open(filename, 'w') as f:
+        for i in xrange(numberTuples):
+            relation = random.choice([1, 2, 2, 3])
+            if relation == 1:
+                values = [random.randrange(1000), value(7, 0.05)]
+            elif relation == 2:
+                values = [value(7, 0.02), value(31, 0.1),
+                          random.randrange(50)]
+            else:
+                values = [value(31, 0.2), random.randrange(100)]
+            f.write('R%d %s\n' % (relation, ' '.join(map(str, values))))
+
+
+def setup():
+    global directory, inputFilename, lines
+    directory = tempfile.mkdtemp()
+    inputFilename = os.path.join(directory, 'input.txt')
+    writeInput(inputFilename, 100000)
+    lines = [line.rstrip('\n') for line in open(inputFilename)]
+
+
+def teardown():
+    shutil.rmtree(directory)
+
+
+def test_blockLinesPartition():
+    size = os.path.getsize(inputFilename)
+    with open(inputFilename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        result = []
+        for start in xrange(0, size, 1000):
+            result.extend(blockLines(data, start, min(start + 1000, size)))
+        data.close()
+    assert_equal(result, lines)
+
+
+def test_fullScanIsExact():
+    stats = collectStatistics([inputFilename], schema, numberBlocks=10 ** 6)
+    for relation in [1, 2, 3]:
+        size = sum(1 for line in lines if line.startswith('R%d ' % relation))
+        assert_equal(stats['sizes'][relation - 1], (size, size, size))
+    r1 = [line.split(' ')[2] for line in lines if line.startswith('R1 ')]
+    distinct = float(len(set(r1)))
+    assert_equal(stats['distinct'][(1, 2)], (distinct, distinct, distinct))
+    attr, value, fractions, intervals = stats['heavyhitters'][0]
+    assert_equal((attr, value), (2, 7))
+    assert_equal(fractions[0], r1.count('7') / float(len(r1)))
+    assert_equal(intervals[0], (fractions[0], fractions[0]))
+    assert_equal(intervals[2], None)
+    sizesFilename = os.path.join(directory, 'relationsizes.txt')
+    hhFilename = os.path.join(directory, 'heavyhitters.txt')
+    writeRelationSizes(sizesFilename, stats['sizes'])
+    writeHeavyHitters(hhFilename, stats['heavyhitters'])
+    assert_equal(premap.readRelationSizes(sizesFilename),
+                 [int(size[0]) for size in stats['sizes']])
+    hhinfo, hh = premap.readHeavyHitters(hhFilename, 6)
+    assert_equal(hh, [['_'], ['_'], ['_', '7'], ['_', '31'], ['_'], ['_']])
+
+
+def test_sampledIntervals():
+    stats = collectStatistics([inputFilename], schema, blockSize=2048,
+                              numberBlocks=100, seed=1)
+    assert stats['sampledTuples'] < len(lines) / 3
+    for relation, (estimate, low, high) in enumerate(stats['sizes'], 1):
+        size = sum(1 for line in lines if line.startswith('R%d ' % relation))
+        assert low <= size <= high
+    assert_equal([(attr, value) for attr, value, f, i
+                  in stats['heavyhitters']], [(2, 7), (3, 31)])
+    attr, value, fractions, intervals = stats['heavyhitters'][1]
+    assert intervals[2][0] <= 0.2 <= intervals[2][1]
@@ -0,0 +1,48 @@
+from nose.tools import *
+
+from skew.valueCodec import (PackedValueProtocol, escape, packedCodec,
+                             unescape)
+
+schema = [
+    [0, 1, 1, 0, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 0, 1, 1, 0]
+]
+
+
+def test_escapeRoundTrip():
+    data = ''.join(chr(i) for i in range(256)) + '\\n\\\t'
+    escaped = escape(data)
+    assert_false('\n' in escaped or '\r' in escaped or '\t' in escaped)
+    assert_equal(unescape(escaped), data)
+
+
+def test_packUnpack():
+    codec = packedCodec(schema)
+    value = codec.pack(2, ['_', '_', '21', '10', '_', '112312311'], rank=1)
+    assert_equal(len(value), 2 + 3 * 8)
+    result = codec.unpack(value)
+    expected_result = (2, ['_', '_', 21, 10, '_', 112312311])
+    assert_equal(result, expected_result)
+
+
+def test_protocolRoundTrip():
+    codec = packedCodec(schema, '32')
+    # 10 packs to a '\n' byte
+    value = codec.pack(1, ['_', '10', '13', '_', '_', '_'])
+    protocol = PackedValueProtocol()
+    line = protocol.write('_-_-_-_-_-_.0.1.1.0.0', value)
+    assert_false('\n' in line)
+    key, result = protocol.read(line)
+    assert_equal(key, '_-_-_-_-_-_.0.1.1.0.0')
+    assert_equal(codec.unpack(result), (1, ['_', 10, 13, '_', '_', '_']))
+
+
+def test_countValue():
+    codec = packedCodec(schema, '32')
+    value = codec.pack(1, ['_', '10', '13', '_', '_', '_'])
+    assert_equal(codec.countValue(value, 1), value)
+    counted = codec.countValue(value, 300)
+    assert_equal(codec.splitCount(counted), (value, 300))
+    assert_equal(codec.unpackCounted(counted),
+                 (1, (['_', 10, 13, '_', '_', '_'], 300)))